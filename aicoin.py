@@ -1,25 +1,58 @@
-"""AICoin Token & Ledger System."""
+"""AICoin Token & Ledger System.
+
+Transactions are grouped into one block per tick. A block header records
+the Merkle root of its transactions (see merkle.py) and the hash of the
+previous block, so the whole history hangs off the newest block hash and
+any single transaction can be proven part of its block with a short path
+of sibling hashes.
+"""
 
 import hashlib
-import time
-from typing import Dict, List
+import random
+import struct
+from typing import List, Optional, Union
 from collections import deque
 from dataclasses import dataclass
 
+import merkle
+from wallets import Wallets, to_aic, to_units
+
+# Canonical fixed-width encodings; the Merkle leaves are hashes of these
+# transaction records, and ledger.py stores exactly these bytes on disk.
+TX_RECORD = struct.Struct("<Qqqqd32s")        # seq, tick, from, to, amount, reason
+BLOCK_RECORD = struct.Struct("<QqQI4x32s32s")  # height, tick, first seq, count, prev hash, merkle root
+
+SYSTEM, TREASURY = -1, -2  # the non-citizen parties in a record
+_PARTY_CODES = {"system": SYSTEM, "treasury": TREASURY}
+_PARTY_NAMES = {v: k for k, v in _PARTY_CODES.items()}
+GENESIS = bytes(32)  # "previous hash" of the first block
+
 
 @dataclass
 class Transaction:
-    tx_from: str  # citizen_id or "system"
-    tx_to: str    # citizen_id or "treasury"
+    tx_from: Union[int, str]  # citizen_id or "system"
+    tx_to: Union[int, str]    # citizen_id or "treasury"
     amount: float
     reason: str
     timestamp: int  # game tick
-    prev_hash: str = ""
-    tx_hash: str = ""
+    tx_hash: str = ""  # Merkle leaf hash, set when its block is closed
+    seq: int = 0  # position in the ledger, counting from 0
+
+    def pack(self) -> bytes:
+        reason = self.reason.encode()
+        if len(reason) > 32:
+            raise ValueError(f"transaction reason longer than 32 bytes: {self.reason!r}")
+        return TX_RECORD.pack(self.seq, self.timestamp, _PARTY_CODES.get(self.tx_from, self.tx_from),
+                              _PARTY_CODES.get(self.tx_to, self.tx_to), self.amount, reason)
+
+    @classmethod
+    def unpack(cls, data, offset: int = 0) -> "Transaction":
+        seq, tick, tx_from, tx_to, amount, reason = TX_RECORD.unpack_from(data, offset)
+        return cls(tx_from=_PARTY_NAMES.get(tx_from, tx_from), tx_to=_PARTY_NAMES.get(tx_to, tx_to),
+                   amount=amount, reason=reason.rstrip(b"\0").decode(), timestamp=tick, seq=seq)
 
     def compute_hash(self) -> str:
-        data = f"{self.tx_from}:{self.tx_to}:{self.amount}:{self.reason}:{self.timestamp}:{self.prev_hash}"
-        return hashlib.sha256(data.encode()).hexdigest()[:16]
+        return merkle.leaf_hash(self.pack()).hex()
 
     def to_dict(self, citizen_manager=None) -> dict:
         from_name = self.tx_from
@@ -28,9 +61,13 @@ class Transaction:
             fc = citizen_manager.citizens.get(self.tx_from)
             if fc:
                 from_name = fc.name
+            elif isinstance(self.tx_from, int):
+                from_name = citizen_manager.public_id(self.tx_from)
             tc = citizen_manager.citizens.get(self.tx_to)
             if tc:
                 to_name = tc.name
+            elif isinstance(self.tx_to, int):
+                to_name = citizen_manager.public_id(self.tx_to)
         return {
             "from": from_name,
             "to": to_name,
@@ -38,92 +75,264 @@ class Transaction:
             "reason": self.reason,
             "tick": self.timestamp,
             "hash": self.tx_hash,
+            "seq": self.seq,
+        }
+
+
+@dataclass(frozen=True)
+class Block:
+    height: int
+    tick: int
+    first_seq: int
+    count: int
+    prev_hash: bytes
+    merkle_root: bytes
+
+    @property
+    def end(self) -> int:
+        """Seq just past this block's last transaction."""
+        return self.first_seq + self.count
+
+    def pack(self) -> bytes:
+        return BLOCK_RECORD.pack(self.height, self.tick, self.first_seq, self.count,
+                                 self.prev_hash, self.merkle_root)
+
+    @classmethod
+    def unpack(cls, data, offset: int = 0) -> "Block":
+        return cls(*BLOCK_RECORD.unpack_from(data, offset))
+
+    def digest(self) -> bytes:
+        return hashlib.sha256(self.pack()).digest()
+
+    def to_dict(self) -> dict:
+        return {
+            "height": self.height,
+            "tick": self.tick,
+            "firstSeq": self.first_seq,
+            "count": self.count,
+            "prevHash": self.prev_hash.hex(),
+            "merkleRoot": self.merkle_root.hex(),
+            "hash": self.digest().hex(),
         }
 
+    @classmethod
+    def from_dict(cls, d: dict) -> "Block":
+        return cls(d["height"], d["tick"], d["firstSeq"], d["count"],
+                   bytes.fromhex(d["prevHash"]), bytes.fromhex(d["merkleRoot"]))
+
 
 class TokenSystem:
-    def __init__(self):
-        self.wallets: Dict[str, float] = {}  # citizen_id → AIC balance
-        self.treasury: float = 10000.0  # server treasury
-        self.total_supply: float = 10000.0
-        self.ledger: deque = deque(maxlen=500)
-        self._last_hash: str = "genesis"
-        self.fee_rate: float = 0.01  # 1% transaction fee
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+        # Balances, server treasury and supply in integer units (see wallets.py); 1% transaction fee
+        self.wallets = Wallets(treasury=to_units(10000.0), supply=to_units(10000.0), fee_bps=100)
+        self.ledger: deque = deque(maxlen=500)  # newest first; the full history is in `archive`
+        self.blocks: deque = deque(maxlen=100)  # newest first
+        self.archive = None  # ledger.Ledger on disk, if attached
+        self.open_block: List[Transaction] = []  # recorded since the last block was closed
+        self.tx_count: int = 0
+        self.height: int = 0  # blocks closed so far
+        self._last_hash: bytes = GENESIS  # hash of the newest block
+
+    def attach(self, archive):
+        """Keep every closed block and its transactions in `archive` (a ledger.Ledger) from now on.
+
+        The archive must hold this run's history: after a restore it may run
+        ahead of the checkpoint (those records are dropped again), but it can
+        never be shorter or belong to another run.
+        """
+        closed = self.tx_count - len(self.open_block)
+        if archive.height > self.height:
+            if self.height == 0:
+                raise ValueError(f"{archive.directory} holds {archive.height} blocks of another run; "
+                                 "resume from its checkpoint or use an empty directory")
+            archive.truncate(closed, self.height)
+        elif archive.height < self.height:
+            raise ValueError(f"{archive.directory} holds {archive.height} blocks, the checkpoint {self.height}")
+        if len(archive) != closed:
+            raise ValueError(f"{archive.directory} holds {len(archive)} transactions, the checkpoint {closed}")
+        if self.height and archive.block(self.height - 1).digest() != self._last_hash:
+            raise ValueError(f"{archive.directory} does not continue this ledger's hash chain")
+        self.archive = archive
+
+    def close_block(self, tick: int) -> Optional[Block]:
+        """Seal the transactions recorded since the last block into a new block (once per tick).
+
+        Leaves are hashed in one pass and the Merkle tree is built once per
+        block; with an archive, the block and its records go to disk together.
+        """
+        txs = self.open_block
+        if not txs:
+            return None
+        self.open_block = []
+        records = [tx.pack() for tx in txs]
+        leaves = merkle.leaf_hashes(records)
+        for tx, leaf in zip(txs, leaves):
+            tx.tx_hash = leaf.hex()
+        block = Block(self.height, tick, txs[0].seq, len(txs), self._last_hash, merkle.root(leaves))
+        self._last_hash = block.digest()
+        self.height += 1
+        self.blocks.appendleft(block)
+        if self.archive is not None:
+            self.archive.append(records, block)
+        return block
+
+    def sync(self):
+        """Make the archive durable (before a checkpoint or shutdown).
+
+        The open block stays in memory; a checkpoint carries it along.
+        """
+        if self.archive is not None:
+            self.archive.sync()
+
+    @property
+    def treasury(self) -> float:
+        return to_aic(self.wallets.treasury)
+
+    @property
+    def total_supply(self) -> float:
+        return to_aic(self.wallets.supply)
+
+    @property
+    def fee_rate(self) -> float:
+        return self.wallets.fee_bps / 10000
 
     def init_wallets(self, citizen_manager):
         for cid in citizen_manager.citizens:
-            self.wallets[cid] = 100.0  # starting AIC
-            self.total_supply += 100.0
+            self.open_wallet(cid, 100.0)  # starting AIC
 
-    def _record(self, tx_from: str, tx_to: str, amount: float, reason: str, tick: int):
+    def open_wallet(self, citizen_id: int, amount: float = 0.0):
+        self.wallets.open(citizen_id, to_units(amount))
+
+    def _record(self, tx_from: Union[int, str], tx_to: Union[int, str], amount: float, reason: str, tick: int):
         tx = Transaction(
             tx_from=tx_from, tx_to=tx_to, amount=round(amount, 2),
-            reason=reason, timestamp=tick, prev_hash=self._last_hash,
+            reason=reason, timestamp=tick, seq=self.tx_count,
         )
-        tx.tx_hash = tx.compute_hash()
-        self._last_hash = tx.tx_hash
+        self.tx_count += 1
         self.ledger.appendleft(tx)
+        self.open_block.append(tx)
 
-    def transfer(self, from_id: str, to_id: str, amount: float, reason: str, tick: int) -> bool:
-        if from_id != "system" and self.wallets.get(from_id, 0) < amount:
-            return False
-        fee = round(amount * self.fee_rate, 2)
-        net = round(amount - fee, 2)
+    def _record_batch(self, tx_from: Union[int, str], to_ids: List[int], amount: float, reason: str, tick: int):
+        amount = round(amount, 2)
+        txs = [Transaction(tx_from, cid, amount, reason, tick, seq=seq)
+               for seq, cid in enumerate(to_ids, self.tx_count)]
+        self.tx_count += len(txs)
+        self.ledger.extendleft(txs)
+        self.open_block.extend(txs)
 
-        if from_id != "system":
-            self.wallets[from_id] = round(self.wallets.get(from_id, 0) - amount, 2)
-        else:
-            self.total_supply += amount
-
-        if to_id == "treasury":
-            self.treasury += net
-        else:
-            self.wallets[to_id] = round(self.wallets.get(to_id, 0) + net, 2)
-
-        self.treasury += fee
+    def transfer(self, from_id: Union[int, str], to_id: Union[int, str], amount: float, reason: str, tick: int) -> bool:
+        units = to_units(amount)
+        dst = None if to_id == "treasury" else to_id
+        if from_id == "system":
+            self.wallets.mint(dst, units)
+        elif not self.wallets.transfer(from_id, dst, units):
+            return False
         self._record(from_id, to_id, amount, reason, tick)
         return True
 
-    def reward(self, citizen_id: str, amount: float, reason: str, tick: int):
+    def reward(self, citizen_id: int, amount: float, reason: str, tick: int):
         """Mint new AIC as reward."""
         self.transfer("system", citizen_id, amount, reason, tick)
 
+    def reward_batch(self, citizen_ids: List[int], amount: float, reason: str, tick: int):
+        """Mint the same reward to every citizen in `citizen_ids`, in one wallet update."""
+        self.wallets.mint_batch(citizen_ids, to_units(amount))
+        self._record_batch("system", citizen_ids, amount, reason, tick)
+
+    def transfer_batch(self, from_ids: List[int], to_ids: List[Union[int, str]], amounts: List[float],
+                       reason: str, tick: int) -> List[bool]:
+        """`transfer` for each (from, to, amount) in order; which ones went through."""
+        done = self.wallets.transfer_batch(from_ids, [None if t == "treasury" else t for t in to_ids],
+                                           [to_units(a) for a in amounts])
+        for ok, src, dst, amount in zip(done, from_ids, to_ids, amounts):
+            if ok:
+                self._record(src, dst, amount, reason, tick)
+        return done
+
     def tick(self, world_time, citizen_manager, government, news_callback):
+        citizens = citizen_manager.citizens.values()
         # Daily work rewards (every game-day at hour 17)
         if world_time.hour == 17 and world_time.minute < 10:
-            for c in citizen_manager.citizens.values():
-                if c.employer:
-                    self.reward(c.id, 2.0, "労働報酬", world_time.tick)
-                # Ensure wallet exists for new citizens
-                if c.id not in self.wallets:
-                    self.wallets[c.id] = 0.0
+            self.reward_batch([c.id for c in citizens if c.employer], 2.0, "労働報酬", world_time.tick)
+            # Ensure wallet exists for new citizens
+            self.wallets.open_many(c.id for c in citizens)
 
         # Governance participation reward (voting-related, simplified)
         if world_time.tick % 100 == 0:
-            for pid in government.parliament_ids:
-                if pid in self.wallets:
-                    self.reward(pid, 5.0, "議会参加", world_time.tick)
+            self.reward_batch([pid for pid in government.parliament_ids if pid in self.wallets],
+                              5.0, "議会参加", world_time.tick)
 
         # Occasional business revenue → AIC
         if world_time.tick % 25 == 0:
-            from economy import Economy
-            for c in citizen_manager.citizens.values():
-                # Business owners get extra AIC
-                if c.role in ("商人", "シェフ") and random.random() < 0.3:
-                    self.reward(c.id, 3.0, "事業収益", world_time.tick)
+            # Business owners get extra AIC
+            self.reward_batch([c.id for c in citizens
+                               if c.role in ("商人", "シェフ") and self.rng.random() < 0.3],
+                              3.0, "事業収益", world_time.tick)
 
-    def get_balance(self, citizen_id: str) -> float:
-        return round(self.wallets.get(citizen_id, 0.0), 2)
+    def get_balance(self, citizen_id: int) -> float:
+        return to_aic(self.wallets.balance(citizen_id))
 
     def get_recent_transactions(self, limit: int = 50, citizen_manager=None) -> List[dict]:
         return [tx.to_dict(citizen_manager) for tx in list(self.ledger)[:limit]]
 
+    def get_transactions(self, limit: int = 50, before: Optional[int] = None,
+                         citizen_id: Optional[int] = None, citizen_manager=None) -> List[dict]:
+        """Newest transactions with seq < `before`, optionally only those of one citizen.
+
+        Served from the on-disk archive when there is one, otherwise from the
+        in-memory tail (so older pages come back empty).
+        """
+        if self.archive is not None:
+            # The open block is not on disk yet
+            txs = [tx for tx in reversed(self.open_block)
+                   if (before is None or tx.seq < before)
+                   and (citizen_id is None or citizen_id in (tx.tx_from, tx.tx_to))][:limit]
+            if len(txs) < limit:
+                if citizen_id is None:
+                    txs += self.archive.recent(limit - len(txs), before)
+                else:
+                    txs += self.archive.history(citizen_id, limit - len(txs), before)
+        else:
+            txs = [tx for tx in self.ledger
+                   if (before is None or tx.seq < before)
+                   and (citizen_id is None or citizen_id in (tx.tx_from, tx.tx_to))][:limit]
+        return [tx.to_dict(citizen_manager) for tx in txs]
+
+    def proof(self, seq: int, citizen_manager=None) -> Optional[dict]:
+        """Merkle inclusion proof for transaction `seq`.
+
+        None while its block is still open, or when neither the archive nor
+        the in-memory tail still holds the whole block.
+        """
+        if self.archive is not None and 0 <= seq < len(self.archive):
+            block = self.archive.block_of(seq)
+            records = self.archive.txs.records(block.first_seq, block.count)
+        else:
+            block = next((b for b in self.blocks if b.first_seq <= seq < b.end), None)
+            if block is None:
+                return None
+            txs = sorted((tx for tx in self.ledger if block.first_seq <= tx.seq < block.end),
+                         key=lambda tx: tx.seq)
+            if len(txs) != block.count:
+                return None
+            records = [tx.pack() for tx in txs]
+        leaves = merkle.leaf_hashes(records)
+        i = seq - block.first_seq
+        tx = Transaction.unpack(records[i])
+        tx.tx_hash = leaves[i].hex()
+        return {
+            "transaction": tx.to_dict(citizen_manager),
+            "block": block.to_dict(),
+            "proof": [{"left": left, "hash": h.hex()} for left, h in merkle.proof(leaves, i)],
+        }
+
     def to_dict(self, citizen_manager=None) -> dict:
         return {
+            "height": self.height,
+            "lastBlock": self._last_hash.hex(),
             "totalSupply": round(self.total_supply, 2),
             "treasury": round(self.treasury, 2),
             "recentTransactions": self.get_recent_transactions(10, citizen_manager),
         }
 
-
-import random  # needed for tick
@@ -0,0 +1,268 @@
+"""Audit — Verify that the on-disk AICoin ledger has not been tampered with.
+
+    python audit.py ledger/                # from the last trusted head
+    python audit.py ledger/ --full -j 8    # every block, in 8 processes
+
+The ledger is intact when every block's Merkle root matches its transaction
+records, every block names the hash of the block before it, and the blocks
+cover the transactions without gaps (see ledger.py). The blocks are cut
+into ranges of roughly equal transaction counts and checked in a process
+pool. Each range reports the hash its first block builds on and the hash of
+its last block, and the ranges are stitched together afterwards.
+
+After a clean audit, a trusted head is stored in <dir>/audit.heads every
+`every` blocks. A head records (height, transaction count, block hash) and
+is authenticated with an HMAC key kept in <dir>/audit.key (mode 0600). Every
+audit re-checks each stored head against its block, which costs one block
+read per head. Only the blocks after the newest head are re-hashed, unless
+`full` is set.
+"""
+
+import argparse
+import hashlib
+import hmac
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import merkle
+from aicoin import GENESIS
+from ledger import Ledger
+
+HEADS_FILE = "audit.heads"
+KEY_FILE = "audit.key"
+_HEAD = struct.Struct("<QQ32s32s")  # height, transaction count, block hash, HMAC-SHA256 of the rest
+_SIGNED = struct.Struct("<QQ32s")
+
+
+class Head(NamedTuple):
+    height: int  # blocks covered; `hash` is that of block `height - 1`
+    end: int     # transactions covered
+    hash: bytes
+    mac: bytes = b""
+
+
+@dataclass
+class AuditReport:
+    ok: bool
+    height: int
+    transactions: int
+    verified_from: int  # first block re-hashed by this audit
+    verified_blocks: int  # found intact; with an error, only those before `bad_height`
+    verified_transactions: int
+    head: str  # hash of the newest block
+    seconds: float
+    bad_height: Optional[int] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "height": self.height,
+            "transactions": self.transactions,
+            "verifiedFrom": self.verified_from,
+            "verifiedBlocks": self.verified_blocks,
+            "verifiedTransactions": self.verified_transactions,
+            "head": self.head,
+            "seconds": round(self.seconds, 3),
+            "badHeight": self.bad_height,
+            "error": self.error,
+        }
+
+
+# --- trusted heads ---
+
+def _key(directory: str) -> bytes:
+    path = os.path.join(directory, KEY_FILE)
+    if not os.path.exists(path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(32))
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _mac(key: bytes, head: Head) -> bytes:
+    return hmac.new(key, _SIGNED.pack(head.height, head.end, head.hash), hashlib.sha256).digest()
+
+
+def read_heads(directory: str) -> List[Head]:
+    path = os.path.join(directory, HEADS_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        data = f.read()
+    return [Head(*_HEAD.unpack_from(data, i)) for i in range(0, len(data) - _HEAD.size + 1, _HEAD.size)]
+
+
+def _store_heads(directory: str, heads: List[Head]):
+    with open(os.path.join(directory, HEADS_FILE), "ab") as f:
+        f.write(b"".join(_HEAD.pack(*h) for h in heads))
+
+
+def forget_heads(directory: str, height: int):
+    """Drop the trusted heads past `height` (the ledger is being cut back to it)."""
+    keep = [h for h in read_heads(directory) if h.height <= height]
+    path = os.path.join(directory, HEADS_FILE)
+    if os.path.exists(path):
+        os.truncate(path, len(keep) * _HEAD.size)
+
+
+# --- verification ---
+
+class _Range(NamedTuple):
+    lo: int
+    hi: int
+    prev: bytes       # hash block `lo` builds on
+    last: bytes       # hash of block `hi - 1`
+    first_seq: int
+    end: int
+    heads: Dict[int, Tuple[int, bytes]]  # height → (end, hash) at multiples of `every`
+    error: Optional[Tuple[int, str]]
+
+
+def _verify_range(directory: str, lo: int, hi: int, every: int) -> _Range:
+    """Check blocks lo..hi-1 on their own; runs in a pool process."""
+    ledger = Ledger(directory, readonly=True)
+    leaf_hashes, root = merkle.leaf_hashes, merkle.root
+    records = ledger.txs.records
+    prev = last = b""
+    first_seq = end = 0
+    heads = {}
+    try:
+        for height in range(lo, hi):
+            block = ledger.block(height)
+            if height == lo:
+                prev, first_seq, end = block.prev_hash, block.first_seq, block.first_seq
+            if block.height != height:
+                return _Range(lo, hi, prev, last, first_seq, end, heads, (height, "block has the wrong height"))
+            if height > lo and block.prev_hash != last:
+                return _Range(lo, hi, prev, last, first_seq, end, heads,
+                              (height, "block does not build on the previous block"))
+            if block.first_seq != end:
+                return _Range(lo, hi, prev, last, first_seq, end, heads,
+                              (height, "block leaves a gap in the transactions"))
+            if root(leaf_hashes(records(block.first_seq, block.count))) != block.merkle_root:
+                return _Range(lo, hi, prev, last, first_seq, end, heads,
+                              (height, "transactions do not match the block's Merkle root"))
+            last, end = block.digest(), block.end
+            if (height + 1) % every == 0:
+                heads[height + 1] = (end, last)
+    except IndexError:
+        return _Range(lo, hi, prev, last, first_seq, end, heads, (height, "block's transactions are missing"))
+    finally:
+        ledger.close()
+    return _Range(lo, hi, prev, last, first_seq, end, heads, None)
+
+
+def _split(ledger: Ledger, lo: int, hi: int, parts: int) -> List[Tuple[int, int]]:
+    """Cut blocks lo..hi-1 into up to `parts` ranges of about the same number of transactions."""
+    if lo >= hi:
+        return []
+    first, end = ledger.block(lo).first_seq, ledger.block(hi - 1).end
+    step = max(1, (end - first) // parts)
+    cuts = [lo]
+    for seq in range(first + step, end, step):
+        h = ledger.block_of(seq).height
+        if h > cuts[-1]:
+            cuts.append(h)
+    cuts.append(hi)
+    return list(zip(cuts, cuts[1:]))
+
+
+def audit(directory: str, full: bool = False, workers: Optional[int] = None, every: int = 1024) -> AuditReport:
+    """Verify the ledger in `directory` and record new trusted heads if it is intact."""
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    key = _key(directory)
+    ledger = Ledger(directory, readonly=True)
+    try:
+        height = ledger.height
+        total = ledger.block(height - 1).end if height else 0
+        head = ledger.block(height - 1).digest() if height else GENESIS
+        heads = read_heads(directory)
+        trusted = Head(0, 0, GENESIS)
+        error = None
+        for h in heads:
+            if not hmac.compare_digest(h.mac, _mac(key, h)):
+                error = (h.height - 1, "trusted head has a bad MAC")
+            elif h.height > height:
+                error = (height, "ledger is shorter than a trusted head")
+            else:
+                block = ledger.block(h.height - 1)
+                if block.digest() != h.hash or block.end != h.end:
+                    error = (h.height - 1, "block no longer matches its trusted head")
+            if error:
+                break
+            if not full:
+                trusted = h
+        ranges = [] if error else _split(ledger, trusted.height, height, workers * 4)
+    finally:
+        ledger.close()
+
+    args = [(directory, lo, hi, every) for lo, hi in ranges]
+    if workers > 1 and len(args) > 1:
+        # spawn, not fork: the engine thread may be running in this process
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_verify_range, *zip(*args)))
+    else:
+        results = [_verify_range(*a) for a in args]
+
+    # Blocks before `verified` (and transactions before `seq`) have been re-hashed and found intact
+    prev, seq, verified = trusted.hash, trusted.end, trusted.height
+    new_heads = {}
+    for r in results:
+        if error:
+            break
+        if r.prev != prev:
+            error = (r.lo, "block does not build on the previous block")
+        elif r.first_seq != seq:
+            error = (r.lo, "block leaves a gap in the transactions")
+        elif r.error:
+            error = r.error
+            if error[0] > r.lo:
+                seq, verified = r.end, error[0]
+        else:
+            prev, seq, verified = r.last, r.end, r.hi
+            new_heads.update(r.heads)
+
+    if error is None:
+        stored = heads[-1].height if heads else 0
+        fresh = [Head(h, end, digest) for h, (end, digest) in sorted(new_heads.items()) if h > stored]
+        _store_heads(directory, [h._replace(mac=_mac(key, h)) for h in fresh])
+
+    return AuditReport(
+        ok=error is None, height=height, transactions=total,
+        verified_from=trusted.height, verified_blocks=verified - trusted.height,
+        verified_transactions=seq - trusted.end, head=head.hex(),
+        seconds=time.perf_counter() - started,
+        bad_height=error[0] if error else None, error=error[1] if error else None,
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Verify the on-disk AICoin ledger.")
+    parser.add_argument("directory", help="ledger directory (AICITY_LEDGER / engine.py --ledger)")
+    parser.add_argument("--full", action="store_true", help="re-hash every block, not just those after the last trusted head")
+    parser.add_argument("-j", "--workers", type=int, help="processes to verify in (default: one per CPU)")
+    parser.add_argument("--every", type=int, default=1024, help="blocks between trusted heads")
+    args = parser.parse_args(argv)
+
+    report = audit(args.directory, args.full, args.workers, args.every)
+    print(f"{report.height} blocks, {report.transactions} transactions; "
+          f"verified {report.verified_blocks} blocks / {report.verified_transactions} transactions "
+          f"from height {report.verified_from} in {report.seconds:.2f}s")
+    if not report.ok:
+        print(f"TAMPERED at block {report.bad_height}: {report.error}", file=sys.stderr)
+        return 1
+    print(f"OK, head {report.head}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
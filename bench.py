@@ -0,0 +1,247 @@
+"""Benchmarks — time each hot path of the tick across population sizes.
+
+Usage:
+    python bench.py                                   # 30, 1k, 10k, 100k
+    python bench.py --sizes 30,1000 --out before.json
+    python bench.py --sizes 30,1000 --compare before.json
+    python bench.py --sizes 100000 --memory           # bytes per citizen
+    python bench.py --sizes 1000,10000 --wire         # JSON vs msgpack state encoding
+
+Results are written as JSON so runs from different commits can be compared.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Callable, Dict
+
+from citizen import CitizenManager
+from population import generate_population
+from simulation import Simulation
+import wire
+
+DEFAULT_SIZES = (30, 1000, 10000, 100000)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def _clock(sim: Simulation) -> SimpleNamespace:
+    """A world time at which every periodic branch of every subsystem fires."""
+    tick = (sim.time.tick // 100 + 1) * 100
+    return SimpleNamespace(tick=tick, hour=17, minute=0, day=sim.time.day)
+
+
+def _state_json(sim: Simulation) -> int:
+    return len(json.dumps(sim.get_state(), ensure_ascii=False))
+
+
+HOT_PATHS: Dict[str, Callable[[Simulation], object]] = {
+    "update_movement": lambda sim: sim.citizens.update_movement(9),
+    "update_needs": lambda sim: sim.citizens.update_needs(),
+    "generate_conversations": lambda sim: sim.citizens.generate_conversations(),
+    "relationships.tick": lambda sim: sim.relationships.tick(_clock(sim), sim.citizens, sim.crime, sim._add_news),
+    "crime.tick": lambda sim: sim.crime.tick(_clock(sim), sim.citizens, sim._add_news),
+    "lifecycle.tick": lambda sim: sim.lifecycle.tick(_clock(sim), sim.citizens, sim.relationships, sim._add_news),
+    "token.tick": lambda sim: sim.token.tick(_clock(sim), sim.citizens, sim.government, sim._add_news),
+    "get_state+json": _state_json,
+}
+
+
+def build_world(size: int, seed: int, warmup: int, array_store: bool = False) -> Simulation:
+    sim = Simulation(seed=seed, population=None if size == 30 else size, array_store=array_store)
+    # Spread citizens over their morning destinations, some still in transit
+    for _ in range(warmup):
+        sim.citizens.update_movement(9)
+    return sim
+
+
+def measure_memory(size: int, seed: int) -> float:
+    """Bytes allocated per citizen by the citizen manager (objects, ids, names, index)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        populate = size == 30
+        cm = CitizenManager(random.Random(seed), random.Random(seed + 1), populate=populate)
+        if not populate:
+            generate_population(cm, size, random.Random(seed + 2))
+        gc.collect()
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return allocated / max(len(cm.citizens), 1)
+
+
+WIRE_FORMATS: Dict[str, Callable[[dict], object]] = {
+    "json": lambda state: json.dumps(state, ensure_ascii=False).encode("utf-8"),
+    "msgpack": lambda state: wire.pack(state),
+    "msgpack+table": wire.pack_state,
+}
+
+
+def measure_wire(sim: Simulation, repeat: int) -> Dict[str, dict]:
+    """Encoding time and payload size of one full state in each wire format."""
+    state = sim.get_state()
+    result = {}
+    for name, encode in WIRE_FORMATS.items():
+        if name != "json" and not wire.available():
+            continue
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            payload = encode(state)
+            runs.append(time.perf_counter() - start)
+        result[name] = {"median": statistics.median(runs), "bytes": len(payload)}
+    return result
+
+
+def _alarm(signum, frame):
+    raise BudgetExceeded()
+
+
+def time_call(fn: Callable[[], object], budget: float) -> float:
+    """Wall time of one call; raises BudgetExceeded if it runs past `budget` seconds."""
+    use_alarm = budget > 0 and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def run(sizes, repeat: int, seed: int, warmup: int, budget: float, log=print,
+        array_store: bool = False, memory: bool = False, wire_formats: bool = False) -> dict:
+    results: Dict[str, dict] = {}
+    over_budget = set()
+    for size in sizes:
+        if memory:
+            per_citizen = measure_memory(size, seed)
+            log(f"[{size}] {'bytes/citizen':<24} {per_citizen:10.0f}")
+        start = time.perf_counter()
+        sim = build_world(size, seed, warmup, array_store)
+        entry = {"build_seconds": time.perf_counter() - start, "paths": {}}
+        if memory:
+            entry["bytes_per_citizen"] = per_citizen
+        log(f"[{size}] world built in {entry['build_seconds']:.2f}s")
+        if wire_formats:
+            entry["wire"] = measure_wire(sim, repeat)
+            for name, m in entry["wire"].items():
+                log(f"[{size}] {'encode ' + name:<24} {m['median'] * 1000:10.3f} ms {m['bytes']:>12,d} bytes")
+        for name, path in HOT_PATHS.items():
+            if name in over_budget:
+                entry["paths"][name] = {"skipped": True}
+                continue
+            runs = []
+            try:
+                for _ in range(repeat):
+                    runs.append(time_call(lambda: path(sim), budget))
+            except BudgetExceeded:
+                over_budget.add(name)
+                entry["paths"][name] = {"skipped": True, "over_budget": budget}
+                log(f"[{size}] {name:<24} over budget ({budget:.0f}s), skipped from here on")
+                # The interrupted call may have left the world half-updated
+                sim = build_world(size, seed, warmup, array_store)
+                continue
+            entry["paths"][name] = {
+                "min": min(runs),
+                "median": statistics.median(runs),
+                "mean": statistics.fmean(runs),
+                "runs": len(runs),
+            }
+            log(f"[{size}] {name:<24} {statistics.median(runs) * 1000:10.3f} ms")
+        results[str(size)] = entry
+    return {"meta": _meta(seed, repeat, warmup, array_store), "results": results}
+
+
+def _meta(seed: int, repeat: int, warmup: int, array_store: bool) -> dict:
+    commit = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeat": repeat,
+        "warmup": warmup,
+        "array_store": array_store,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(base: dict, head: dict) -> str:
+    """Side-by-side medians; ratio < 1 means `head` is faster."""
+    lines = [f"{'size':>7}  {'path':<24}{'base ms':>12}{'head ms':>12}{'ratio':>8}"]
+    for size, entry in head["results"].items():
+        base_entry = base["results"].get(size, {})
+        if "bytes_per_citizen" in entry and "bytes_per_citizen" in base_entry:
+            b, h = base_entry["bytes_per_citizen"], entry["bytes_per_citizen"]
+            lines.append(f"{size:>7}  {'bytes/citizen':<24}{b:12.0f}{h:12.0f}{h / b:8.2f}")
+        for name, m in entry.get("wire", {}).items():
+            b = base_entry.get("wire", {}).get(name)
+            if b:
+                lines.append(f"{size:>7}  {'encode ' + name:<24}{b['median'] * 1000:12.3f}"
+                             f"{m['median'] * 1000:12.3f}{m['median'] / b['median']:8.2f}")
+        base_paths = base_entry.get("paths", {})
+        for name, m in entry["paths"].items():
+            b = base_paths.get(name, {})
+            if "median" not in m or "median" not in b:
+                continue
+            ratio = m["median"] / b["median"] if b["median"] else float("inf")
+            lines.append(f"{size:>7}  {name:<24}{b['median'] * 1000:12.3f}{m['median'] * 1000:12.3f}{ratio:8.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="AICity scaling benchmarks.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated population sizes (30 = the hand-written city)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per hot path")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--warmup", type=int, default=20, help="movement steps before timing")
+    parser.add_argument("--budget", type=float, default=30.0,
+                        help="seconds one call may take before the path is dropped for larger sizes (0 = no limit)")
+    parser.add_argument("--array-store", action="store_true", help="benchmark the numpy citizen store")
+    parser.add_argument("--memory", action="store_true", help="also measure bytes per citizen")
+    parser.add_argument("--wire", action="store_true", help="also compare JSON and msgpack state encoding")
+    parser.add_argument("--out", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    log = lambda msg: print(msg, file=sys.stderr)
+    report = run(sizes, args.repeat, args.seed, args.warmup, args.budget, log, args.array_store, args.memory,
+                 args.wire)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(json.load(f), report), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
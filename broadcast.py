@@ -0,0 +1,306 @@
+"""Broadcast — Build the world state once per tick and fan it out to every viewer."""
+
+import asyncio
+import json
+import time
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple, Union
+
+import protocol
+import wire
+from simulation import TOPICS
+
+GRID_CELL = 50.0  # map units per viewport grid cell
+
+Viewport = Tuple[float, float, float, float]  # x0, y0, x1, y1
+
+
+class Frame:
+    """One published tick. Each wire encoding is produced at most once and shared by all viewers."""
+
+    def __init__(self, seq: int, state: dict, delta: dict, citizens: Dict[str, dict], profiler):
+        self.seq = seq
+        self.state = state
+        self.delta_msg = delta
+        self.citizens = citizens  # public id → citizen dict
+        self._profiler = profiler
+        self._encoded: Dict[Tuple[str, bool], Union[str, bytes]] = {}
+        self._updates: Optional[Dict[str, dict]] = None
+        self._grid: Optional[Dict[Tuple[int, int], List[dict]]] = None
+
+    def encoded(self, kind: str, binary: bool = False) -> Union[str, bytes]:
+        """This frame as a "full" state (protocol 1), "keyframe" or "delta", in JSON or msgpack."""
+        out = self._encoded.get((kind, binary))
+        if out is None:
+            start = time.perf_counter()
+            if kind == "keyframe":
+                full = self.encoded("full", binary)
+                out = wire.pack_keyframe(self.seq, full) if binary else protocol.keyframe(self.seq, full)
+            elif kind == "full":
+                out = wire.pack_state(self.state) if binary else json.dumps(self.state, ensure_ascii=False)
+                self._profiler.lap("ws_encode_msgpack" if binary else "ws_encode", start)
+            else:
+                out = wire.pack(self.delta_msg) if binary else protocol.encode(self.delta_msg)
+                self._profiler.lap("ws_encode_delta_msgpack" if binary else "ws_encode_delta", start)
+            self._encoded[(kind, binary)] = out
+        return out
+
+    @property
+    def updates(self) -> Dict[str, dict]:
+        """Citizen patches of this frame's delta by public id."""
+        if self._updates is None:
+            self._updates = {u["id"]: u for u in self.delta_msg["citizens"]["upd"]}
+        return self._updates
+
+    def in_viewport(self, viewport: Viewport) -> List[dict]:
+        """Citizens inside `viewport`, found through a coarse grid built once per frame."""
+        if self._grid is None:
+            self._grid = {}
+            for c in self.citizens.values():
+                cell = (int(c["x"] // GRID_CELL), int(c["y"] // GRID_CELL))
+                self._grid.setdefault(cell, []).append(c)
+        x0, y0, x1, y1 = viewport
+        found = []
+        for gx in range(int(x0 // GRID_CELL), int(x1 // GRID_CELL) + 1):
+            for gy in range(int(y0 // GRID_CELL), int(y1 // GRID_CELL) + 1):
+                for c in self._grid.get((gx, gy), ()):
+                    if x0 <= c["x"] <= x1 and y0 <= c["y"] <= y1:
+                        found.append(c)
+        return found
+
+
+class Selection:
+    """What one viewer subscribed to: topics, plus a viewport and/or citizens (both None: all)."""
+
+    def __init__(self, topics=None, viewport=None, citizens=None):
+        self.topics: FrozenSet[str] = frozenset(TOPICS) if topics is None else frozenset(topics) & frozenset(TOPICS)
+        self.viewport: Optional[Viewport] = tuple(float(v) for v in viewport) if viewport is not None else None
+        self.watch: Optional[FrozenSet[str]] = frozenset(citizens) if citizens is not None else None  # public ids
+
+    @property
+    def filtered(self) -> bool:
+        return len(self.topics) < len(TOPICS) or self.viewport is not None or self.watch is not None
+
+    @property
+    def all_citizens(self) -> bool:
+        return "citizens" in self.topics and self.viewport is None and self.watch is None
+
+    def wants(self, c) -> bool:
+        """Whether live citizen `c` falls inside this viewer's selection."""
+        if self.viewport is not None:
+            x0, y0, x1, y1 = self.viewport
+            if x0 <= c.x <= x1 and y0 <= c.y <= y1:
+                return True
+        return self.watch is not None and c.uid in self.watch
+
+    def to_dict(self) -> dict:
+        """JSON form; `Selection(**d)` reads it back (see shared.py)."""
+        return {
+            "topics": sorted(self.topics),
+            "viewport": list(self.viewport) if self.viewport is not None else None,
+            "citizens": sorted(self.watch) if self.watch is not None else None,
+        }
+
+
+def select(selections, citizens):
+    """Topics and citizens needed by at least one of `selections` (None: every citizen)."""
+    topics = set()
+    for sel in selections:
+        topics |= sel.topics
+    if "citizens" not in topics or any(sel.all_citizens for sel in selections):
+        return topics, None
+    narrowed = [sel for sel in selections if "citizens" in sel.topics]
+    return topics, [c for c in citizens if any(sel.wants(c) for sel in narrowed)]
+
+
+class Subscriber(Selection):
+    """One viewer's outgoing queue and subscription.
+
+    The queue is bounded: a client that cannot keep up loses its oldest
+    pending frames instead of holding back everyone else or growing without
+    limit. Protocol 1 frames are complete states, so only the newest one
+    matters; protocol 2 viewers notice the gap in sequence numbers and are
+    sent a keyframe.
+
+    Unfiltered viewers share the frame's encodings. A viewer subscribed to
+    some topics, a viewport or a set of citizens gets its own slice, whose
+    size depends on what it selected rather than on the size of the city.
+    """
+
+    def __init__(self, version: int = 1, maxsize: int = 2, binary: bool = False):
+        super().__init__()
+        self.version = version
+        self.binary = binary  # msgpack instead of JSON
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.last_seq: Optional[int] = None  # last frame this viewer was sent (protocol 2)
+        self.offered_seq: Optional[int] = None
+        self.visible: Set[str] = set()  # citizens this viewer currently has (protocol 2)
+
+    def subscribe(self, topics=None, viewport=None, citizens=None):
+        Selection.__init__(self, topics, viewport, citizens)
+        self.resync()
+
+    def offer(self, frame: Frame):
+        if self.version >= 2 and frame.seq == self.offered_seq:
+            return  # deltas are only meaningful once per frame
+        self.offered_seq = frame.seq
+        while self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+    def resync(self):
+        """Send a keyframe next (the client lost track of the delta chain)."""
+        self.last_seq = None
+        self.offered_seq = None
+
+    async def get(self) -> Union[str, bytes]:
+        while True:
+            frame = await self.queue.get()
+            if self.version < 2:
+                if not self.filtered:
+                    return frame.encoded("full", self.binary)
+                return self._encode_state(self._slice(frame))
+            if self.last_seq is not None and frame.seq <= self.last_seq:
+                continue  # already sent
+            in_order = self.last_seq is not None and frame.seq == self.last_seq + 1
+            self.last_seq = frame.seq
+            if not self.filtered:
+                return frame.encoded("delta" if in_order else "keyframe", self.binary)
+            if in_order:
+                msg = self._slice_delta(frame)
+                return wire.pack(msg) if self.binary else protocol.encode(msg)
+            state = self._encode_state(self._slice(frame))
+            return wire.pack_keyframe(frame.seq, state) if self.binary else protocol.keyframe(frame.seq, state)
+
+    def _encode_state(self, state: dict) -> Union[str, bytes]:
+        return wire.pack_state(state) if self.binary else protocol.encode(state)
+
+    # --- slices ---
+
+    @property
+    def hidden(self) -> set:
+        """State keys of the topics this viewer did not subscribe to."""
+        return protocol.topic_keys(set(TOPICS) - self.topics)
+
+    def _selected(self, frame: Frame) -> Dict[str, dict]:
+        if "citizens" not in self.topics:
+            return {}
+        if self.all_citizens:
+            return frame.citizens
+        selected = {}
+        if self.viewport is not None:
+            selected = {c["id"]: c for c in frame.in_viewport(self.viewport)}
+        if self.watch is not None:
+            for uid in self.watch:
+                c = frame.citizens.get(uid)
+                if c is not None:
+                    selected[uid] = c
+        return selected
+
+    def _slice(self, frame: Frame) -> dict:
+        selected = self._selected(frame)
+        self.visible = set(selected)
+        return protocol.slice_state(frame.state, self.hidden, list(selected.values()))
+
+    def _slice_delta(self, frame: Frame) -> dict:
+        selected = self._selected(frame)
+        updates = frame.updates
+        upd = []
+        for uid, c in selected.items():
+            if uid not in self.visible:
+                upd.append(c)  # entered the selection: send in full
+            elif uid in updates:
+                upd.append(updates[uid])
+        removed = [uid for uid in self.visible if uid not in selected]
+        self.visible = set(selected)
+
+        msg = frame.delta_msg
+        hidden = self.hidden
+        patch = {k: v for k, v in msg["patch"].items() if k not in hidden}
+        if "$del" in patch:
+            patch["$del"] = [k for k in patch["$del"] if k not in hidden]
+        return dict(msg, citizens={"upd": upd, "del": removed}, patch=patch)
+
+
+class BroadcastHub:
+    """Builds the world state once per broadcast and pushes the same frame to all subscribers.
+
+    Serialization cost depends only on the size of the city, not on how many
+    clients are watching; each WebSocket drains its own `Subscriber` queue.
+    Only the topics and citizens some viewer subscribed to are built at all.
+
+    Frames are built and encoded on the engine thread (`on_tick`) and handed
+    to the event loop, which only moves them into subscriber queues.
+    """
+
+    def __init__(self, sim, every: int = 2, queue_size: int = 2):
+        self.sim = sim
+        self.every = every  # ticks between broadcasts
+        self.queue_size = queue_size
+        self.subscribers: Set[Subscriber] = set()
+        self.encoder = protocol.DeltaEncoder()
+        self.latest: Optional[Frame] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # set at startup
+        self._last_tick: Optional[int] = None
+
+    # --- event loop side ---
+
+    def subscribe(self, version: int = 1, binary: bool = False) -> Subscriber:
+        sub = Subscriber(version, self.queue_size, binary)
+        self.subscribers.add(sub)
+        if self.latest is not None:
+            sub.offer(self.latest)  # new viewers don't wait for the next broadcast
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self.subscribers.discard(sub)
+
+    def resync(self, sub: Subscriber):
+        sub.resync()
+        if self.latest is not None:
+            sub.offer(self.latest)
+
+    def change_subscription(self, sub: Subscriber, topics=None, viewport=None, citizens=None):
+        """Narrow or widen what `sub` receives; it gets a fresh keyframe.
+
+        Citizens or topics that the current frame was built without arrive
+        with the next broadcast.
+        """
+        sub.subscribe(topics, viewport, citizens)
+        if self.latest is not None:
+            sub.offer(self.latest)
+
+    def _deliver(self, frame: Frame):
+        for sub in list(self.subscribers):
+            sub.offer(frame)
+
+    # --- engine side ---
+
+    def build(self, subscribers) -> Frame:
+        topics, citizens = select(subscribers, self.sim.citizens.citizens.values())
+        state = self.sim.get_state(topics, citizens)
+        start = time.perf_counter()
+        delta = self.encoder.update(state)
+        self.sim.profiler.lap("ws_diff", start)
+        frame = Frame(self.encoder.seq, state, delta, self.encoder.citizens, self.sim.profiler)
+        # Encode what unfiltered viewers share here rather than on the event loop
+        for sub in subscribers:
+            if not sub.filtered:
+                frame.encoded("full" if sub.version < 2 else "delta", sub.binary)
+        return frame
+
+    def on_tick(self):
+        """Called on the engine thread after each tick; broadcasts every `every` ticks."""
+        tick = self.sim.time.tick
+        subscribers = tuple(self.subscribers)
+        if not subscribers or self.loop is None:
+            return
+        if self._last_tick is not None and tick - self._last_tick < self.every:
+            return
+        self._last_tick = tick
+        self.latest = frame = self.build(subscribers)
+        try:
+            self.loop.call_soon_threadsafe(self._deliver, frame)
+        except RuntimeError:  # the web loop has shut down
+            pass
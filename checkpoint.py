@@ -0,0 +1,469 @@
+"""Checkpoint — Save the whole world to a compact binary file and load it back.
+
+    python engine.py --snapshot /dev/shm/aicity.snap --checkpoint city.ckpt
+    AICITY_CHECKPOINT=city.ckpt python main.py
+
+File format (little-endian):
+
+    "AICKPT\\0\\0", format version u16, flags u16 (bit 0: zlib), section count u32
+    per section: name length u16, name, payload length u64, payload
+    CRC-32 of everything before it u32
+
+The large tables (citizens, public ids, relationship scores, businesses,
+wallets, ...) are stored column by column as packed arrays, strings as a
+per-column table plus u32 codes. The many small, irregular pieces of state
+(time, laws, recent crimes, the ledger tail, random stream states) go into
+one JSON "meta" section. A file that is cut short or fails its checksum is
+rejected as a whole rather than restored in part.
+
+`capture` runs on the engine thread between ticks and only copies state
+into those columns; compressing and writing the file happen on a background
+thread (see `Checkpointer`). With an on-disk ledger (ledger.py) a
+checkpoint also records how many blocks and transactions it covers; any
+written after it are dropped again when the checkpoint is restored. A
+seeded city restored from a checkpoint goes on exactly as if it had never
+stopped (with the default citizen store).
+"""
+
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import defaultdict, deque
+from dataclasses import asdict, fields
+from itertools import chain
+from operator import attrgetter
+from typing import Dict, List, Optional
+
+from aicoin import Block, Transaction
+from citizen import Citizen, Personality, TRAITS
+from crime import Crime
+from economy import Business
+from government import Law
+from relationships import TieLimits
+from wallets import Wallets
+
+MAGIC = b"AICKPT\0\0"
+FORMAT_VERSION = 5
+FLAG_ZLIB = 1
+_HEAD = struct.Struct("<8sHHI")
+_NAME = struct.Struct("<H")
+_LEN = struct.Struct("<Q")
+_U32 = struct.Struct("<I")
+
+# Citizen fields by column type (`id`, `uid` and `personality` are handled separately)
+_INT_FIELDS = ("age", "money", "health", "happiness", "hunger", "salary", "_speak_timer")
+_FLOAT_FIELDS = ("x", "y", "target_x", "target_y")
+_ID_FIELDS = ("spouse_id", "speaking_to")  # 0 = None; internal ids start at 1
+_STR_FIELDS = ("name", "gender", "role", "home", "location", "target_location",
+               "employer", "action", "speaking", "api_key")
+_TUPLE_FIELDS = ("children_ids", "parent_ids")
+# Constructor order, so restored citizens can be built from positional rows
+_CITIZEN_ARGS = [f.name for f in fields(Citizen) if f.init and not f.name.startswith("_index")]
+
+
+# --- columns ---
+
+def _pack(typecode: str, values) -> bytes:
+    a = array(typecode, values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _unpack(typecode: str, data) -> array:
+    a = array(typecode)
+    a.frombytes(data)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+def _pack_strings(values) -> bytes:
+    """Distinct values as JSON (None allowed), then one u32 code per value."""
+    values = list(values)
+    table = {v: i for i, v in enumerate(dict.fromkeys(values))}
+    head = json.dumps(list(table), ensure_ascii=False).encode()
+    return _U32.pack(len(head)) + head + _pack("I", map(table.__getitem__, values))
+
+
+def _unpack_strings(data) -> list:
+    (n,) = _U32.unpack_from(data, 0)
+    table = json.loads(bytes(data[4:4 + n]))
+    return [table[i] for i in _unpack("I", data[4 + n:])]
+
+
+def _pack_lists(lists) -> bytes:
+    """Lists of ints as a count per list followed by all values."""
+    lists = list(lists)
+    return (_U32.pack(len(lists)) + _pack("I", map(len, lists))
+            + _pack("I", chain.from_iterable(lists)))
+
+
+def _unpack_lists(data) -> List[tuple]:
+    (n,) = _U32.unpack_from(data, 0)
+    counts = _unpack("I", data[4:4 + 4 * n])
+    flat = _unpack("I", data[4 + 4 * n:])
+    out, pos = [], 0
+    for k in counts:
+        out.append(tuple(flat[pos:pos + k]))
+        pos += k
+    return out
+
+
+def _pack_uids(uids: List[Optional[str]]) -> bytes:
+    return b"".join(bytes.fromhex(u.replace("-", "")) if u else bytes(16) for u in uids)
+
+
+def _unpack_uids(data) -> List[Optional[str]]:
+    uids: List[Optional[str]] = []
+    for i in range(0, len(data), 16):
+        h = bytes(data[i:i + 16]).hex()
+        uids.append(f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}" if int(h, 16) else None)
+    return uids
+
+
+# --- capture ---
+
+def _rng_state(rng) -> list:
+    version, internal, gauss = rng.getstate()
+    return [version, list(internal), gauss]
+
+
+def capture(sim) -> Dict[str, bytes]:
+    """Copy the whole world into checkpoint sections; call between ticks."""
+    cm = sim.citizens
+    citizens = list(cm.citizens.values())
+    s: Dict[str, bytes] = {}
+
+    s["citizen.id"] = _pack("I", map(attrgetter("id"), citizens))
+    for name in _INT_FIELDS:
+        s["citizen." + name] = _pack("q", map(attrgetter(name), citizens))
+    for name in _FLOAT_FIELDS:
+        s["citizen." + name] = _pack("d", map(attrgetter(name), citizens))
+    for name in _ID_FIELDS:
+        s["citizen." + name] = _pack("I", (v or 0 for v in map(attrgetter(name), citizens)))
+    for name in _STR_FIELDS:
+        s["citizen." + name] = _pack_strings(map(attrgetter(name), citizens))
+    for name in _TUPLE_FIELDS:
+        s["citizen." + name] = _pack_lists(map(attrgetter(name), citizens))
+    s["citizen.is_external"] = _pack("B", map(attrgetter("is_external"), citizens))
+    s["citizen.personality"] = _pack("d", chain.from_iterable(map(attrgetter("personality"), citizens)))
+    s["citizen.uids"] = _pack_uids(cm.uids)
+    for table, buckets in cm.index.buckets().items():
+        s["index." + table + ".keys"] = json.dumps(list(buckets), ensure_ascii=False).encode()
+        s["index." + table] = _pack_lists(buckets.values())
+
+    rel = sim.relationships
+    s["rel.keys"] = _pack("Q", rel.scores.keys())
+    s["rel.scores"] = _pack("b", rel.scores.values())
+    s["rel.type_keys"] = _pack("Q", rel.types.keys())
+    s["rel.types"] = _pack_strings(rel.types.values())
+    s["rel.known_ids"] = _pack("I", rel.known_crimes.keys())
+    s["rel.known"] = _pack_lists(rel.known_crimes.values())
+    grudges = [(victim, perp, reason) for victim, held in rel.grudges.items()
+               for perp, reason in held.items()]
+    s["rel.grudge_victims"] = _pack("I", (g[0] for g in grudges))
+    s["rel.grudge_targets"] = _pack("I", (g[1] for g in grudges))
+    s["rel.grudge_reasons"] = _pack_strings(g[2] for g in grudges)
+
+    crime = sim.crime
+    s["crime.imprisoned_ids"] = _pack("I", crime.imprisoned.keys())
+    s["crime.imprisoned_until"] = _pack("q", crime.imprisoned.values())
+    s["crime.record_ids"] = _pack("I", crime.criminal_records.keys())
+    s["crime.records"] = _pack_lists(crime.criminal_records.values())
+    s["crime.uids"] = _pack_uids(crime.uids)
+
+    businesses = sim.economy.businesses
+    for name in ("name", "type", "owner_name"):
+        s["business." + name] = _pack_strings(map(attrgetter(name), businesses))
+    s["business.owner_id"] = _pack("I", (v or 0 for v in map(attrgetter("owner_id"), businesses)))
+    s["business.revenue"] = _pack("q", map(attrgetter("revenue"), businesses))
+    s["business.base_salary"] = _pack("q", map(attrgetter("base_salary"), businesses))
+    s["business.employee_ids"] = _pack_lists(map(attrgetter("employee_ids"), businesses))
+
+    token = sim.token
+    s["token.balances"] = _pack("q", token.wallets.balances)
+    s["token.opened"] = bytes(token.wallets.opened)
+
+    t, gov, econ, life = sim.time, sim.government, sim.economy, sim.lifecycle
+    store = cm.store
+    meta = {
+        "seed": sim.streams.seed,
+        "arrayStore": store is not None,
+        "tieLimits": asdict(sim.relationships.limits) if sim.relationships.limits else None,
+        "rng": {name: _rng_state(rng) for name, rng in sim.streams._streams.items()},
+        "npRng": store.np_rng.bit_generator.state if store is not None else None,
+        "time": {"tick": t.tick, "minute": t.minute, "hour": t.hour, "day": t.day, "year": t.year,
+                 "weather": t._weather, "weatherChangeTick": t._weather_change_tick},
+        "news": list(sim.news),
+        "eventLog": list(sim.event_log),
+        "newsId": sim._news_id,
+        "conversations": cm.conversations,
+        "government": {
+            "laws": [asdict(l) for l in gov.laws],
+            "activeBill": asdict(gov.active_bill) if gov.active_bill else None,
+            "parliamentIds": gov.parliament_ids,
+            "primeMinisterId": gov.prime_minister_id,
+            "treasury": gov.treasury,
+            "electionDay": gov.election_day,
+            "nextProposalTick": gov.next_proposal_tick,
+            "voteTick": gov._vote_tick,
+            "usedLaws": sorted(gov._used_laws),
+        },
+        "economy": {
+            "prices": econ.prices,
+            "gdp": econ.gdp,
+            "unemployment": econ.unemployment,
+            "inflation": econ.inflation,
+            "taxRate": econ.tax_rate,
+            "prevPrices": econ._prev_prices,
+            "dailyRevenue": econ._daily_revenue,
+        },
+        "crime": {"crimes": [asdict(c) for c in crime.crimes]},
+        "gossip": sim.relationships.gossip.to_state(),
+        "lifecycle": {
+            "dead": life.dead_citizens,
+            "marriagesToday": life.marriages_today,
+            "birthsToday": life.births_today,
+            "lastAgeDay": life._last_age_day,
+        },
+        "token": {
+            "treasury": token.wallets.treasury,
+            "supply": token.wallets.supply,
+            "feeBps": token.wallets.fee_bps,
+            "lastHash": token._last_hash.hex(),
+            "height": token.height,
+            "txCount": token.tx_count,
+            "ledger": [asdict(tx) for tx in token.ledger],
+            "blocks": [b.to_dict() for b in token.blocks],
+            "openBlock": [asdict(tx) for tx in token.open_block],
+        },
+    }
+    s["meta"] = json.dumps(meta, ensure_ascii=False).encode()
+    return s
+
+
+# --- file ---
+
+def write(path: str, sections: Dict[str, bytes], compress: bool = True):
+    """Write sections to `path` atomically (a crash leaves the previous checkpoint)."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        head = _HEAD.pack(MAGIC, FORMAT_VERSION, FLAG_ZLIB if compress else 0, len(sections))
+        f.write(head)
+        crc = zlib.crc32(head)
+        for name, payload in sections.items():
+            if compress:
+                payload = zlib.compress(payload, 1)
+            n = name.encode()
+            entry = _NAME.pack(len(n)) + n + _LEN.pack(len(payload))
+            f.write(entry)
+            f.write(payload)
+            crc = zlib.crc32(payload, zlib.crc32(entry, crc))
+        f.write(_U32.pack(crc))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read(path: str) -> Dict[str, bytes]:
+    """Sections of the checkpoint at `path`; ValueError unless it is complete and intact."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEAD.size + _U32.size:
+        raise ValueError(f"{path} is truncated")
+    magic, version, flags, n = _HEAD.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not an AICity checkpoint")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} has checkpoint format {version}; this build reads format {FORMAT_VERSION}")
+    view = memoryview(data)
+    (crc,) = _U32.unpack_from(data, len(data) - _U32.size)
+    if zlib.crc32(view[:len(data) - _U32.size]) != crc:
+        raise ValueError(f"{path} is truncated or corrupt (checksum mismatch)")
+    pos = _HEAD.size
+    sections = {}
+    for _ in range(n):
+        (k,) = _NAME.unpack_from(data, pos)
+        name = bytes(view[pos + _NAME.size:pos + _NAME.size + k]).decode()
+        pos += _NAME.size + k
+        (length,) = _LEN.unpack_from(data, pos)
+        pos += _LEN.size
+        payload = view[pos:pos + length]
+        sections[name] = zlib.decompress(payload) if flags & FLAG_ZLIB else bytes(payload)
+        pos += length
+    return sections
+
+
+# --- restore ---
+
+def restore(sections: Dict[str, bytes], array_store: Optional[bool] = None):
+    """Rebuild a Simulation from checkpoint sections."""
+    from simulation import Simulation
+
+    meta = json.loads(sections["meta"])
+    if array_store is None:
+        array_store = meta["arrayStore"]
+    sim = Simulation(seed=meta["seed"], population=0, array_store=array_store)
+    for name, (version, internal, gauss) in meta["rng"].items():
+        sim.streams.stream(name).setstate((version, tuple(internal), gauss))
+
+    cm = sim.citizens
+    cm.uids = _unpack_uids(sections["citizen.uids"])
+    cm.by_uid = {uid: cid for cid, uid in enumerate(cm.uids) if uid}
+    cm.conversations = meta["conversations"]
+
+    ids = _unpack("I", sections["citizen.id"])
+    columns = {name: _unpack("q", sections["citizen." + name]) for name in _INT_FIELDS}
+    columns.update({name: _unpack("d", sections["citizen." + name]) for name in _FLOAT_FIELDS})
+    columns.update({name: [v or None for v in _unpack("I", sections["citizen." + name])]
+                    for name in _ID_FIELDS})
+    columns.update({name: _unpack_strings(sections["citizen." + name]) for name in _STR_FIELDS})
+    columns.update({name: _unpack_lists(sections["citizen." + name]) for name in _TUPLE_FIELDS})
+    columns["is_external"] = [bool(v) for v in _unpack("B", sections["citizen.is_external"])]
+    traits = _unpack("d", sections["citizen.personality"])
+    k = len(TRAITS)
+    columns["id"] = ids
+    columns["uid"] = [cm.uids[cid] for cid in ids]
+    columns["personality"] = [array.__new__(Personality, "d", traits[i:i + k])
+                              for i in range(0, len(traits), k)]
+    for row in zip(*(columns[name] for name in _CITIZEN_ARGS)):
+        cm.add(Citizen(*row))
+    cm.index.restore_buckets({
+        table: dict(zip(map(_bucket_key, json.loads(sections["index." + table + ".keys"])),
+                        _unpack_lists(sections["index." + table])))
+        for table in ("arrived", "transit", "roles", "by_role")
+    }, cm.citizens)
+    if cm.store is not None and meta["npRng"] is not None:
+        cm.store.np_rng.bit_generator.state = meta["npRng"]
+
+    rel = sim.relationships
+    rel.limits = TieLimits(**meta["tieLimits"]) if meta["tieLimits"] else None
+    rel.scores = dict(zip(_unpack("Q", sections["rel.keys"]), _unpack("b", sections["rel.scores"])))
+    rel.types = dict(zip(_unpack("Q", sections["rel.type_keys"]), _unpack_strings(sections["rel.types"])))
+    rel.reindex()
+    rel.known_crimes = defaultdict(set, zip(_unpack("I", sections["rel.known_ids"]),
+                                            map(set, _unpack_lists(sections["rel.known"]))))
+    rel.grudges = defaultdict(dict)
+    for victim, perp, reason in zip(_unpack("I", sections["rel.grudge_victims"]),
+                                    _unpack("I", sections["rel.grudge_targets"]),
+                                    _unpack_strings(sections["rel.grudge_reasons"])):
+        rel.grudges[victim][perp] = reason
+
+    crime, m = sim.crime, meta["crime"]
+    crime.imprisoned = dict(zip(_unpack("I", sections["crime.imprisoned_ids"]),
+                                _unpack("q", sections["crime.imprisoned_until"])))
+    crime.criminal_records = dict(zip(_unpack("I", sections["crime.record_ids"]),
+                                      map(list, _unpack_lists(sections["crime.records"]))))
+    crime.crimes = deque((Crime(**c) for c in m["crimes"]), maxlen=crime.crimes.maxlen)
+    crime.uids = _unpack_uids(sections["crime.uids"])
+    crime.by_uid = {uid: cid for cid, uid in enumerate(crime.uids) if uid}
+    rel.gossip.load_state(meta["gossip"])
+
+    token, m = sim.token, meta["token"]
+    token.wallets = Wallets(m["treasury"], m["supply"], m["feeBps"])
+    token.wallets.balances = _unpack("q", sections["token.balances"])
+    token.wallets.opened = bytearray(sections["token.opened"])
+    token._last_hash = bytes.fromhex(m["lastHash"])
+    token.height = m["height"]
+    token.tx_count = m["txCount"]
+    token.ledger = deque((Transaction(**tx) for tx in m["ledger"]), maxlen=token.ledger.maxlen)
+    token.blocks = deque(map(Block.from_dict, m["blocks"]), maxlen=token.blocks.maxlen)
+    tail = {tx.seq: tx for tx in token.ledger}
+    token.open_block = [tail.get(tx["seq"]) or Transaction(**tx) for tx in m["openBlock"]]
+
+    t, m = sim.time, meta["time"]
+    t.tick, t.minute, t.hour, t.day, t.year = m["tick"], m["minute"], m["hour"], m["day"], m["year"]
+    t._weather, t._weather_change_tick = m["weather"], m["weatherChangeTick"]
+
+    gov, m = sim.government, meta["government"]
+    gov.laws = [Law(**l) for l in m["laws"]]
+    gov.active_bill = Law(**m["activeBill"]) if m["activeBill"] else None
+    gov.parliament_ids = m["parliamentIds"]
+    gov.prime_minister_id = m["primeMinisterId"]
+    gov.treasury = m["treasury"]
+    gov.election_day = m["electionDay"]
+    gov.next_proposal_tick = m["nextProposalTick"]
+    gov._vote_tick = m["voteTick"]
+    gov._used_laws = set(m["usedLaws"])
+
+    econ, m = sim.economy, meta["economy"]
+    econ.businesses = [
+        Business(name, btype, owner_name, owner_id or None, list(employees), revenue, base_salary)
+        for name, btype, owner_name, owner_id, employees, revenue, base_salary in zip(
+            _unpack_strings(sections["business.name"]), _unpack_strings(sections["business.type"]),
+            _unpack_strings(sections["business.owner_name"]), _unpack("I", sections["business.owner_id"]),
+            _unpack_lists(sections["business.employee_ids"]), _unpack("q", sections["business.revenue"]),
+            _unpack("q", sections["business.base_salary"]))
+    ]
+    econ.prices = m["prices"]
+    econ.gdp = m["gdp"]
+    econ.unemployment = m["unemployment"]
+    econ.inflation = m["inflation"]
+    econ.tax_rate = m["taxRate"]
+    econ._prev_prices = m["prevPrices"]
+    econ._daily_revenue = m["dailyRevenue"]
+
+    life, m = sim.lifecycle, meta["lifecycle"]
+    life.dead_citizens = m["dead"]
+    life.marriages_today = m["marriagesToday"]
+    life.births_today = m["birthsToday"]
+    life._last_age_day = m["lastAgeDay"]
+
+    sim.news.extend(meta["news"])
+    sim.event_log.extend(meta["eventLog"])
+    sim._news_id = meta["newsId"]
+    return sim
+
+
+def _bucket_key(key):
+    return tuple(key) if isinstance(key, list) else key
+
+
+def load(path: str, array_store: Optional[bool] = None):
+    """Simulation restored from the checkpoint at `path`."""
+    return restore(read(path), array_store)
+
+
+class Checkpointer:
+    """Checkpoints a running simulation every `every` ticks.
+
+    Call `maybe_save` on the engine thread after a tick. The world is
+    captured right there; the file is compressed and written on a background
+    thread. If the previous write is still running, the checkpoint is
+    skipped rather than queued.
+    """
+
+    def __init__(self, sim, path: str, every: int = 600):
+        self.sim = sim
+        self.path = path
+        self.every = every
+        self._last_tick = sim.time.tick
+        self._writer: Optional[threading.Thread] = None
+
+    def maybe_save(self):
+        if self.sim.time.tick - self._last_tick < self.every:
+            return
+        if self._writer is not None and self._writer.is_alive():
+            return
+        self._last_tick = self.sim.time.tick
+        start = time.perf_counter()
+        self.sim.token.sync()  # the ledger on disk must cover everything the checkpoint does
+        sections = capture(self.sim)
+        self.sim.profiler.lap("checkpoint", start)
+        self._writer = threading.Thread(target=write, args=(self.path, sections),
+                                        name="aicity-checkpoint", daemon=True)
+        self._writer.start()
+
+    def save(self):
+        """Checkpoint now and wait for the file (e.g. at shutdown)."""
+        if self._writer is not None:
+            self._writer.join()
+        self._last_tick = self.sim.time.tick
+        self.sim.token.sync()
+        write(self.path, capture(self.sim))
@@ -2,10 +2,12 @@
 
 import random
 import uuid
+from array import array
 from dataclasses import dataclass, field
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator, Tuple
 
 from world import LOCATION_MAP
+from rng import new_uuid
 
 # Avatar mapping by (role, gender)
 AVATARS = {
@@ -39,6 +41,31 @@ WORK_LOCATIONS = {
     "エンジニア": "office",
 }
 
+# What citizens do once they arrive, by location type
+LOCATION_ACTIONS = {
+    "government": ["業務中", "会議に参加中", "書類を確認中"],
+    "commerce": ["買い物中", "商談中", "品定め中"],
+    "residential": ["自宅で休憩中", "家事中", "くつろぎ中"],
+    "business": ["仕事中", "会議中", "資料作成中"],
+    "service": ["診察中", "待合室で待機中", "治療中"],
+    "education": ["授業中", "勉強中", "準備中"],
+    "leisure": ["散歩中", "ベンチで休憩中", "運動中"],
+    "culture": ["参拝中", "散策中", "瞑想中"],
+}
+
+# Role-specific actions at the citizen's own workplace
+ROLE_ACTIONS = {
+    "国会議員": ["法案を審議中", "演説中", "政策を検討中"],
+    "警察官": ["巡回中", "パトロール中", "報告書を作成中"],
+    "医者": ["患者を診察中", "カルテを書いている", "手術準備中"],
+    "教師": ["授業中", "テストを採点中", "生徒と面談中"],
+    "シェフ": ["料理中", "仕込み中", "メニュー考案中"],
+    "裁判官": ["審理中", "判決文を書いている", "法律を調べている"],
+}
+
+# Shared "on the way" action string per destination (one object, not one per citizen)
+MOVING_ACTIONS = {loc_id: f"{loc['name']}へ移動中" for loc_id, loc in LOCATION_MAP.items()}
+
 # Conversation templates organized by topic
 CONV_TEMPLATES = {
     "politics": [
@@ -182,15 +209,43 @@ CITIZEN_DEFS = [
 ]
 
 
-@dataclass
+TRAITS = ("openness", "conscientiousness", "extraversion", "agreeableness", "neuroticism")
+_TRAIT_INDEX = {t: i for i, t in enumerate(TRAITS)}
+_UNSET = float("nan")
+
+
+class Personality(array):
+    """Big Five traits as a fixed-layout vector of doubles (NaN = not set).
+
+    Reads like the dict it replaces: `p.get("openness", 0.5)`.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, traits: Optional[Dict[str, float]] = None):
+        traits = traits or {}
+        return super().__new__(cls, "d", [float(traits.get(t, _UNSET)) for t in TRAITS])
+
+    def get(self, trait: str, default: Optional[float] = None) -> Optional[float]:
+        i = _TRAIT_INDEX.get(trait)
+        if i is None:
+            return default
+        v = self[i]
+        return default if v != v else v
+
+    def to_dict(self) -> Dict[str, float]:
+        return {t: v for t, v in zip(TRAITS, self) if v == v}
+
+
+@dataclass(slots=True)
 class Citizen:
-    id: str
+    id: int  # dense internal id; `uid` is the public uuid
     name: str
     age: int
     gender: str
     role: str
     home: str  # location id
-    personality: Dict[str, float] = field(default_factory=dict)  # Big Five
+    personality: Personality = field(default_factory=Personality)  # Big Five
     location: str = ""
     target_location: str = ""
     x: float = 0
@@ -203,15 +258,22 @@ class Citizen:
     hunger: int = 20
     employer: str = ""
     salary: int = 0
-    spouse_id: Optional[str] = None
-    children_ids: List[str] = field(default_factory=list)
-    parent_ids: List[str] = field(default_factory=list)
+    spouse_id: Optional[int] = None
+    children_ids: Tuple[int, ...] = ()
+    parent_ids: Tuple[int, ...] = ()
     speaking: Optional[str] = None
-    speaking_to: Optional[str] = None
+    speaking_to: Optional[int] = None
     action: str = "待機中"
     is_external: bool = False
     api_key: Optional[str] = None
+    uid: str = ""
     _speak_timer: int = 0
+    _index: Optional["LocationIndex"] = field(default=None, repr=False, compare=False)
+    _index_key: Optional[tuple] = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not isinstance(self.personality, Personality):
+            self.personality = Personality(self.personality)
 
     @property
     def avatar(self) -> str:
@@ -221,21 +283,25 @@ class Citizen:
     def mood(self) -> str:
         return get_mood(self.happiness)
 
-    def get_offset_position(self, loc_id: str) -> tuple:
+    def get_offset_position(self, loc_id: str, rng: random.Random = random) -> tuple:
         loc = LOCATION_MAP[loc_id]
-        ox = random.uniform(-25, 25)
-        oy = random.uniform(-20, 20)
+        ox = rng.uniform(-25, 25)
+        oy = rng.uniform(-20, 20)
         return loc["x"] + ox, loc["y"] + oy
 
-    def set_location(self, loc_id: str):
+    def set_location(self, loc_id: str, rng: random.Random = random):
         self.location = loc_id
-        self.x, self.y = self.get_offset_position(loc_id)
+        self.x, self.y = self.get_offset_position(loc_id, rng)
         self.target_x, self.target_y = self.x, self.y
         self.target_location = loc_id
+        if self._index is not None:
+            self._index.update(self)
 
-    def set_target(self, loc_id: str):
+    def set_target(self, loc_id: str, rng: random.Random = random):
         self.target_location = loc_id
-        self.target_x, self.target_y = self.get_offset_position(loc_id)
+        self.target_x, self.target_y = self.get_offset_position(loc_id, rng)
+        if self._index is not None:
+            self._index.update(self)
 
     def move_toward_target(self, speed: float = 15.0):
         if self.location == self.target_location:
@@ -247,6 +313,8 @@ class Citizen:
             self.x = self.target_x
             self.y = self.target_y
             self.location = self.target_location
+            if self._index is not None:
+                self._index.update(self)
         else:
             self.x += dx / dist * speed
             self.y += dy / dist * speed
@@ -259,8 +327,9 @@ class Citizen:
         for cid in self.children_ids:
             if cid in all_citizens:
                 children_names.append(all_citizens[cid].name)
+        partner = all_citizens.get(self.speaking_to) if self.speaking_to else None
         return {
-            "id": self.id,
+            "id": self.uid,
             "name": self.name,
             "age": self.age,
             "role": self.role,
@@ -277,7 +346,7 @@ class Citizen:
             "hunger": self.hunger,
             "action": self.action,
             "speaking": self.speaking,
-            "speakingTo": self.speaking_to,
+            "speakingTo": partner.uid if partner else None,
             "family": {
                 "spouse": spouse_name,
                 "children": children_names,
@@ -287,22 +356,116 @@ class Citizen:
         }
 
 
-class CitizenManager:
+class LocationIndex:
+    """Live location → citizens index, split by arrived / in-transit and by role.
+
+    A citizen is "at" its current `location` whether it has arrived there or
+    is just leaving for its target. Citizens call `update` themselves whenever
+    their location or target changes; code that assigns `location` directly
+    must call it too.
+    """
+
     def __init__(self):
-        self.citizens: Dict[str, Citizen] = {}
+        self.arrived: Dict[str, Dict[int, Citizen]] = {loc_id: {} for loc_id in LOCATION_MAP}
+        self.transit: Dict[str, Dict[int, Citizen]] = {loc_id: {} for loc_id in LOCATION_MAP}
+        self.roles: Dict[Tuple[str, str], Dict[int, Citizen]] = {}  # (location, role) → citizens
+        self.by_role: Dict[str, Dict[int, Citizen]] = {}
+        # Each citizen remembers its (location, arrived, role) key in `_index_key`;
+        # the tuples are shared between all citizens with the same key.
+        self._keys: Dict[Tuple[str, bool, str], Tuple[str, bool, str]] = {}
+
+    def _key(self, c: Citizen) -> Tuple[str, bool, str]:
+        key = (c.location, c.location == c.target_location, c.role)
+        return self._keys.setdefault(key, key)
+
+    def add(self, c: Citizen):
+        c._index = self
+        self.by_role.setdefault(c.role, {})[c.id] = c
+        self._place(c, self._key(c))
+
+    def remove(self, c: Citizen):
+        if c._index_key is not None:
+            self._unplace(c.id, c._index_key)
+        self.by_role.get(c.role, {}).pop(c.id, None)
+        c._index = c._index_key = None
+
+    def update(self, c: Citizen):
+        old = c._index_key
+        if old is not None and old[0] == c.location and old[1] == (c.location == c.target_location) \
+                and old[2] == c.role:
+            return
+        key = self._key(c)
+        if old is not None:
+            self._unplace(c.id, old)
+            if old[2] != key[2]:
+                self.by_role[old[2]].pop(c.id, None)
+                self.by_role.setdefault(key[2], {})[c.id] = c
+        self._place(c, key)
+
+    def _place(self, c: Citizen, key: Tuple[str, bool, str]):
+        loc_id, arrived, role = key
+        (self.arrived if arrived else self.transit).setdefault(loc_id, {})[c.id] = c
+        self.roles.setdefault((loc_id, role), {})[c.id] = c
+        c._index_key = key
+
+    def _unplace(self, cid: int, key: Tuple[str, bool, str]):
+        loc_id, arrived, role = key
+        (self.arrived if arrived else self.transit)[loc_id].pop(cid, None)
+        self.roles[(loc_id, role)].pop(cid, None)
+
+    def buckets(self) -> Dict[str, Dict[object, List[int]]]:
+        """Citizen ids of every bucket in iteration order (see checkpoint.py)."""
+        return {table: {key: list(bucket) for key, bucket in getattr(self, table).items()}
+                for table in ("arrived", "transit", "roles", "by_role")}
+
+    def restore_buckets(self, buckets: Dict[str, Dict[object, List[int]]], citizens: Dict[int, Citizen]):
+        """Put every bucket back in a saved iteration order; membership must already match."""
+        for table, saved in buckets.items():
+            current = getattr(self, table)
+            restored = {key: {cid: citizens[cid] for cid in ids} for key, ids in saved.items()}
+            restored.update((key, bucket) for key, bucket in current.items() if key not in restored)
+            setattr(self, table, restored)
+
+    def at(self, loc_id: str) -> Iterator[Citizen]:
+        """Everyone whose current location is `loc_id`, arrived or leaving."""
+        yield from self.arrived.get(loc_id, {}).values()
+        yield from self.transit.get(loc_id, {}).values()
+
+    def arrived_at(self, loc_id: str) -> List[Citizen]:
+        return list(self.arrived.get(loc_id, {}).values())
+
+    def count_role(self, loc_id: str, role: str) -> int:
+        return len(self.roles.get((loc_id, role), ()))
+
+
+class CitizenManager:
+    def __init__(self, rng: Optional[random.Random] = None, id_rng: Optional[random.Random] = None,
+                 populate: bool = True, array_store: bool = False):
+        self.rng = rng or random.Random()
+        self.id_rng = id_rng or random.Random()
+        self.store = None
+        if array_store:
+            from citizen_store import CitizenStore  # optional numpy backend
+            self.store = CitizenStore(self.rng)
+        self.citizens: Dict[int, Citizen] = {}
+        # Internal ids are dense ints; public uuids only appear at the API boundary
+        self.uids: List[Optional[str]] = [None]  # id → uuid (id 0 is never issued)
+        self.by_uid: Dict[str, int] = {}
+        self.index = LocationIndex()
         self.conversations: List[dict] = []  # active conversations
-        self._init_citizens()
-        self._init_families()
+        if populate:
+            self._init_citizens()
+            self._init_families()
 
     def _init_citizens(self):
         for defn in CITIZEN_DEFS:
-            cid = str(uuid.uuid4())
+            cid = self.new_id()
             personality = {
-                "openness": random.uniform(0.2, 0.9),
-                "conscientiousness": random.uniform(0.2, 0.9),
-                "extraversion": random.uniform(0.2, 0.9),
-                "agreeableness": random.uniform(0.2, 0.9),
-                "neuroticism": random.uniform(0.2, 0.9),
+                "openness": self.rng.uniform(0.2, 0.9),
+                "conscientiousness": self.rng.uniform(0.2, 0.9),
+                "extraversion": self.rng.uniform(0.2, 0.9),
+                "agreeableness": self.rng.uniform(0.2, 0.9),
+                "neuroticism": self.rng.uniform(0.2, 0.9),
             }
             c = Citizen(
                 id=cid,
@@ -312,13 +475,13 @@ class CitizenManager:
                 role=defn["role"],
                 home=defn["home"],
                 personality=personality,
-                money=random.randint(2000, 8000),
-                health=random.randint(70, 100),
-                happiness=random.randint(50, 85),
-                hunger=random.randint(10, 40),
+                money=self.rng.randint(2000, 8000),
+                health=self.rng.randint(70, 100),
+                happiness=self.rng.randint(50, 85),
+                hunger=self.rng.randint(10, 40),
             )
-            c.set_location(defn["home"])
-            self.citizens[cid] = c
+            c.set_location(defn["home"], self.rng)
+            self.add(c)
 
     def _init_families(self):
         by_name = {c.name: c for c in self.citizens.values()}
@@ -335,9 +498,44 @@ class CitizenManager:
             w.spouse_id = h.id
             for cn in child_names:
                 child = by_name[cn]
-                h.children_ids.append(child.id)
-                w.children_ids.append(child.id)
-                child.parent_ids = [h.id, w.id]
+                h.children_ids += (child.id,)
+                w.children_ids += (child.id,)
+                child.parent_ids = (h.id, w.id)
+
+    def new_id(self) -> int:
+        """Issue the next internal id along with its public uuid."""
+        cid = len(self.uids)
+        uid = new_uuid(self.id_rng)
+        self.uids.append(uid)
+        self.by_uid[uid] = cid
+        return cid
+
+    def public_id(self, cid: int) -> Optional[str]:
+        """Public uuid for an internal id (kept after death for records)."""
+        return self.uids[cid] if 0 < cid < len(self.uids) else None
+
+    def resolve(self, uid: str) -> Optional[Citizen]:
+        """Living citizen for a public uuid, or None."""
+        cid = self.by_uid.get(uid)
+        return self.citizens.get(cid) if cid is not None else None
+
+    def add(self, c: Citizen) -> Citizen:
+        """Register a citizen; returns the stored object (an array view with the numpy store)."""
+        if not c.uid:
+            c.uid = self.uids[c.id]
+        if self.store is not None:
+            c = self.store.adopt(c)
+        self.citizens[c.id] = c
+        self.index.add(c)
+        return c
+
+    def remove(self, citizen_id: int) -> Optional[Citizen]:
+        c = self.citizens.pop(citizen_id, None)
+        if c is not None:
+            self.index.remove(c)
+            if self.store is not None:
+                self.store.release(c)
+        return c
 
     def get_by_name(self, name: str) -> Optional[Citizen]:
         for c in self.citizens.values():
@@ -346,18 +544,22 @@ class CitizenManager:
         return None
 
     def get_by_role(self, role: str) -> List[Citizen]:
-        return [c for c in self.citizens.values() if c.role == role]
+        return list(self.index.by_role.get(role, {}).values())
 
     def update_movement(self, hour: int):
         """Decide where citizens should go based on time of day."""
+        if self.store is not None:
+            for row in self.store.update_movement(hour):
+                self.index.update(self.store.citizens[row])
+            return
         for c in self.citizens.values():
             if c.is_external:
                 continue
             if c.location == c.target_location:
                 target = self._decide_target(c, hour)
                 if target and target != c.location:
-                    c.set_target(target)
-                    c.action = f"{LOCATION_MAP[target]['name']}へ移動中"
+                    c.set_target(target, self.rng)
+                    c.action = MOVING_ACTIONS[target]
             c.move_toward_target()
             if c.location == c.target_location:
                 c.action = self._location_action(c)
@@ -368,58 +570,45 @@ class CitizenManager:
             return c.home
         # Morning work (7-11)
         if 7 <= hour < 11:
-            if random.random() < 0.05:  # small chance to stay/go elsewhere
-                return random.choice(["park", "shrine", "market"])
+            if self.rng.random() < 0.05:  # small chance to stay/go elsewhere
+                return self.rng.choice(["park", "shrine", "market"])
             return WORK_LOCATIONS.get(c.role, "office")
         # Lunch (11-13)
         if 11 <= hour < 13:
-            if random.random() < 0.6:
-                return random.choice(["restaurant", "market", "park"])
+            if self.rng.random() < 0.6:
+                return self.rng.choice(["restaurant", "market", "park"])
             return WORK_LOCATIONS.get(c.role, "office")
         # Afternoon work (13-17)
         if 13 <= hour < 17:
-            if random.random() < 0.08:
-                return random.choice(["park", "market"])
+            if self.rng.random() < 0.08:
+                return self.rng.choice(["park", "market"])
             return WORK_LOCATIONS.get(c.role, "office")
         # Evening (17-22)
         if 17 <= hour < 20:
             choices = [c.home, "park", "restaurant", "shrine", "market"]
-            return random.choice(choices)
+            return self.rng.choice(choices)
         # Late evening
         if 20 <= hour < 23:
-            if random.random() < 0.7:
+            if self.rng.random() < 0.7:
                 return c.home
-            return random.choice(["restaurant", "park"])
+            return self.rng.choice(["restaurant", "park"])
         return None
 
     def _location_action(self, c: Citizen) -> str:
-        loc_type = LOCATION_MAP[c.location]["type"]
-        actions = {
-            "government": ["業務中", "会議に参加中", "書類を確認中"],
-            "commerce": ["買い物中", "商談中", "品定め中"],
-            "residential": ["自宅で休憩中", "家事中", "くつろぎ中"],
-            "business": ["仕事中", "会議中", "資料作成中"],
-            "service": ["診察中", "待合室で待機中", "治療中"],
-            "education": ["授業中", "勉強中", "準備中"],
-            "leisure": ["散歩中", "ベンチで休憩中", "運動中"],
-            "culture": ["参拝中", "散策中", "瞑想中"],
-        }
-        role_actions = {
-            "国会議員": ["法案を審議中", "演説中", "政策を検討中"],
-            "警察官": ["巡回中", "パトロール中", "報告書を作成中"],
-            "医者": ["患者を診察中", "カルテを書いている", "手術準備中"],
-            "教師": ["授業中", "テストを採点中", "生徒と面談中"],
-            "シェフ": ["料理中", "仕込み中", "メニュー考案中"],
-            "裁判官": ["審理中", "判決文を書いている", "法律を調べている"],
-        }
-        if c.role in role_actions and c.location == WORK_LOCATIONS.get(c.role):
-            return random.choice(role_actions[c.role])
-        return random.choice(actions.get(loc_type, ["待機中"]))
+        if c.role in ROLE_ACTIONS and c.location == WORK_LOCATIONS.get(c.role):
+            return self.rng.choice(ROLE_ACTIONS[c.role])
+        return self.rng.choice(LOCATION_ACTIONS.get(LOCATION_MAP[c.location]["type"], ["待機中"]))
 
     def update_needs(self):
         """Update hunger, health, happiness each tick."""
+        if self.store is not None:
+            for row in self.store.update_needs():
+                c = self.store.citizens[row]
+                c.speaking = None
+                c.speaking_to = None
+            return
         for c in self.citizens.values():
-            c.hunger = min(100, c.hunger + random.randint(0, 2))
+            c.hunger = min(100, c.hunger + self.rng.randint(0, 2))
             if c.hunger > 70:
                 c.health = max(0, c.health - 1)
                 c.happiness = max(0, c.happiness - 1)
@@ -442,50 +631,49 @@ class CitizenManager:
     def generate_conversations(self):
         """Generate conversations between citizens at the same location."""
         self.conversations = []
-        # Group citizens by location
-        by_loc: Dict[str, List[Citizen]] = {}
-        for c in self.citizens.values():
-            if c.location == c.target_location:  # only if arrived
-                by_loc.setdefault(c.location, []).append(c)
+        all_names: List[str] = []
 
-        for loc_id, citizens_at in by_loc.items():
+        # Only citizens who have arrived at their location talk
+        for loc_id, citizens_at in self.index.arrived.items():
             if len(citizens_at) < 2:
                 continue
             # 20% chance per tick that a conversation happens at a location
-            if random.random() > 0.20:
+            if self.rng.random() > 0.20:
                 continue
             # Pick 2 citizens
-            pair = random.sample(citizens_at, 2)
+            pair = self.rng.sample(list(citizens_at.values()), 2)
             c1, c2 = pair
             if c1.speaking or c2.speaking:
                 continue
 
-            topic = random.choice(["politics", "economy", "daily", "gossip", "family"])
-            msg1 = random.choice(CONV_TEMPLATES[topic])
+            topic = self.rng.choice(["politics", "economy", "daily", "gossip", "family"])
+            msg1 = self.rng.choice(CONV_TEMPLATES[topic])
 
             # Fill in gossip names
-            other_names = [c.name for c in self.citizens.values() if c.name not in (c1.name, c2.name)]
+            if not all_names:
+                all_names = [c.name for c in self.citizens.values()]
+            exclude = (c1.name, c2.name)
             if "{name}" in msg1:
-                msg1 = msg1.replace("{name}", random.choice(other_names))
+                msg1 = msg1.replace("{name}", self._pick_other_name(all_names, exclude))
             if "{name2}" in msg1:
-                msg1 = msg1.replace("{name2}", random.choice(other_names))
+                msg1 = msg1.replace("{name2}", self._pick_other_name(all_names, exclude))
 
             # Response
-            resp_type = random.choice(["response_agree", "response_disagree", "response_neutral"])
-            msg2 = random.choice(CONV_TEMPLATES[resp_type])
+            resp_type = self.rng.choice(["response_agree", "response_disagree", "response_neutral"])
+            msg2 = self.rng.choice(CONV_TEMPLATES[resp_type])
 
             # Maybe a third message
             messages = [
                 {"speaker": c1.name, "text": msg1},
                 {"speaker": c2.name, "text": msg2},
             ]
-            if random.random() < 0.5:
-                followup_topic = random.choice(["daily", "economy", "politics"])
-                msg3 = random.choice(CONV_TEMPLATES[followup_topic])
+            if self.rng.random() < 0.5:
+                followup_topic = self.rng.choice(["daily", "economy", "politics"])
+                msg3 = self.rng.choice(CONV_TEMPLATES[followup_topic])
                 if "{name}" in msg3:
-                    msg3 = msg3.replace("{name}", random.choice(other_names))
+                    msg3 = msg3.replace("{name}", self._pick_other_name(all_names, exclude))
                 if "{name2}" in msg3:
-                    msg3 = msg3.replace("{name2}", random.choice(other_names))
+                    msg3 = msg3.replace("{name2}", self._pick_other_name(all_names, exclude))
                 messages.append({"speaker": c1.name, "text": msg3})
 
             c1.speaking = msg1
@@ -501,13 +689,22 @@ class CitizenManager:
                 "messages": messages,
             })
 
+    def _pick_other_name(self, names: List[str], exclude: tuple) -> str:
+        """Uniform pick among names not in `exclude`, without copying the list."""
+        for _ in range(32):
+            name = self.rng.choice(names)
+            if name not in exclude:
+                return name
+        # Tiny or single-family cities: fall back to filtering
+        return self.rng.choice([n for n in names if n not in exclude])
+
     def register_external(self, name: str, role: str, personality: dict) -> Citizen:
-        cid = str(uuid.uuid4())
-        api_key = str(uuid.uuid4())
+        cid = self.new_id()
+        api_key = str(uuid.uuid4())  # secret — never derived from the seed
         c = Citizen(
             id=cid,
             name=name,
-            age=random.randint(20, 50),
+            age=self.rng.randint(20, 50),
             gender="男",
             role=role,
             home="residential_south",
@@ -515,6 +712,5 @@ class CitizenManager:
             is_external=True,
             api_key=api_key,
         )
-        c.set_location("residential_south")
-        self.citizens[cid] = c
-        return c
+        c.set_location("residential_south", self.rng)
+        return self.add(c)
@@ -0,0 +1,282 @@
+"""Citizen store — Optional NumPy struct-of-arrays backend for needs and movement.
+
+With `CitizenManager(array_store=True)` every citizen's needs, money, position,
+location and action live in contiguous NumPy arrays, and `ArrayCitizen`
+objects are thin views onto one row. `update_needs` and `update_movement`
+then run as a handful of vectorized passes over the whole population instead
+of a Python loop per citizen. Only citizens whose location actually changes
+are touched from Python (to keep the location index current).
+
+NumPy is optional; the plain `Citizen` objects remain the default backend.
+"""
+
+import random
+from dataclasses import fields
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+from citizen import (
+    Citizen, LOCATION_ACTIONS, MOVING_ACTIONS, ROLE_ACTIONS, WORK_LOCATIONS,
+)
+from world import LOCATIONS
+
+LOCATION_IDS = [loc["id"] for loc in LOCATIONS]
+LOCATION_CODES = {loc_id: i for i, loc_id in enumerate(LOCATION_IDS)}
+
+_CITIZEN_FIELDS = [f.name for f in fields(Citizen)]
+
+
+class CodeTable:
+    """Interns strings as small integer codes (and back)."""
+
+    def __init__(self, values=()):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        for v in values:
+            self.code(v)
+
+    def code(self, value: str) -> int:
+        c = self.codes.get(value)
+        if c is None:
+            c = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+
+def _column(name: str, cast):
+    def get(self):
+        return cast(getattr(self._store, name)[self._row])
+
+    def set(self, value):
+        getattr(self._store, name)[self._row] = value
+
+    return property(get, set)
+
+
+def _coded(name: str, table_attr: str, nullable: bool = False):
+    def get(self):
+        code = getattr(self._store, name)[self._row]
+        if nullable and code < 0:
+            return ""
+        return getattr(self._store, table_attr).values[code]
+
+    def set(self, value):
+        if nullable and not value:
+            getattr(self._store, name)[self._row] = -1
+        else:
+            getattr(self._store, name)[self._row] = getattr(self._store, table_attr).code(value)
+
+    return property(get, set)
+
+
+class ArrayCitizen(Citizen):
+    """A Citizen whose hot scalar fields are views onto a CitizenStore row."""
+
+    __slots__ = ("_store", "_row")
+
+    hunger = _column("hunger", int)
+    health = _column("health", int)
+    happiness = _column("happiness", int)
+    money = _column("money", int)
+    x = _column("x", float)
+    y = _column("y", float)
+    target_x = _column("target_x", float)
+    target_y = _column("target_y", float)
+    _speak_timer = _column("speak_timer", int)
+    location = _coded("loc", "locations", nullable=True)
+    target_location = _coded("tgt", "locations", nullable=True)
+    action = _coded("action_code", "actions")
+
+
+class CitizenStore:
+    def __init__(self, rng: random.Random, capacity: int = 64):
+        if np is None:
+            raise ImportError("the array citizen store requires numpy (pip install numpy)")
+        self.np_rng = np.random.default_rng(rng.getrandbits(64))
+        self.locations = CodeTable(LOCATION_IDS)
+        self.actions = CodeTable()
+        self.roles = CodeTable()
+        self.citizens: List[Optional[ArrayCitizen]] = []  # row → citizen
+        self._free: List[int] = []
+        self.n = 0  # rows in use (high-water mark)
+
+        self.hunger = np.zeros(capacity, np.int32)
+        self.health = np.zeros(capacity, np.int32)
+        self.happiness = np.zeros(capacity, np.int32)
+        self.money = np.zeros(capacity, np.int64)
+        self.x = np.zeros(capacity, np.float64)
+        self.y = np.zeros(capacity, np.float64)
+        self.target_x = np.zeros(capacity, np.float64)
+        self.target_y = np.zeros(capacity, np.float64)
+        self.speak_timer = np.zeros(capacity, np.int32)
+        self.loc = np.full(capacity, -1, np.int16)
+        self.tgt = np.full(capacity, -1, np.int16)
+        self.action_code = np.zeros(capacity, np.int32)
+        # Fixed after creation: mirrored once when a citizen is adopted
+        self.home = np.zeros(capacity, np.int16)
+        self.work = np.zeros(capacity, np.int16)
+        self.role = np.zeros(capacity, np.int32)
+        self.movable = np.zeros(capacity, bool)  # alive and not external
+
+        self._loc_x = np.array([loc["x"] for loc in LOCATIONS], np.float64)
+        self._loc_y = np.array([loc["y"] for loc in LOCATIONS], np.float64)
+        self._moving_action = np.array(
+            [self.actions.code(MOVING_ACTIONS[loc["id"]]) for loc in LOCATIONS], np.int32)
+        self._arrive_actions = np.zeros((len(LOCATIONS), 0, 3), np.int32)  # [loc, role] → 3 choices
+
+    # --- rows ---
+
+    def _grow(self):
+        capacity = len(self.hunger) * 2
+        for name in ("hunger", "health", "happiness", "money", "x", "y", "target_x", "target_y",
+                     "speak_timer", "loc", "tgt", "action_code", "home", "work", "role", "movable"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def adopt(self, c: Citizen) -> ArrayCitizen:
+        """Move a plain Citizen into the store and return its array-backed view."""
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self.n == len(self.hunger):
+                self._grow()
+            row = self.n
+            self.n += 1
+            self.citizens.append(None)
+
+        view = ArrayCitizen.__new__(ArrayCitizen)
+        view._store = self
+        view._row = row
+        for name in _CITIZEN_FIELDS:
+            setattr(view, name, getattr(c, name))
+
+        self.home[row] = self.locations.code(c.home)
+        self.work[row] = self.locations.code(WORK_LOCATIONS.get(c.role, "office"))
+        self.role[row] = self._role_code(c.role)
+        self.movable[row] = not c.is_external
+        self.citizens[row] = view
+        return view
+
+    def release(self, c: ArrayCitizen):
+        self.movable[c._row] = False
+        self.speak_timer[c._row] = 0
+        self.citizens[c._row] = None
+        self._free.append(c._row)
+
+    def _role_code(self, role: str) -> int:
+        code = self.roles.code(role)
+        if code == self._arrive_actions.shape[1]:
+            # Arrival actions for this role at every location (see CitizenManager._location_action)
+            column = np.zeros((len(LOCATIONS), 1, 3), np.int32)
+            for i, loc in enumerate(LOCATIONS):
+                if role in ROLE_ACTIONS and loc["id"] == WORK_LOCATIONS.get(role):
+                    choices = ROLE_ACTIONS[role]
+                else:
+                    choices = LOCATION_ACTIONS.get(loc["type"], ["待機中"])
+                column[i, 0] = [self.actions.code(a) for a in (choices * 3)[:3]]
+            self._arrive_actions = np.concatenate([self._arrive_actions, column], axis=1)
+        return code
+
+    # --- vectorized passes ---
+
+    def update_needs(self):
+        """Vectorized CitizenManager.update_needs; returns rows whose speech ran out."""
+        n = self.n
+        loc = self.loc[:n]
+        hunger = np.minimum(100, self.hunger[:n] + self.np_rng.integers(0, 3, n))
+        health = self.health[:n]
+        happy = self.happiness[:n]
+        money = self.money[:n]
+
+        starving = hunger > 70
+        health -= starving & (health > 0)
+        happy -= starving & (happy > 0)
+
+        food = LOCATION_CODES["restaurant"], LOCATION_CODES["market"]
+        eat = ((loc == food[0]) | (loc == food[1])) & (hunger > 40) & (money > 100)
+        hunger = np.where(eat, np.maximum(0, hunger - 30), hunger)
+        money -= 100 * eat
+        happy[eat] = np.minimum(100, happy[eat] + 3)
+
+        heal = (loc == LOCATION_CODES["hospital"]) & (health < 60)
+        health[heal] = np.minimum(100, health[heal] + 5)
+        money -= 200 * heal
+
+        park = loc == LOCATION_CODES["park"]
+        happy[park] = np.minimum(100, happy[park] + 1)
+        self.hunger[:n] = hunger
+
+        timer = self.speak_timer[:n]
+        talking = timer > 0
+        timer -= talking
+        return np.flatnonzero(talking & (timer == 0))
+
+    def decide_targets(self, rows, hour: int):
+        """Vectorized CitizenManager._decide_target for `rows`; -1 means stay."""
+        k = len(rows)
+        rng = self.np_rng
+        home = self.home[rows]
+        work = self.work[rows]
+        code = LOCATION_CODES
+
+        def pick(options):
+            return np.array([code[o] for o in options], np.int16)[rng.integers(0, len(options), k)]
+
+        if hour >= 23 or hour < 6:
+            return home
+        if 7 <= hour < 11:
+            return np.where(rng.random(k) < 0.05, pick(["park", "shrine", "market"]), work)
+        if 11 <= hour < 13:
+            return np.where(rng.random(k) < 0.6, pick(["restaurant", "market", "park"]), work)
+        if 13 <= hour < 17:
+            return np.where(rng.random(k) < 0.08, pick(["park", "market"]), work)
+        if 17 <= hour < 20:
+            choice = rng.integers(0, 5, k)
+            return np.where(choice == 0, home, pick(["park", "restaurant", "shrine", "market"]))
+        if 20 <= hour < 23:
+            return np.where(rng.random(k) < 0.7, home, pick(["restaurant", "park"]))
+        return np.full(k, -1, np.int16)
+
+    def update_movement(self, hour: int, speed: float = 15.0):
+        """Vectorized CitizenManager.update_movement; returns rows whose location state changed."""
+        n = self.n
+        movable = self.movable[:n]
+        loc, tgt = self.loc[:n], self.tgt[:n]
+
+        # Arrived citizens pick their next destination
+        idle = np.flatnonzero(movable & (loc == tgt))
+        targets = self.decide_targets(idle, hour)
+        leaving = (targets >= 0) & (targets != loc[idle])
+        rows, dest = idle[leaving], targets[leaving]
+        tgt[rows] = dest
+        self.target_x[rows] = self._loc_x[dest] + self.np_rng.uniform(-25, 25, len(rows))
+        self.target_y[rows] = self._loc_y[dest] + self.np_rng.uniform(-20, 20, len(rows))
+        self.action_code[rows] = self._moving_action[dest]
+
+        # Step everyone in transit toward their target
+        moving = np.flatnonzero(movable & (loc != tgt))
+        dx = self.target_x[moving] - self.x[moving]
+        dy = self.target_y[moving] - self.y[moving]
+        dist = np.hypot(dx, dy)
+        close = dist < speed
+        arrived = moving[close]
+        self.x[arrived] = self.target_x[arrived]
+        self.y[arrived] = self.target_y[arrived]
+        loc[arrived] = tgt[arrived]
+        going = moving[~close]
+        step = speed / dist[~close]
+        self.x[going] += dx[~close] * step
+        self.y[going] += dy[~close] * step
+
+        # Everyone at their destination picks what to do there
+        here = np.flatnonzero(movable & (loc == tgt))
+        pick = self.np_rng.integers(0, 3, len(here))
+        self.action_code[here] = self._arrive_actions[loc[here], self.role[here], pick]
+
+        return np.concatenate([rows, arrived])
@@ -0,0 +1,126 @@
+"""Commands — Operations on the live world, run on the engine thread between ticks.
+
+Web handlers never touch the simulation directly. They name one of these
+(see `Engine.command`), so the same handlers work in-process and against a
+separate engine process (see shared.py). Arguments and results are plain
+JSON-like values.
+"""
+
+from typing import Optional
+
+from citizen import MOVING_ACTIONS
+from world import LOCATION_MAP
+
+
+class CommandError(Exception):
+    """A command refused the request; mapped to an HTTP error by the web layer."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def citizens(sim) -> list:
+    return [c.to_dict(sim.citizens.citizens) for c in sim.citizens.citizens.values()]
+
+
+def wallet(sim, citizen_id: str) -> dict:
+    c = sim.citizens.resolve(citizen_id)
+    if not c:
+        raise CommandError(404, "Citizen not found")
+    return {
+        "citizen_id": citizen_id,
+        "name": c.name,
+        "aic_balance": sim.token.get_balance(c.id),
+    }
+
+
+def wallet_history(sim, citizen_id: str, before: Optional[int] = None, limit: int = 50) -> dict:
+    cid = sim.citizens.by_uid.get(citizen_id)  # dead citizens keep their history
+    if cid is None:
+        raise CommandError(404, "Citizen not found")
+    return {
+        "citizen_id": citizen_id,
+        "transactions": sim.token.get_transactions(limit, before, cid, sim.citizens),
+    }
+
+
+def ledger(sim, before: Optional[int] = None, limit: int = 50) -> list:
+    return sim.token.get_transactions(limit, before, citizen_manager=sim.citizens)
+
+
+def ledger_proof(sim, seq: int) -> dict:
+    proof = sim.token.proof(seq, sim.citizens)
+    if proof is None:
+        raise CommandError(404, "Transaction not in a known block")
+    return proof
+
+
+def gossip(sim, crime_id: str) -> dict:
+    cid = sim.crime.by_uid.get(crime_id)
+    report = sim.relationships.gossip.report(cid) if cid else None
+    if report is None:
+        raise CommandError(404, "No rumor about this crime")
+    report["crimeId"] = crime_id
+    return report
+
+
+def relationships(sim, citizen_id: str) -> dict:
+    c = sim.citizens.resolve(citizen_id)
+    if not c:
+        raise CommandError(404, "Citizen not found")
+    return {
+        "citizen_id": citizen_id,
+        "name": c.name,
+        "relationships": sim.relationships.get_relationships_for(c.id, sim.citizens),
+    }
+
+
+def register(sim, name: str, role: str, personality: Optional[dict]) -> dict:
+    c = sim.citizens.register_external(name, role, personality or {})
+    sim.token.open_wallet(c.id, 100.0)
+    sim._add_news(f"🆕 新しい市民「{c.name}」が登録されました", "social")
+    return {"citizen_id": c.uid, "api_key": c.api_key}
+
+
+def act(sim, citizen_id: str, api_key: str, action: str,
+        target: Optional[str] = None, message: Optional[str] = None) -> dict:
+    c = sim.citizens.resolve(citizen_id)
+    if not c or not c.is_external:
+        raise CommandError(404, "Citizen not found")
+    if c.api_key != api_key:
+        raise CommandError(403, "Invalid API key")
+
+    if action == "move" and target:
+        if target in LOCATION_MAP:
+            c.set_target(target, sim.citizens.rng)
+            c.action = MOVING_ACTIONS[target]
+            return {"status": "moving", "target": target}
+        raise CommandError(400, "Invalid location")
+    elif action == "speak" and message:
+        c.speaking = message
+        c._speak_timer = 10
+        c.action = "発言中"
+        return {"status": "speaking"}
+    elif action == "work":
+        c.money += 100
+        c.hunger += 5
+        c.action = "働いている"
+        sim.token.reward(c.id, 1.0, "労働", sim.time.tick)
+        return {"status": "working", "money": c.money}
+
+    raise CommandError(400, "Invalid action")
+
+
+COMMANDS = {
+    "citizens": citizens,
+    "wallet": wallet,
+    "wallet_history": wallet_history,
+    "ledger": ledger,
+    "ledger_proof": ledger_proof,
+    "gossip": gossip,
+    "relationships": relationships,
+    "register": register,
+    "act": act,
+}
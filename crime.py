@@ -1,11 +1,12 @@
 """Crime & Justice System for AICity v2."""
 
 import random
-import uuid
 from dataclasses import dataclass, field
 from typing import List, Dict, Optional
 from collections import deque
 
+from rng import new_uuid
+
 CRIME_TYPES = {
     "theft":        {"name": "窃盗", "base_detection": 0.40, "base_fine": 500,  "jail_ticks": 30,  "emoji": "🔓"},
     "fraud":        {"name": "詐欺", "base_detection": 0.20, "base_fine": 1500, "jail_ticks": 50,  "emoji": "📄"},
@@ -17,11 +18,11 @@ CRIME_TYPES = {
 
 @dataclass
 class Crime:
-    id: str
+    id: int  # dense internal id; `uid` is the public uuid
     crime_type: str
-    perpetrator_id: str
+    perpetrator_id: int
     perpetrator_name: str
-    victim_id: Optional[str]
+    victim_id: Optional[int]
     victim_name: Optional[str]
     location: str
     tick: int
@@ -30,18 +31,23 @@ class Crime:
     proceeds: int = 0
     fine: int = 0
     jail_until: int = 0
-    witnesses: List[str] = field(default_factory=list)
+    witnesses: List[int] = field(default_factory=list)
+    uid: str = ""
 
-    def to_dict(self) -> dict:
+    def to_dict(self, citizen_manager=None) -> dict:
         info = CRIME_TYPES[self.crime_type]
+        perp_id, victim_id = self.perpetrator_id, self.victim_id
+        if citizen_manager:
+            perp_id = citizen_manager.public_id(perp_id)
+            victim_id = citizen_manager.public_id(victim_id) if victim_id else None
         return {
-            "id": self.id,
+            "id": self.uid,
             "type": info["name"],
             "typeKey": self.crime_type,
             "perpetrator": self.perpetrator_name,
-            "perpetratorId": self.perpetrator_id,
+            "perpetratorId": perp_id,
             "victim": self.victim_name,
-            "victimId": self.victim_id,
+            "victimId": victim_id,
             "location": self.location,
             "detected": self.detected,
             "status": self.status,
@@ -51,10 +57,15 @@ class Crime:
 
 
 class CrimeSystem:
-    def __init__(self):
+    def __init__(self, rng: Optional[random.Random] = None, id_rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+        self.id_rng = id_rng or random.Random()
         self.crimes: deque = deque(maxlen=200)
-        self.criminal_records: Dict[str, List[str]] = {}  # citizen_id -> [crime_ids]
-        self.imprisoned: Dict[str, int] = {}  # citizen_id -> release_tick
+        self.criminal_records: Dict[int, List[int]] = {}  # citizen_id -> [crime_ids]
+        self.imprisoned: Dict[int, int] = {}  # citizen_id -> release_tick
+        # Internal ids are dense ints; public uuids only appear at the API boundary
+        self.uids: List[Optional[str]] = [None]  # id → uuid (id 0 is never issued)
+        self.by_uid: Dict[str, int] = {}
 
     def tick(self, world_time, citizen_manager, news_callback) -> List[str]:
         events = []
@@ -68,7 +79,7 @@ class CrimeSystem:
             del self.imprisoned[cid]
             c = citizen_manager.citizens.get(cid)
             if c:
-                c.set_location(c.home)
+                c.set_location(c.home, self.rng)
                 c.action = "出所"
                 events.append(f"🔓 {c.name}が刑期を終えて出所しました")
 
@@ -103,52 +114,57 @@ class CrimeSystem:
     def _maybe_commit_crime(self, c, world_time, citizen_manager) -> Optional[Crime]:
         p = c.personality
         # Low money + low conscientiousness → theft
-        if c.money < 500 and p.get("conscientiousness", 0.5) < 0.35 and random.random() < 0.08:
+        if c.money < 500 and p.get("conscientiousness", 0.5) < 0.35 and self.rng.random() < 0.08:
             victim = self._pick_victim(c, citizen_manager)
-            proceeds = random.randint(100, 800)
+            proceeds = self.rng.randint(100, 800)
             if victim:
                 victim.money = max(0, victim.money - proceeds)
             return self._make_crime("theft", c, victim, proceeds, world_time)
 
         # High neuroticism + low happiness → assault
-        if p.get("neuroticism", 0.5) > 0.7 and c.happiness < 30 and random.random() < 0.06:
+        if p.get("neuroticism", 0.5) > 0.7 and c.happiness < 30 and self.rng.random() < 0.06:
             victim = self._pick_victim(c, citizen_manager)
             if victim:
-                victim.health = max(0, victim.health - random.randint(10, 30))
+                victim.health = max(0, victim.health - self.rng.randint(10, 30))
                 victim.happiness = max(0, victim.happiness - 15)
             return self._make_crime("assault", c, victim, 0, world_time)
 
         # Merchant + low agreeableness → fraud
-        if c.role == "商人" and p.get("agreeableness", 0.5) < 0.3 and random.random() < 0.04:
+        if c.role == "商人" and p.get("agreeableness", 0.5) < 0.3 and self.rng.random() < 0.04:
             victim = self._pick_victim(c, citizen_manager)
-            proceeds = random.randint(500, 2000)
+            proceeds = self.rng.randint(500, 2000)
             if victim:
                 victim.money = max(0, victim.money - proceeds)
             return self._make_crime("fraud", c, victim, proceeds, world_time)
 
         # Employer + low conscientiousness → embezzlement
-        if c.employer and p.get("conscientiousness", 0.5) < 0.25 and random.random() < 0.02:
-            proceeds = random.randint(1000, 5000)
+        if c.employer and p.get("conscientiousness", 0.5) < 0.25 and self.rng.random() < 0.02:
+            proceeds = self.rng.randint(1000, 5000)
             return self._make_crime("embezzlement", c, None, proceeds, world_time)
 
         # Low agreeableness + specific locations → smuggling
-        if c.location == "market" and p.get("agreeableness", 0.5) < 0.3 and p.get("openness", 0.5) > 0.6 and random.random() < 0.03:
-            proceeds = random.randint(800, 3000)
+        if c.location == "market" and p.get("agreeableness", 0.5) < 0.3 and p.get("openness", 0.5) > 0.6 and self.rng.random() < 0.03:
+            proceeds = self.rng.randint(800, 3000)
             return self._make_crime("smuggling", c, None, proceeds, world_time)
 
         return None
 
     def _pick_victim(self, criminal, citizen_manager):
-        at_loc = [c for c in citizen_manager.citizens.values()
-                  if c.location == criminal.location and c.id != criminal.id and c.id not in self.imprisoned]
-        return random.choice(at_loc) if at_loc else None
+        at_loc = [c for c in citizen_manager.index.at(criminal.location)
+                  if c.id != criminal.id and c.id not in self.imprisoned]
+        return self.rng.choice(at_loc) if at_loc else None
 
     def _make_crime(self, crime_type, perp, victim, proceeds, world_time) -> Crime:
         from world import LOCATION_MAP
         # Gather witnesses
         witnesses = []  # filled during detection
+        crime_id = len(self.uids)
+        uid = new_uuid(self.id_rng)
+        self.uids.append(uid)
+        self.by_uid[uid] = crime_id
         crime = Crime(
-            id=str(uuid.uuid4()),
+            id=crime_id,
+            uid=uid,
             crime_type=crime_type,
             perpetrator_id=perp.id,
             perpetrator_name=perp.name,
@@ -165,13 +181,12 @@ class CrimeSystem:
         rate = info["base_detection"]
 
         # Police at location boost detection
-        police_count = sum(1 for c in citizen_manager.citizens.values()
-                          if c.role == "警察官" and c.location == crime.location)
+        police_count = citizen_manager.index.count_role(crime.location, "警察官")
         rate += police_count * 0.15
 
         # Witnesses boost detection
-        witnesses = [c for c in citizen_manager.citizens.values()
-                     if c.location == crime.location and c.id != crime.perpetrator_id]
+        witnesses = [c for c in citizen_manager.index.at(crime.location)
+                     if c.id != crime.perpetrator_id]
         crime.witnesses = [w.id for w in witnesses[:5]]
         rate += len(witnesses) * 0.03
 
@@ -179,7 +194,7 @@ class CrimeSystem:
         if world_time.hour >= 22 or world_time.hour < 6:
             rate *= 0.5
 
-        return random.random() < min(rate, 0.95)
+        return self.rng.random() < min(rate, 0.95)
 
     def _arrest_and_trial(self, crime: Crime, world_time, citizen_manager) -> str:
         info = CRIME_TYPES[crime.crime_type]
@@ -188,7 +203,7 @@ class CrimeSystem:
             return ""
 
         # Move to police station
-        perp.set_location("police")
+        perp.set_location("police", self.rng)
         perp.action = "逮捕された"
 
         # Find a judge
@@ -202,7 +217,7 @@ class CrimeSystem:
             evidence += judge.personality.get("conscientiousness", 0.5) * 0.2
             evidence -= judge.personality.get("agreeableness", 0.5) * 0.1
 
-        guilty = random.random() < min(evidence, 0.92)
+        guilty = self.rng.random() < min(evidence, 0.92)
 
         if guilty:
             crime.status = "guilty"
@@ -223,17 +238,17 @@ class CrimeSystem:
             )
         else:
             crime.status = "acquitted"
-            perp.set_location(perp.home)
+            perp.set_location(perp.home, self.rng)
             return f"⚖️ {perp.name}の{info['name']}裁判 — 無罪判決"
 
-    def is_imprisoned(self, citizen_id: str) -> bool:
+    def is_imprisoned(self, citizen_id: int) -> bool:
         return citizen_id in self.imprisoned
 
-    def has_criminal_record(self, citizen_id: str) -> bool:
+    def has_criminal_record(self, citizen_id: int) -> bool:
         return citizen_id in self.criminal_records
 
-    def get_recent_crimes(self, limit: int = 50) -> List[dict]:
-        return [c.to_dict() for c in list(self.crimes)[:limit]]
+    def get_recent_crimes(self, limit: int = 50, citizen_manager=None) -> List[dict]:
+        return [c.to_dict(citizen_manager) for c in list(self.crimes)[:limit]]
 
     def get_gossip_targets(self) -> List[Crime]:
         """Return recent undetected crimes that witnesses know about — for gossip system."""
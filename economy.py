@@ -10,8 +10,8 @@ class Business:
     name: str
     type: str
     owner_name: str
-    owner_id: str = ""
-    employee_ids: List[str] = field(default_factory=list)
+    owner_id: Optional[int] = None
+    employee_ids: List[int] = field(default_factory=list)
     revenue: int = 0
     base_salary: int = 500
 
@@ -47,7 +47,8 @@ BASE_PRICES = {
 
 
 class Economy:
-    def __init__(self):
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
         self.businesses: List[Business] = []
         self.prices: Dict[str, int] = dict(BASE_PRICES)
         self.gdp: int = 100000
@@ -57,38 +58,45 @@ class Economy:
         self._prev_prices: Dict[str, int] = dict(BASE_PRICES)
         self._daily_revenue: int = 0
 
-    def init_businesses(self, citizen_manager):
-        for bdef in BUSINESS_DEFS:
-            owner = citizen_manager.get_by_name(bdef["owner"])
+    def init_businesses(self, citizen_manager, business_defs: Optional[List[dict]] = None):
+        for bdef in business_defs if business_defs is not None else BUSINESS_DEFS:
+            owner_id = bdef.get("owner_id")
+            if owner_id is None:
+                owner = citizen_manager.get_by_name(bdef["owner"])
+                owner_id = owner.id if owner else None
             b = Business(
                 name=bdef["name"],
                 type=bdef["type"],
                 owner_name=bdef["owner"],
-                owner_id=owner.id if owner else "",
-                base_salary=random.randint(400, 700),
+                owner_id=owner_id,
+                base_salary=self.rng.randint(400, 700),
             )
             self.businesses.append(b)
 
         # Assign employees
         unassigned = [c for c in citizen_manager.citizens.values()
                       if c.role not in ("国会議員", "裁判官") and not c.employer]
-        random.shuffle(unassigned)
+        self.rng.shuffle(unassigned)
+        first_open = 0  # every business before this index is full
         for c in unassigned:
             # Try to find a matching business
-            for b in self.businesses:
+            for i in range(first_open, len(self.businesses)):
+                b = self.businesses[i]
                 if len(b.employee_ids) < 5 and b.owner_id != c.id:
                     b.employee_ids.append(c.id)
                     c.employer = b.name
                     c.salary = b.base_salary
                     break
+            while first_open < len(self.businesses) and len(self.businesses[first_open].employee_ids) >= 5:
+                first_open += 1
 
     def tick(self, world_time, citizen_manager) -> List[str]:
         events = []
 
         # Fluctuate prices slightly each tick
-        if random.random() < 0.15:
-            key = random.choice(list(self.prices.keys()))
-            change = random.randint(-10, 10)
+        if self.rng.random() < 0.15:
+            key = self.rng.choice(list(self.prices.keys()))
+            change = self.rng.randint(-10, 10)
             self.prices[key] = max(50, self.prices[key] + change)
 
         # Pay salaries every game-day at hour 18
@@ -97,8 +105,8 @@ class Economy:
 
         # Generate revenue for businesses
         for b in self.businesses:
-            if random.random() < 0.3:
-                rev = random.randint(100, 500)
+            if self.rng.random() < 0.3:
+                rev = self.rng.randint(100, 500)
                 b.revenue += rev
                 self._daily_revenue += rev
 
@@ -107,8 +115,8 @@ class Economy:
             self._update_macro(citizen_manager)
 
         # Price spike event
-        if random.random() < 0.002:
-            key = random.choice(list(self.prices.keys()))
+        if self.rng.random() < 0.002:
+            key = self.rng.choice(list(self.prices.keys()))
             self.prices[key] = int(self.prices[key] * 1.3)
             name_map = {"food": "食料品", "housing": "住宅", "clothing": "衣料品",
                         "tools": "工具", "services": "サービス", "entertainment": "娯楽"}
@@ -0,0 +1,271 @@
+"""Engine — Runs the simulation on its own thread, off the web event loop.
+
+The tick loop is synchronous CPU work; on the asyncio loop it would stall
+every HTTP request and WebSocket for as long as a tick takes. Here it runs on
+a dedicated thread instead, and the web side only ever touches:
+
+* `Engine.snapshot`: an immutable `Snapshot` replaced (never modified) after
+  every tick, so handlers read it without locks. The full citizen list is
+  costly, so it is only rebuilt on demand and at most every
+  `citizens_every` ticks (see `Engine.citizens`);
+* `Engine.submit(fn)`: a command queue. `fn` runs on the engine thread
+  between ticks and the returned future resolves on the caller's loop.
+  External citizen actions and any read that needs the live world go
+  through here, as named `commands`.
+
+Run as a script, the engine is a process of its own that publishes into
+shared memory for any number of web workers (see shared.py):
+
+    python engine.py --snapshot /dev/shm/aicity.snap
+    AICITY_SNAPSHOT=/dev/shm/aicity.snap uvicorn main:app --workers 4
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import dataclasses
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from commands import COMMANDS, CommandError
+
+log = logging.getLogger("aicity.engine")
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Cheap per-tick views for the REST API. Published once, never mutated afterwards."""
+    tick: int
+    day: int
+    status: dict
+    government: dict
+    economy: dict
+    crimes: list
+    ledger: list
+    citizens: Optional[list] = None  # every citizen, as of `citizens_tick`
+    citizens_tick: Optional[int] = None
+
+    @classmethod
+    def capture(cls, sim, citizens: Optional[list] = None, citizens_tick: Optional[int] = None) -> "Snapshot":
+        return cls(
+            tick=sim.time.tick,
+            day=sim.time.day,
+            status={
+                "status": "running",
+                "tick": sim.time.tick,
+                "population": len(sim.citizens.citizens),
+                "day": sim.time.day,
+                "deaths": len(sim.lifecycle.dead_citizens),
+                "imprisoned": len(sim.crime.imprisoned),
+            },
+            government=sim.government.to_dict(sim.citizens),
+            economy=sim.economy.to_dict(),
+            crimes=sim.crime.get_recent_crimes(50, sim.citizens),
+            ledger=sim.token.get_recent_transactions(50, sim.citizens),
+            citizens=citizens,
+            citizens_tick=citizens_tick,
+        )
+
+
+class Engine:
+    def __init__(self, sim, hub=None, interval: float = 1.0, publisher=None, checkpointer=None,
+                 citizens_every: int = 5):
+        self.sim = sim
+        self.hub = hub  # BroadcastHub fed after every tick, if any
+        self.publisher = publisher  # shared.SnapshotPublisher, in engine-process mode
+        self.checkpointer = checkpointer  # checkpoint.Checkpointer, if persisting
+        self.interval = interval
+        self.citizens_every = citizens_every  # min ticks between citizen list rebuilds
+        self.citizens_wanted = False  # set by readers, cleared when the list is rebuilt
+        self.commands: queue.SimpleQueue = queue.SimpleQueue()
+        self.snapshot = Snapshot.capture(sim)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Set once `run` has returned; guarded by `_lock` so no command is
+        # queued after the final drain
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._stopping.clear()
+        self._closed = False
+        self._thread = threading.Thread(target=self.run, name="aicity-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self.commands.put(None)  # wake the loop if it is waiting for commands
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def call(self, fn: Callable[[], Any]) -> concurrent.futures.Future:
+        """Run `fn` on the engine thread at the next tick boundary (from any thread)."""
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                raise CommandError(503, "Engine is not running")
+            self.commands.put((fn, fut))
+        return fut
+
+    def submit(self, fn: Callable[[], Any]) -> asyncio.Future:
+        """`call` for coroutines: await the result on the running loop."""
+        return asyncio.wrap_future(self.call(fn))
+
+    async def command(self, name: str, *args) -> Any:
+        """Run a named command from commands.COMMANDS against the live world."""
+        fn = COMMANDS[name]
+        return await self.submit(lambda: fn(self.sim, *args))
+
+    def citizens(self) -> Optional[list]:
+        """The snapshot's citizen list (None until first built); asks for a fresher one.
+
+        The list is rebuilt on the engine thread after a later tick, so a
+        client polling this never makes the engine build it more than once
+        every `citizens_every` ticks, and nobody polling costs nothing.
+        """
+        self.citizens_wanted = True
+        return self.snapshot.citizens
+
+    def metrics(self) -> str:
+        """Per-phase tick timings in Prometheus text format."""
+        return self.sim.profiler.render_prometheus()
+
+    def _apply(self, command):
+        fn, fut = command
+        if not fut.set_running_or_notify_cancel():
+            return  # the caller went away
+        try:
+            fut.set_result(fn())
+        except BaseException as e:  # handed back to the caller
+            fut.set_exception(e)
+
+    def _drain(self):
+        """Refuse every command still queued; later `call`s raise at once."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            if command is not None and command[1].set_running_or_notify_cancel():
+                command[1].set_exception(CommandError(503, "Engine is not running"))
+
+    def _tick(self):
+        self.sim.tick()
+        prev, tick = self.snapshot, self.sim.time.tick
+        citizens, citizens_tick = prev.citizens, prev.citizens_tick
+        if self.citizens_wanted and (citizens_tick is None or tick - citizens_tick >= self.citizens_every):
+            self.citizens_wanted = False
+            citizens, citizens_tick = COMMANDS["citizens"](self.sim), tick
+        self.snapshot = Snapshot.capture(self.sim, citizens, citizens_tick)
+        if self.hub is not None:
+            self.hub.on_tick()
+        if self.publisher is not None:
+            self.publisher.publish(self.snapshot)
+        if self.checkpointer is not None:
+            self.checkpointer.maybe_save()
+
+    def run(self):
+        """The tick loop; blocks until `stop()` (start() runs it on a thread)."""
+        try:
+            self._loop()
+        finally:
+            self._drain()
+            if self.checkpointer is not None:
+                self.checkpointer.save()  # the world as it stood after the last full tick
+            else:
+                self.sim.token.sync()
+
+    def _loop(self):
+        deadline = time.monotonic()
+        while not self._stopping.is_set():
+            try:
+                self._tick()
+            except Exception:
+                # A bad tick is logged and the city carries on; a dead engine
+                # thread would leave every command hanging
+                log.exception("tick %d failed", self.sim.time.tick)
+            # Serve commands until the next tick is due (at least those already
+            # queued, even after a slow tick); they never interleave with a tick
+            deadline = max(deadline + self.interval, time.monotonic())
+            while not self._stopping.is_set():
+                try:
+                    command = self.commands.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if command is not None:
+                    self._apply(command)
+
+
+def load_or_create(checkpoint_path: Optional[str], ledger_dir: Optional[str] = None, **options):
+    """The simulation saved at `checkpoint_path` if there is one, else a new one.
+
+    A resumed simulation still takes `max_ties` from the options, so the
+    relationship limit can be changed or switched off on restart. With
+    `ledger_dir`, every transaction is also kept on disk (see ledger.py).
+    """
+    from simulation import Simulation
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        from checkpoint import load
+        from relationships import TieLimits
+        sim = load(checkpoint_path, options.get("array_store") or None)
+        max_ties, rel = options.get("max_ties"), sim.relationships
+        if not max_ties:
+            rel.limits = None
+        elif rel.limits is None:
+            rel.limits = TieLimits(max_ties)
+        else:
+            rel.limits = dataclasses.replace(rel.limits, max_ties=max_ties)
+    else:
+        sim = Simulation(**options)
+    if ledger_dir:
+        from ledger import Ledger
+        sim.token.attach(Ledger(ledger_dir))
+    return sim
+
+
+def main(argv=None) -> int:
+    from checkpoint import Checkpointer
+    from shared import CommandServer, SnapshotPublisher
+
+    parser = argparse.ArgumentParser(description="Run the AICity engine as its own process.")
+    parser.add_argument("--snapshot", required=True, help="shared snapshot file (e.g. /dev/shm/aicity.snap)")
+    parser.add_argument("--seed", type=int, help="seed every random stream for a reproducible run")
+    parser.add_argument("--population", type=int, help="generate a synthetic city of this many citizens")
+    parser.add_argument("--array-store", action="store_true", help="numpy citizen store (requires numpy)")
+    parser.add_argument("--max-ties", type=int, help="bound relationship memory: decay, pruning and this many ties per citizen")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds per tick")
+    parser.add_argument("--every", type=int, default=2, help="ticks between WebSocket frames")
+    parser.add_argument("--checkpoint", help="resume from this file if it exists and checkpoint into it")
+    parser.add_argument("--checkpoint-every", type=int, default=600, help="ticks between checkpoints")
+    parser.add_argument("--ledger", help="directory for the full on-disk AICoin ledger")
+    args = parser.parse_args(argv)
+
+    sim = load_or_create(args.checkpoint, args.ledger, seed=args.seed, population=args.population,
+                         array_store=args.array_store, max_ties=args.max_ties)
+    publisher = SnapshotPublisher(sim, args.snapshot, every=args.every)
+    checkpointer = Checkpointer(sim, args.checkpoint, args.checkpoint_every) if args.checkpoint else None
+    engine = Engine(sim, interval=args.interval, publisher=publisher, checkpointer=checkpointer)
+    server = CommandServer(engine, args.snapshot, publisher)
+    server.start()
+    # Finish the current tick (and write the last checkpoint) instead of dying mid-tick
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: engine.stop())
+    try:
+        engine.run()
+    finally:
+        server.stop()
+        publisher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+"""Gossip — Spread of crime rumors over the friendship graph.
+
+The witnesses of an undetected crime start a rumor about it. On every
+gossip step (every 4th tick), each citizen on the rumor's frontier tells the
+friends who have not heard it yet. A friend here is a relation with score
+FRIEND_SCORE or more, and each such friend hears it with chance
+TELL_CHANCE. Whoever hears it thinks less of the perpetrator and joins the
+frontier.
+
+Citizens keep telling for TELL_STEPS steps after they hear a rumor. A rumor
+whose frontier runs dry has saturated and is retired, so a step only
+touches the friend lists of the current frontiers. The number of citizens
+who know a rumor is recorded after every step (its reach over time).
+"""
+
+import random
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+FRIEND_SCORE = 30
+TELL_CHANCE = 0.15
+TELL_STEPS = 3
+OPINION_HIT = -5
+
+
+@dataclass
+class Rumor:
+    crime_id: int
+    perpetrator_id: int
+    knowers: int
+    frontier: List[List[int]]  # [citizen_id, steps left to tell]
+    reach: List[List[int]]     # [tick, knowers] after each step
+
+    def to_dict(self, active: bool) -> dict:
+        return {
+            "crimeId": self.crime_id,
+            "active": active,
+            "knowers": self.knowers,
+            "reach": [{"tick": t, "knowers": k} for t, k in self.reach],
+        }
+
+
+class GossipEngine:
+    def __init__(self, rng: Optional[random.Random] = None, keep: int = 200):
+        self.rng = rng or random.Random()
+        self.active: Dict[int, Rumor] = {}  # crime_id → rumor still spreading
+        self.retired: deque = deque(maxlen=keep)  # saturated rumors, newest last
+        self.started: set = set()  # crime ids that already have a rumor
+
+    def step(self, tick: int, crimes: list, relationships):
+        """Start rumors for new gossip-worthy crimes, then advance every active rumor once."""
+        known = relationships.known_crimes
+        for crime in crimes:
+            if crime.id in self.started:
+                continue
+            self.started.add(crime.id)
+            for wid in crime.witnesses:
+                known[wid].add(crime.id)
+            self.active[crime.id] = Rumor(crime.id, crime.perpetrator_id, len(crime.witnesses),
+                                          [[wid, TELL_STEPS] for wid in crime.witnesses], [])
+        # A crime that has left the crime log can no longer come back as a target
+        self.started.intersection_update(c.id for c in crimes)
+        self.started.update(self.active)
+
+        for rumor in list(self.active.values()):
+            self._advance(rumor, tick, relationships)
+            if not rumor.frontier:
+                del self.active[rumor.crime_id]
+                self.retired.append(rumor)
+
+    def _advance(self, rumor: Rumor, tick: int, relationships):
+        rand = self.rng.random
+        known, ranked = relationships.known_crimes, relationships.ranked
+        crime_id, perp = rumor.crime_id, rumor.perpetrator_id
+        heard = []
+        for teller, _ in rumor.frontier:
+            # Rankings are best first, so the friends are a prefix
+            for neg_score, friend in ranked.get(teller, ()):
+                if -neg_score < FRIEND_SCORE:
+                    break
+                if friend == perp:
+                    continue
+                knows = known.get(friend)
+                if knows is not None and crime_id in knows:
+                    continue
+                if rand() < TELL_CHANCE:
+                    known[friend].add(crime_id)
+                    heard.append(friend)
+        for friend in heard:
+            # Hearing about crime lowers opinion of criminal
+            relationships.change_score(friend, perp, OPINION_HIT)
+        rumor.knowers += len(heard)
+        rumor.frontier = [[c, left - 1] for c, left in rumor.frontier if left > 1]
+        rumor.frontier += [[c, TELL_STEPS] for c in heard]
+        rumor.reach.append([tick, rumor.knowers])
+
+    def report(self, crime_id: int) -> Optional[dict]:
+        if crime_id in self.active:
+            return self.active[crime_id].to_dict(True)
+        for rumor in self.retired:
+            if rumor.crime_id == crime_id:
+                return rumor.to_dict(False)
+        return None
+
+    def to_state(self) -> dict:
+        return {
+            "active": [asdict(r) for r in self.active.values()],
+            "retired": [asdict(r) for r in self.retired],
+            "started": sorted(self.started),
+        }
+
+    def load_state(self, state: dict):
+        self.active = {r["crime_id"]: Rumor(**r) for r in state["active"]}
+        self.retired = deque((Rumor(**r) for r in state["retired"]), maxlen=self.retired.maxlen)
+        self.started = set(state["started"])
@@ -44,15 +44,16 @@ class Law:
 
 
 class Government:
-    def __init__(self):
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
         self.laws: List[Law] = [
             Law("消費税法", "消費税8%", status="enacted"),
             Law("教育基本法", "義務教育の保障と教育の機会均等", status="enacted"),
             Law("環境保護法", "環境汚染の防止と自然保護", status="enacted"),
         ]
         self.active_bill: Optional[Law] = None
-        self.parliament_ids: List[str] = []
-        self.prime_minister_id: Optional[str] = None
+        self.parliament_ids: List[int] = []
+        self.prime_minister_id: Optional[int] = None
         self.treasury: int = 50000
         self.election_day: int = 120
         self.next_proposal_tick: int = 0
@@ -80,7 +81,7 @@ class Government:
             event = self._propose_law(citizen_manager)
             if event:
                 events.append(event)
-            self.next_proposal_tick = world_time.tick + random.randint(150, 250)
+            self.next_proposal_tick = world_time.tick + self.rng.randint(150, 250)
 
         # Vote on active bill
         if self.active_bill and self.active_bill.status == "voting":
@@ -100,11 +101,11 @@ class Government:
             available = LAW_POOL[:]
         if not self.parliament_ids:
             return None
-        proposer_id = random.choice(self.parliament_ids)
+        proposer_id = self.rng.choice(self.parliament_ids)
         proposer = citizen_manager.citizens.get(proposer_id)
         if not proposer:
             return None
-        name, desc = random.choice(available)
+        name, desc = self.rng.choice(available)
         self._used_laws.add(name)
         self.active_bill = Law(name=name, description=desc, status="voting", proposed_by=proposer.name)
         self._vote_tick = 0  # vote immediately over next few ticks
@@ -123,7 +124,7 @@ class Government:
                 continue
             # Vote based on personality (agreeableness + some randomness)
             agree_chance = c.personality.get("agreeableness", 0.5) * 0.5 + 0.3
-            if random.random() < agree_chance:
+            if self.rng.random() < agree_chance:
                 bill.votes_for += 1
             else:
                 bill.votes_against += 1
@@ -143,7 +144,7 @@ class Government:
     def _hold_election(self, citizen_manager) -> List[str]:
         # Simple election: pick new PM from parliament
         if self.parliament_ids:
-            self.prime_minister_id = random.choice(self.parliament_ids)
+            self.prime_minister_id = self.rng.choice(self.parliament_ids)
             pm = citizen_manager.citizens.get(self.prime_minister_id)
             if pm:
                 return [f"🗳️ 選挙実施！{pm.name}が新しい総理大臣に就任"]
@@ -0,0 +1,68 @@
+"""Headless runner — fast-forward the simulation without the web server.
+
+Usage:
+    python headless.py --days 300
+    python headless.py --ticks 5000 --seed 42 --json
+    python headless.py --population 10000 --days 2 --phases
+"""
+
+import argparse
+import json
+import sys
+
+from simulation import Simulation
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run AICity headless, as fast as possible.")
+    parser.add_argument("--ticks", type=int, help="number of ticks to run")
+    parser.add_argument("--days", type=int, help="stop when this game-day is reached")
+    parser.add_argument("--until-tick", type=int, help="stop when this absolute tick is reached")
+    parser.add_argument("--seed", type=int, help="seed every random stream for a reproducible run")
+    parser.add_argument("--population", type=int, help="generate a synthetic city of this many citizens")
+    parser.add_argument("--array-store", action="store_true",
+                        help="keep citizen needs and movement in numpy arrays (requires numpy)")
+    parser.add_argument("--max-ties", type=int,
+                        help="bound relationship memory: decay, pruning and this many ties per citizen")
+    parser.add_argument("--quiet", action="store_true", help="no per-day lines")
+    parser.add_argument("--phases", action="store_true", help="print a per-phase timing table")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.ticks is None and args.days is None and args.until_tick is None:
+        parser.error("one of --ticks, --days or --until-tick is required")
+
+    sim = Simulation(seed=args.seed, population=args.population, array_store=args.array_store,
+                     max_ties=args.max_ties)
+
+    def on_day(entry: dict):
+        if args.quiet or args.json:
+            return
+        tps = entry["ticks"] / entry["seconds"] if entry["seconds"] > 0 else 0.0
+        print(f"day {entry['day']:>5}  {entry['seconds'] * 1000:8.1f} ms  "
+              f"{tps:9.0f} ticks/s  pop {entry['population']}", file=sys.stderr)
+
+    report = sim.run_batch(n_ticks=args.ticks, until_day=args.days,
+                           until_tick=args.until_tick, on_day=on_day)
+
+    report["phases"] = sim.profiler.to_dict()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        days = report["days"]
+        avg_day = sum(d["seconds"] for d in days) / max(len(days), 1)
+        print(f"{report['ticks']} ticks in {report['seconds']:.2f}s "
+              f"({report['ticks_per_sec']:.0f} ticks/s), "
+              f"day {report['end_day']}, avg {avg_day * 1000:.1f} ms/day, "
+              f"population {report['population']}")
+        if args.phases:
+            print(f"{'phase':<14}{'count':>8}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}{'max us':>10}")
+            for phase, m in report["phases"].items():
+                print(f"{phase:<14}{m['count']:>8}{m['p50'] * 1e6:>10.1f}{m['p95'] * 1e6:>10.1f}"
+                      f"{m['p99'] * 1e6:>10.1f}{m['max'] * 1e6:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
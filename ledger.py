@@ -0,0 +1,305 @@
+"""Ledger — Segmented, append-only on-disk log of AICoin transactions and blocks.
+
+Transactions are grouped into one block per tick (see aicoin.Block). Both
+are fixed-width records, so record `i` sits at a known offset and reads
+are plain slices of a memory map:
+
+    transaction: seq u64 | tick i64 | from i64 | to i64 | amount f64 | reason 32B (UTF-8, NUL-padded)
+    block:       height u64 | tick i64 | first seq u64 | count u32 | pad | prev hash 32B | merkle root 32B
+
+`from` and `to` are internal citizen ids, or SYSTEM / TREASURY for the
+non-citizen parties. A transaction's hash is the Merkle leaf hash of its
+record and a block's hash is the SHA-256 of its record, so neither is
+stored. Records go into segment files of `segment_records` each, named
+after the index of their first record:
+
+    <dir>/000000000000.seg, <dir>/000001048576.seg, ...   transactions
+    <dir>/000000000000.blk, ...                           blocks
+
+Each segment starts with a 64-byte header (magic, format version, record
+size, first index). Writes are batched: `TokenSystem` hands over a closed
+block and its transactions in one `append` call, which is one write() per
+segment. A torn record at the end of the last segment (crash mid-write) is
+cut off when the ledger is opened, and so are blocks whose transactions did
+not all make it to disk and transactions whose block never did.
+"""
+
+import mmap
+import os
+import struct
+from typing import Iterator, List, Optional
+
+import merkle
+from aicoin import BLOCK_RECORD, TX_RECORD, Block, Transaction
+
+MAGIC = b"AICLEDG\0"
+FORMAT_VERSION = 2
+HEADER_SIZE = 64
+_HEADER = struct.Struct("<8sIIQ")
+_PARTIES = struct.Struct("<qq")  # from, to at offset 16 of a transaction record
+_FIRST_SEQ = struct.Struct("<Q")  # at offset 16 of a block record
+
+
+class Segment:
+    def __init__(self, path: str, first: int, record_size: int):
+        self.path = path
+        self.first = first  # index of the first record
+        self.record_size = record_size
+        self.count = (os.path.getsize(path) - HEADER_SIZE) // record_size
+        self._map: Optional[mmap.mmap] = None
+
+    @classmethod
+    def create(cls, path: str, first: int, record_size: int) -> "Segment":
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, record_size, first).ljust(HEADER_SIZE, b"\0"))
+        return cls(path, first, record_size)
+
+    @classmethod
+    def open(cls, path: str, record_size: int, readonly: bool = False) -> "Segment":
+        with open(path, "rb") as f:
+            magic, version, size, first = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an AICity ledger segment")
+        if version != FORMAT_VERSION or size != record_size:
+            raise ValueError(f"{path} has ledger format {version}; this build reads format {FORMAT_VERSION}")
+        seg = cls(path, first, record_size)
+        if not readonly:
+            seg.resize(seg.count)  # drop a torn last record
+        return seg
+
+    def resize(self, count: int):
+        self.close()
+        self.count = count
+        whole = HEADER_SIZE + count * self.record_size
+        if os.path.getsize(self.path) != whole:
+            os.truncate(self.path, whole)
+
+    def view(self) -> mmap.mmap:
+        """Read-only map covering at least `count` records (remapped as the segment grows)."""
+        end = HEADER_SIZE + self.count * self.record_size
+        if self._map is None or len(self._map) < end:
+            self.close()
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                self._map = mmap.mmap(fd, end, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)  # the map keeps its own handle
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class Log:
+    """One kind of fixed-width record, split over segment files ending in `suffix`."""
+
+    def __init__(self, directory: str, suffix: str, record: struct.Struct, segment_records: int,
+                 readonly: bool = False):
+        self.directory = directory
+        self.suffix = suffix
+        self.record = record
+        self.segment_records = segment_records
+        names = sorted(n for n in os.listdir(directory) if n.endswith(suffix))
+        self.segments: List[Segment] = [Segment.open(os.path.join(directory, n), record.size, readonly)
+                                        for n in names]
+        self._fd: Optional[int] = None
+
+    def __len__(self) -> int:
+        last = self.segments[-1] if self.segments else None
+        return last.first + last.count if last else 0
+
+    def _tail(self) -> Segment:
+        """The segment to append to, starting a new one when the last is full."""
+        last = self.segments[-1] if self.segments else None
+        if last is None or last.count >= self.segment_records:
+            self._close_fd()
+            first = len(self)
+            last = Segment.create(os.path.join(self.directory, f"{first:012d}{self.suffix}"),
+                                  first, self.record.size)
+            self.segments.append(last)
+        if self._fd is None:
+            self._fd = os.open(last.path, os.O_WRONLY | os.O_APPEND)
+        return last
+
+    def append(self, records: List[bytes]):
+        i = 0
+        while i < len(records):
+            seg = self._tail()
+            batch = records[i:i + self.segment_records - seg.count]
+            os.write(self._fd, b"".join(batch))
+            seg.count += len(batch)
+            i += len(batch)
+
+    def sync(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+
+    def truncate(self, n: int):
+        """Drop every record from index `n` on."""
+        self._close_fd()
+        while self.segments and self.segments[-1].first >= n and self.segments[-1].first > 0:
+            seg = self.segments.pop()
+            seg.close()
+            os.remove(seg.path)
+        if self.segments and len(self) > n:
+            self.segments[-1].resize(n - self.segments[-1].first)
+
+    def _close_fd(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def close(self):
+        self._close_fd()
+        for seg in self.segments:
+            seg.close()
+
+    def locate(self, i: int):
+        """(map, offset) of record `i`."""
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        lo, hi = 0, len(self.segments) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.segments[mid].first <= i:
+                lo = mid
+            else:
+                hi = mid - 1
+        seg = self.segments[lo]
+        return seg.view(), HEADER_SIZE + (i - seg.first) * self.record.size
+
+    def records(self, first: int, count: int) -> List[bytes]:
+        size = self.record.size
+        out = []
+        while count > 0:
+            data, offset = self.locate(first)
+            n = min(count, (len(data) - offset) // size)
+            out += [data[o:o + size] for o in range(offset, offset + n * size, size)]
+            first += n
+            count -= n
+        return out
+
+
+def _unpack(data, offset: int) -> Transaction:
+    tx = Transaction.unpack(data, offset)
+    tx.tx_hash = merkle.leaf_hash(data[offset:offset + TX_RECORD.size]).hex()
+    return tx
+
+
+class Ledger:
+    """All transactions ever recorded, by seq (0, 1, 2, ...), and the blocks covering them.
+
+    With `readonly`, nothing on disk is touched (for readers such as the
+    auditor running next to the engine that is still appending).
+    """
+
+    def __init__(self, directory: str, segment_records: int = 1 << 20, readonly: bool = False):
+        self.directory = directory
+        if readonly:
+            self.txs = Log(directory, ".seg", TX_RECORD, segment_records, readonly=True)
+            self.blocks = Log(directory, ".blk", BLOCK_RECORD, segment_records, readonly=True)
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.txs = Log(directory, ".seg", TX_RECORD, segment_records)
+        self.blocks = Log(directory, ".blk", BLOCK_RECORD, segment_records)
+        # A crash between the two writes of `append` leaves transactions without their block,
+        # and a torn transaction record leaves its block incomplete
+        while self.height and self.block(self.height - 1).end > len(self.txs):
+            self.blocks.truncate(self.height - 1)
+        covered = self.block(self.height - 1).end if self.height else 0
+        if len(self.txs) > covered:
+            self.txs.truncate(covered)
+
+    def __len__(self) -> int:
+        return len(self.txs)
+
+    @property
+    def height(self) -> int:
+        return len(self.blocks)
+
+    # --- writing ---
+
+    def append(self, records: List[bytes], block: Block):
+        """Append a closed block and its packed transactions (continuing len(self) and height)."""
+        self.txs.append(records)
+        self.blocks.append([block.pack()])
+
+    def sync(self):
+        """Make everything appended so far durable."""
+        self.txs.sync()
+        self.blocks.sync()
+
+    def truncate(self, n: int, height: int):
+        """Drop every transaction from seq `n` and every block from `height` on
+        (e.g. those written after the last checkpoint)."""
+        from audit import forget_heads
+        forget_heads(self.directory, height)  # trusted heads past `height` no longer apply
+        self.blocks.truncate(height)
+        self.txs.truncate(n)
+
+    def close(self):
+        self.txs.close()
+        self.blocks.close()
+
+    # --- reading ---
+
+    def block(self, height: int) -> Block:
+        return Block.unpack(*self.blocks.locate(height))
+
+    def block_of(self, seq: int) -> Block:
+        """The block holding transaction `seq`."""
+        if not 0 <= seq < len(self):
+            raise IndexError(seq)
+        lo, hi = 0, self.height - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            data, offset = self.blocks.locate(mid)
+            if _FIRST_SEQ.unpack_from(data, offset + 16)[0] <= seq:
+                lo = mid
+            else:
+                hi = mid - 1
+        return self.block(lo)
+
+    def get(self, seq: int) -> Transaction:
+        return _unpack(*self.txs.locate(seq))
+
+    def newest(self, before: Optional[int] = None) -> Iterator[Transaction]:
+        """Transactions from seq `before - 1` (default: the last) back to the first."""
+        end = len(self) if before is None else min(before, len(self))
+        size = TX_RECORD.size
+        for seg in reversed(self.txs.segments):
+            if seg.first >= end:
+                continue
+            data = seg.view()
+            for i in range(min(end, seg.first + seg.count) - seg.first - 1, -1, -1):
+                yield _unpack(data, HEADER_SIZE + i * size)
+
+    def recent(self, limit: int = 50, before: Optional[int] = None) -> List[Transaction]:
+        out = []
+        for tx in self.newest(before):
+            if len(out) >= limit:
+                break
+            out.append(tx)
+        return out
+
+    def history(self, citizen_id: int, limit: int = 50, before: Optional[int] = None) -> List[Transaction]:
+        """Newest transactions to or from `citizen_id`."""
+        out = []
+        end = len(self) if before is None else min(before, len(self))
+        size = TX_RECORD.size
+        for seg in reversed(self.txs.segments):
+            if seg.first >= end:
+                continue
+            data = seg.view()
+            stop = min(end, seg.first + seg.count) - seg.first
+            # Only the two party fields are decoded while scanning
+            for i in range(stop - 1, -1, -1):
+                offset = HEADER_SIZE + i * size
+                tx_from, tx_to = _PARTIES.unpack_from(data, offset + 16)
+                if tx_from == citizen_id or tx_to == citizen_id:
+                    out.append(_unpack(data, offset))
+                    if len(out) >= limit:
+                        return out
+        return out
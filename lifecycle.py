@@ -1,13 +1,13 @@
 """Life & Death System — Aging, birth, death, marriage, divorce, sickness."""
 
 import random
-import uuid
 from typing import List, Dict, Optional
 from citizen import Citizen, AVATARS, WORK_LOCATIONS
 
 
 class LifecycleSystem:
-    def __init__(self):
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
         self.dead_citizens: List[dict] = []  # memorial records
         self.marriages_today: List[dict] = []
         self.births_today: List[dict] = []
@@ -36,7 +36,7 @@ class LifecycleSystem:
             # Old age (probability ramps after 70)
             if c.age > 70:
                 death_chance = (c.age - 70) * 0.003
-                if random.random() < death_chance:
+                if self.rng.random() < death_chance:
                     events.extend(self._kill(c, "老衰", citizen_manager, relationships))
                     died = True
             # Health = 0
@@ -44,15 +44,15 @@ class LifecycleSystem:
                 events.extend(self._kill(c, "病死", citizen_manager, relationships))
                 died = True
             # Random accident
-            if not died and random.random() < 0.0003:
+            if not died and self.rng.random() < 0.0003:
                 events.extend(self._kill(c, "事故死", citizen_manager, relationships))
                 died = True
             if died:
                 continue
 
             # --- Sickness ---
-            if random.random() < 0.008:
-                c.health = max(0, c.health - random.randint(10, 25))
+            if self.rng.random() < 0.008:
+                c.health = max(0, c.health - self.rng.randint(10, 25))
                 c.happiness = max(0, c.happiness - 5)
                 if c.health < 40:
                     events.append(f"🏥 {c.name}が体調を崩しています（健康: {c.health}）")
@@ -67,7 +67,7 @@ class LifecycleSystem:
             self._check_marriages(citizen_manager, relationships, events, news_callback)
 
         # --- Divorce ---
-        self._check_divorces(citizen_manager, events, news_callback)
+        self._check_divorces(citizen_manager, relationships, events, news_callback)
 
         # --- Birth ---
         self._check_births(citizen_manager, world_time, events, news_callback)
@@ -76,7 +76,7 @@ class LifecycleSystem:
         events = []
         self.dead_citizens.append({
             "name": c.name, "age": c.age, "cause": cause,
-            "role": c.role, "id": c.id,
+            "role": c.role, "id": c.uid,
         })
 
         # Mourn: family happiness drops drastically
@@ -99,35 +99,42 @@ class LifecycleSystem:
 
         # Remove from employer
         from economy import Economy  # avoid circular at module level
-        # Just remove from citizens dict
-        del citizen_manager.citizens[c.id]
+        # Just remove from citizens dict (and the location index)
+        widow_id = c.spouse_id
+        citizen_manager.remove(c.id)
+        if relationships:
+            relationships.refresh_candidates(c.id)  # no longer among the living
+            if widow_id:
+                relationships.refresh_candidates(widow_id)
         return events
 
     def _check_marriages(self, citizen_manager, relationships, events, news_callback):
         singles = [c for c in citizen_manager.citizens.values()
                    if c.spouse_id is None and c.age >= 20]
-        random.shuffle(singles)
+        self.rng.shuffle(singles)
+        order = {c.id: i for i, c in enumerate(singles)}
         paired = set()
 
         for c in singles:
             if c.id in paired:
                 continue
-            # Find best relationship partner who is also single
-            best_id, best_score = None, 50  # minimum score to marry
-            for other in singles:
-                if other.id == c.id or other.id in paired or other.gender == c.gender:
+            # Find best lover who is also single (ties go to the earlier one in `singles`)
+            best_id, best_score, best_pos = None, 50, 0  # minimum score to marry
+            for other_id in relationships.lovers_of(c.id):
+                pos = order.get(other_id)
+                if pos is None or other_id in paired or singles[pos].gender == c.gender:
                     continue
-                score = relationships.get_score(c.id, other.id)
-                rel_type = relationships.get_type(c.id, other.id)
-                if rel_type == "恋人" and score > best_score:
-                    best_score = score
-                    best_id = other.id
+                score = relationships.get_score(c.id, other_id)
+                if score > best_score or (best_id is not None and score == best_score and pos < best_pos):
+                    best_id, best_score, best_pos = other_id, score, pos
 
-            if best_id and random.random() < 0.15:
+            if best_id and self.rng.random() < 0.15:
                 partner = citizen_manager.citizens.get(best_id)
                 if partner:
                     c.spouse_id = partner.id
                     partner.spouse_id = c.id
+                    relationships.refresh_candidates(c.id)
+                    relationships.refresh_candidates(partner.id)
                     c.happiness = min(100, c.happiness + 20)
                     partner.happiness = min(100, partner.happiness + 20)
                     paired.add(c.id)
@@ -137,14 +144,17 @@ class LifecycleSystem:
                     events.append(headline)
                     news_callback(headline, "social")
 
-    def _check_divorces(self, citizen_manager, events, news_callback):
+    def _check_divorces(self, citizen_manager, relationships, events, news_callback):
         checked = set()
         for c in list(citizen_manager.citizens.values()):
             if c.spouse_id and c.spouse_id not in checked and c.id not in checked:
                 spouse = citizen_manager.citizens.get(c.spouse_id)
-                if spouse and c.happiness < 20 and spouse.happiness < 20 and random.random() < 0.05:
+                if spouse and c.happiness < 20 and spouse.happiness < 20 and self.rng.random() < 0.05:
                     c.spouse_id = None
                     spouse.spouse_id = None
+                    if relationships:
+                        relationships.refresh_candidates(c.id)
+                        relationships.refresh_candidates(spouse.id)
                     c.happiness = max(0, c.happiness - 10)
                     spouse.happiness = max(0, spouse.happiness - 10)
                     headline = f"💔 {c.name}と{spouse.name}が離婚しました"
@@ -162,13 +172,13 @@ class LifecycleSystem:
                 checked.add(c.id)
                 checked.add(spouse.id)
 
-                if c.happiness > 60 and spouse.happiness > 60 and random.random() < 0.01:
+                if c.happiness > 60 and spouse.happiness > 60 and self.rng.random() < 0.01:
                     # Determine parents
                     mother = c if c.gender == "女" else spouse
                     father = c if c.gender == "男" else spouse
 
                     # Baby!
-                    baby_gender = random.choice(["男", "女"])
+                    baby_gender = self.rng.choice(["男", "女"])
                     family_name = father.name[0]  # first kanji = family name
                     # try to get family name (first 1-2 chars)
                     for length in [3, 2, 1]:
@@ -180,16 +190,16 @@ class LifecycleSystem:
 
                     baby_names_m = ["太郎", "健", "翔", "蓮", "陽太", "悠人", "颯太"]
                     baby_names_f = ["花", "結衣", "さくら", "凛", "陽菜", "美咲", "愛"]
-                    given = random.choice(baby_names_m if baby_gender == "男" else baby_names_f)
+                    given = self.rng.choice(baby_names_m if baby_gender == "男" else baby_names_f)
                     baby_name = family_name + given
 
                     # Inherit personality with variation
                     baby_personality = {}
                     for trait in ["openness", "conscientiousness", "extraversion", "agreeableness", "neuroticism"]:
                         parent_avg = (mother.personality.get(trait, 0.5) + father.personality.get(trait, 0.5)) / 2
-                        baby_personality[trait] = max(0.1, min(0.95, parent_avg + random.uniform(-0.15, 0.15)))
+                        baby_personality[trait] = max(0.1, min(0.95, parent_avg + self.rng.uniform(-0.15, 0.15)))
 
-                    baby_id = str(uuid.uuid4())
+                    baby_id = citizen_manager.new_id()
                     baby = Citizen(
                         id=baby_id,
                         name=baby_name,
@@ -202,12 +212,12 @@ class LifecycleSystem:
                         health=100,
                         happiness=80,
                         hunger=10,
-                        parent_ids=[father.id, mother.id],
+                        parent_ids=(father.id, mother.id),
                     )
-                    baby.set_location(mother.home)
-                    citizen_manager.citizens[baby_id] = baby
-                    father.children_ids.append(baby_id)
-                    mother.children_ids.append(baby_id)
+                    baby.set_location(mother.home, self.rng)
+                    baby = citizen_manager.add(baby)
+                    father.children_ids += (baby_id,)
+                    mother.children_ids += (baby_id,)
 
                     self.births_today.append({"name": baby_name, "parents": [father.name, mother.name]})
                     headline = f"👶 {father.name}と{mother.name}に赤ちゃん「{baby_name}」が誕生！"
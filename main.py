@@ -2,30 +2,65 @@
 
 import os
 import asyncio
-import json
 from pathlib import Path
 from typing import Optional
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
 
-from simulation import Simulation
+from broadcast import BroadcastHub
+from commands import CommandError
+from engine import Engine, load_or_create
+from protocol import PROTOCOL_VERSION
+import wire
 
 app = FastAPI(title="AICity v2")
-sim = Simulation()
+SNAPSHOT_PATH = os.environ.get("AICITY_SNAPSHOT")
+LEDGER_DIR = os.environ.get("AICITY_LEDGER")  # full ledger dir (see ledger.py)
+if SNAPSHOT_PATH:
+    # One of several web workers in front of a separate engine process (see shared.py)
+    from shared import RemoteEngine
+    hub = BroadcastHub(None)
+    engine = RemoteEngine(SNAPSHOT_PATH, hub)
+else:
+    from checkpoint import Checkpointer
+    CHECKPOINT_PATH = os.environ.get("AICITY_CHECKPOINT")  # resume from / save to (see checkpoint.py)
+    max_ties = os.environ.get("AICITY_MAX_TIES")  # bounded relationship memory (see relationships.TieLimits)
+    sim = load_or_create(CHECKPOINT_PATH, LEDGER_DIR, max_ties=int(max_ties) if max_ties else None)
+    hub = BroadcastHub(sim)
+    engine = Engine(sim, hub,  # ticks on its own thread; see engine.py
+                    checkpointer=Checkpointer(sim, CHECKPOINT_PATH) if CHECKPOINT_PATH else None)
+
+_audit_lock = asyncio.Lock()
 
 TEMPLATE_PATH = Path(__file__).parent / "templates" / "index.html"
 
 
+def negotiate(request: Request, data, citizens: bool = False):
+    """JSON by default; msgpack when the Accept header asks for it (see wire.py)."""
+    if not wire.accepts_msgpack(request.headers.get("accept", "")):
+        return data
+    return Response(wire.pack(wire.table(data) if citizens else data), media_type=wire.MSGPACK)
+
+
+async def command(name: str, *args):
+    """Run one of commands.COMMANDS on the engine; its refusals become HTTP errors."""
+    try:
+        return await engine.command(name, *args)
+    except CommandError as e:
+        raise HTTPException(e.status, e.detail)
+
+
 @app.on_event("startup")
 async def startup():
-    asyncio.create_task(sim.run())
+    hub.loop = asyncio.get_running_loop()
+    engine.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    sim.stop()
+    engine.stop()
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -36,64 +71,87 @@ async def index():
 
 
 @app.get("/api/status")
-async def api_status():
-    return {
-        "status": "running",
-        "tick": sim.time.tick,
-        "population": len(sim.citizens.citizens),
-        "day": sim.time.day,
-        "deaths": len(sim.lifecycle.dead_citizens),
-        "imprisoned": len(sim.crime.imprisoned),
-    }
+async def api_status(request: Request):
+    return negotiate(request, dict(engine.snapshot.status, viewers=len(hub.subscribers)))
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def api_metrics():
+    """Per-phase tick timings in Prometheus text exposition format."""
+    return PlainTextResponse(engine.metrics(),
+                             media_type="text/plain; version=0.0.4")
 
 
 @app.get("/api/citizens")
-async def api_citizens():
-    return [c.to_dict(sim.citizens.citizens) for c in sim.citizens.citizens.values()]
+async def api_citizens(request: Request):
+    rows = engine.citizens()  # from the snapshot; the engine only builds it when asked
+    if rows is None:
+        rows = await command("citizens")
+    return negotiate(request, rows, citizens=True)
 
 
 @app.get("/api/government")
-async def api_government():
-    return sim.government.to_dict(sim.citizens)
+async def api_government(request: Request):
+    return negotiate(request, engine.snapshot.government)
 
 
 @app.get("/api/economy")
-async def api_economy():
-    return sim.economy.to_dict()
+async def api_economy(request: Request):
+    return negotiate(request, engine.snapshot.economy)
 
 
 # --- New endpoints ---
 
 @app.get("/api/crimes")
-async def api_crimes():
-    return sim.crime.get_recent_crimes(50)
+async def api_crimes(request: Request):
+    return negotiate(request, engine.snapshot.crimes)
+
+
+@app.get("/api/crimes/{crime_id}/gossip")
+async def api_crime_gossip(crime_id: str, request: Request):
+    """How far the rumor about an undetected crime has spread, step by step."""
+    return negotiate(request, await command("gossip", crime_id))
 
 
 @app.get("/api/ledger")
-async def api_ledger():
-    return sim.token.get_recent_transactions(50, sim.citizens)
+async def api_ledger(request: Request, before: Optional[int] = None, limit: int = Query(50, ge=1, le=500)):
+    """Newest transactions; `before` pages back through the full ledger by seq."""
+    if before is None and limit <= len(engine.snapshot.ledger):
+        return negotiate(request, engine.snapshot.ledger[:limit])
+    return negotiate(request, await command("ledger", before, limit))
+
+
+@app.get("/api/ledger/proof/{seq}")
+async def api_ledger_proof(seq: int, request: Request):
+    """Merkle inclusion proof of transaction `seq` in its block."""
+    return negotiate(request, await command("ledger_proof", seq))
+
+
+@app.post("/api/ledger/audit")
+async def api_ledger_audit(full: bool = False):
+    """Verify the on-disk ledger (see audit.py); only blocks after the last trusted head unless `full`."""
+    if not LEDGER_DIR:
+        raise HTTPException(404, "No on-disk ledger")
+    from audit import audit
+    async with _audit_lock:
+        report = await asyncio.get_running_loop().run_in_executor(None, audit, LEDGER_DIR, full)
+    return report.to_dict()
 
 
 @app.get("/api/wallet/{citizen_id}")
-async def api_wallet(citizen_id: str):
-    if citizen_id not in sim.citizens.citizens:
-        raise HTTPException(404, "Citizen not found")
-    return {
-        "citizen_id": citizen_id,
-        "name": sim.citizens.citizens[citizen_id].name,
-        "aic_balance": sim.token.get_balance(citizen_id),
-    }
+async def api_wallet(citizen_id: str, request: Request):
+    return negotiate(request, await command("wallet", citizen_id))
+
+
+@app.get("/api/wallet/{citizen_id}/history")
+async def api_wallet_history(citizen_id: str, request: Request, before: Optional[int] = None,
+                             limit: int = Query(50, ge=1, le=500)):
+    return negotiate(request, await command("wallet_history", citizen_id, before, limit))
 
 
 @app.get("/api/relationships/{citizen_id}")
-async def api_relationships(citizen_id: str):
-    if citizen_id not in sim.citizens.citizens:
-        raise HTTPException(404, "Citizen not found")
-    return {
-        "citizen_id": citizen_id,
-        "name": sim.citizens.citizens[citizen_id].name,
-        "relationships": sim.relationships.get_relationships_for(citizen_id, sim.citizens),
-    }
+async def api_relationships(citizen_id: str, request: Request):
+    return negotiate(request, await command("relationships", citizen_id))
 
 
 # --- Existing endpoints ---
@@ -106,11 +164,7 @@ class RegisterRequest(BaseModel):
 
 @app.post("/api/citizen/register")
 async def register_citizen(req: RegisterRequest):
-    c = sim.citizens.register_external(req.name, req.role, req.personality or {})
-    sim.token.wallets[c.id] = 100.0
-    sim.token.total_supply += 100.0
-    sim._add_news(f"🆕 新しい市民「{c.name}」が登録されました", "social")
-    return {"citizen_id": c.id, "api_key": c.api_key}
+    return await command("register", req.name, req.role, req.personality)
 
 
 class ActionRequest(BaseModel):
@@ -122,46 +176,47 @@ class ActionRequest(BaseModel):
 
 @app.post("/api/citizen/{citizen_id}/action")
 async def citizen_action(citizen_id: str, req: ActionRequest):
-    c = sim.citizens.citizens.get(citizen_id)
-    if not c or not c.is_external:
-        raise HTTPException(404, "Citizen not found")
-    if c.api_key != req.api_key:
-        raise HTTPException(403, "Invalid API key")
-
-    if req.action == "move" and req.target:
-        from world import LOCATION_MAP
-        if req.target in LOCATION_MAP:
-            c.set_target(req.target)
-            c.action = f"{LOCATION_MAP[req.target]['name']}へ移動中"
-            return {"status": "moving", "target": req.target}
-        raise HTTPException(400, "Invalid location")
-    elif req.action == "speak" and req.message:
-        c.speaking = req.message
-        c._speak_timer = 10
-        c.action = "発言中"
-        return {"status": "speaking"}
-    elif req.action == "work":
-        c.money += 100
-        c.hunger += 5
-        c.action = "働いている"
-        sim.token.reward(c.id, 1.0, "労働", sim.time.tick)
-        return {"status": "working", "money": c.money}
-
-    raise HTTPException(400, "Invalid action")
+    return await command("act", citizen_id, req.api_key, req.action, req.target, req.message)
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(ws: WebSocket):
+async def websocket_endpoint(ws: WebSocket, v: int = 1, topics: Optional[str] = None,
+                             fmt: str = Query("json", alias="format")):
+    """State stream. `?v=2` selects the keyframe + delta protocol,
+    `?topics=news,token` (or a "subscribe" message) narrows it (see protocol.py)
+    and `?format=msgpack` switches frames to binary (see wire.py). Control
+    messages from the client are always JSON text."""
     await ws.accept()
+    sub = hub.subscribe(min(v, PROTOCOL_VERSION), binary=fmt == "msgpack" and wire.available())
+    if topics is not None:
+        hub.change_subscription(sub, topics=[t for t in topics.split(",") if t])
+
+    async def pump():
+        while True:
+            payload = await sub.get()
+            if isinstance(payload, bytes):
+                await ws.send_bytes(payload)
+            else:
+                await ws.send_text(payload)
+
+    sender = asyncio.create_task(pump())
     try:
+        # Frames go out from `sender`; reading here notices disconnects right away
         while True:
-            state = sim.get_state()
-            await ws.send_text(json.dumps(state, ensure_ascii=False))
-            await asyncio.sleep(2)
+            msg = await ws.receive_json()
+            if not isinstance(msg, dict):
+                continue
+            if msg.get("type") == "resync":
+                hub.resync(sub)
+            elif msg.get("type") == "subscribe":
+                hub.change_subscription(sub, msg.get("topics"), msg.get("viewport"), msg.get("citizens"))
     except WebSocketDisconnect:
         pass
     except Exception:
         pass
+    finally:
+        sender.cancel()
+        hub.unsubscribe(sub)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+"""Merkle — Binary SHA-256 hash trees over the transactions of a ledger block.
+
+Leaves and inner nodes are hashed with different one-byte prefixes (as in
+RFC 6962), so a leaf can never pass for an inner node:
+
+    leaf = sha256(0x00 | record)        node = sha256(0x01 | left | right)
+
+An odd node at the end of a level is carried up unchanged rather than
+paired with itself. A proof is the list of sibling hashes from the leaf up
+to the root, each marked with the side it sits on.
+"""
+
+import hashlib
+from typing import List, Tuple
+
+EMPTY_ROOT = hashlib.sha256(b"").digest()
+
+_sha256 = hashlib.sha256
+
+
+def leaf_hash(record: bytes) -> bytes:
+    return _sha256(b"\0" + record).digest()
+
+
+def leaf_hashes(records: List[bytes]) -> List[bytes]:
+    """Leaf hashes of a whole block's records in one pass."""
+    sha256 = _sha256
+    return [sha256(b"\0" + r).digest() for r in records]
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return _sha256(b"\1" + left + right).digest()
+
+
+def _level_up(level: List[bytes]) -> List[bytes]:
+    up = [_sha256(b"\1" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        up.append(level[-1])
+    return up
+
+
+def root(leaves: List[bytes]) -> bytes:
+    """Root over already hashed leaves."""
+    if not leaves:
+        return EMPTY_ROOT
+    level = leaves
+    while len(level) > 1:
+        level = _level_up(level)
+    return level[0]
+
+
+def proof(leaves: List[bytes], index: int) -> List[Tuple[bool, bytes]]:
+    """Sibling path for leaf `index`: (sibling is on the left, sibling hash) per level."""
+    if not 0 <= index < len(leaves):
+        raise IndexError(index)
+    path = []
+    level = leaves
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append((sibling < index, level[sibling]))
+        level = _level_up(level)
+        index //= 2
+    return path
+
+
+def verify(leaf: bytes, path: List[Tuple[bool, bytes]], expected_root: bytes) -> bool:
+    h = leaf
+    for left, sibling in path:
+        h = node_hash(sibling, h) if left else node_hash(h, sibling)
+    return h == expected_root
@@ -0,0 +1,80 @@
+"""Metrics — Low-overhead per-phase tick profiler with Prometheus export."""
+
+import time
+from collections import deque
+from typing import Dict, List
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class TickProfiler:
+    """Keeps a rolling window of wall times for every named phase.
+
+    Recording is an append to a bounded deque plus two counter updates, so it
+    is cheap enough to leave on in production. Percentiles are only computed
+    when the metrics are read.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.samples: Dict[str, deque] = {}
+        self.counts: Dict[str, int] = {}
+        self.totals: Dict[str, float] = {}
+        self.maxima: Dict[str, float] = {}
+
+    def record(self, phase: str, seconds: float):
+        buf = self.samples.get(phase)
+        if buf is None:
+            buf = self.samples[phase] = deque(maxlen=self.window)
+            self.counts[phase] = 0
+            self.totals[phase] = 0.0
+            self.maxima[phase] = 0.0
+        buf.append(seconds)
+        self.counts[phase] += 1
+        self.totals[phase] += seconds
+        if seconds > self.maxima[phase]:
+            self.maxima[phase] = seconds
+
+    def lap(self, phase: str, since: float) -> float:
+        """Record the time elapsed since `since` and return the current clock."""
+        now = time.perf_counter()
+        self.record(phase, now - since)
+        return now
+
+    def percentiles(self, phase: str) -> Dict[float, float]:
+        ordered = sorted(self.samples.get(phase, ()))
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(q * len(ordered)))] for q in QUANTILES}
+
+    def to_dict(self) -> dict:
+        result = {}
+        for phase in list(self.samples):
+            pct = self.percentiles(phase)
+            result[phase] = {
+                "count": self.counts[phase],
+                "total": self.totals[phase],
+                "p50": pct[0.5],
+                "p95": pct[0.95],
+                "p99": pct[0.99],
+                "max": self.maxima[phase],
+            }
+        return result
+
+    def render_prometheus(self, prefix: str = "aicity") -> str:
+        name = f"{prefix}_phase_seconds"
+        lines: List[str] = [
+            f"# HELP {name} Wall time of simulation phases (rolling window of {self.window} samples).",
+            f"# TYPE {name} summary",
+        ]
+        for phase in list(self.samples):
+            for q, v in self.percentiles(phase).items():
+                lines.append(f'{name}{{phase="{phase}",quantile="{q}"}} {v:.9f}')
+            lines.append(f'{name}_sum{{phase="{phase}"}} {self.totals[phase]:.9f}')
+            lines.append(f'{name}_count{{phase="{phase}"}} {self.counts[phase]}')
+        lines.append(f"# HELP {name}_max Slowest observed run of each phase.")
+        lines.append(f"# TYPE {name}_max gauge")
+        for phase in list(self.samples):
+            lines.append(f'{name}_max{{phase="{phase}"}} {self.maxima[phase]:.9f}')
+        return "\n".join(lines) + "\n"
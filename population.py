@@ -0,0 +1,142 @@
+"""Population — Synthetic citizens, families and businesses for cities of any size.
+
+Everything is drawn from the same distributions as the hand-written 30-citizen
+city (CITIZEN_DEFS / BUSINESS_DEFS): role, gender, home and age mix, the
+share of citizens living in families, and the citizens-per-business ratio.
+"""
+
+import random
+from typing import Dict, List
+
+from citizen import Citizen, CitizenManager, CITIZEN_DEFS
+from economy import BUSINESS_DEFS
+
+FAMILY_NAMES = [
+    "田中", "鈴木", "佐藤", "中村", "山田", "高橋", "伊藤", "渡辺", "小林", "加藤",
+    "吉田", "山本", "松本", "井上", "木村", "斎藤", "山口", "森田", "藤田", "岡田",
+    "長谷川", "石井", "清水", "林", "池田", "橋本", "阿部", "前田", "小川", "後藤",
+]
+
+GIVEN_NAMES = {
+    "男": ["健一", "翔太", "一郎", "大輔", "蓮", "正義", "太郎", "誠", "隆", "武",
+          "浩二", "拓也", "剛", "健太", "勇", "太一", "陽太", "悠人", "颯太", "大和"],
+    "女": ["美咲", "花子", "愛", "由美", "幸子", "美月", "さくら", "真理", "恵", "麻衣",
+          "春香", "美穂", "あかり", "涼子", "結衣", "凛", "陽菜", "花", "葵", "彩"],
+}
+
+# Business type and name suffix for each role that can own a business
+OWNER_BUSINESS = {
+    "農民": ("農業", "農場"),
+    "商人": ("小売", "商店"),
+    "職人": ("製造", "工房"),
+    "シェフ": ("飲食", "食堂"),
+    "エンジニア": ("IT", "テック"),
+    "芸術家": ("芸術", "アトリエ"),
+}
+
+# Four 3-person families and eight businesses in the 30-citizen city
+FAMILY_SHARE = 4 / len(CITIZEN_DEFS)
+BUSINESS_SHARE = len(BUSINESS_DEFS) / len(CITIZEN_DEFS)
+PARENT_MIN_AGE = 35
+CHILD_MAX_AGE = 25
+
+
+def generate_population(citizen_manager: CitizenManager, size: int, rng: random.Random) -> List[dict]:
+    """Fill `citizen_manager` with `size` citizens and their families.
+
+    Returns business definitions (with `owner_id` set) for Economy.init_businesses.
+    """
+    family_of: List[str] = []
+    given_of: List[str] = []
+    made: List[Citizen] = []
+    for _ in range(size):
+        defn = rng.choice(CITIZEN_DEFS)
+        gender = defn["gender"]
+        personality = {
+            "openness": rng.uniform(0.2, 0.9),
+            "conscientiousness": rng.uniform(0.2, 0.9),
+            "extraversion": rng.uniform(0.2, 0.9),
+            "agreeableness": rng.uniform(0.2, 0.9),
+            "neuroticism": rng.uniform(0.2, 0.9),
+        }
+        c = Citizen(
+            id=citizen_manager.new_id(),
+            name="",
+            age=max(18, defn["age"] + rng.randint(-5, 5)),
+            gender=gender,
+            role=defn["role"],
+            home=defn["home"],
+            personality=personality,
+            money=rng.randint(2000, 8000),
+            health=rng.randint(70, 100),
+            happiness=rng.randint(50, 85),
+            hunger=rng.randint(10, 40),
+        )
+        c.set_location(c.home, rng)
+        family_of.append(rng.choice(FAMILY_NAMES))
+        given_of.append(rng.choice(GIVEN_NAMES[gender]))
+        made.append(c)
+
+    _form_families(made, family_of, size, rng)
+
+    for i, c in enumerate(made):
+        c.name = family_of[i] + given_of[i]
+        citizen_manager.add(c)
+
+    return _business_defs(made, family_of, size, rng)
+
+
+def _form_families(made: List[Citizen], family_of: List[str], size: int, rng: random.Random):
+    """Pair a husband, a wife and one child per family within the same home district."""
+    pools: Dict[tuple, List[int]] = {}
+    for i, c in enumerate(made):
+        if c.age >= PARENT_MIN_AGE:
+            pools.setdefault((c.home, c.gender), []).append(i)
+        elif c.age <= CHILD_MAX_AGE:
+            pools.setdefault((c.home, "child"), []).append(i)
+    for key in sorted(pools):
+        rng.shuffle(pools[key])
+
+    homes = sorted({c.home for c in made})
+    wanted = round(size * FAMILY_SHARE)
+    formed = 0
+    while formed < wanted:
+        progress = False
+        for home in homes:
+            men = pools.get((home, "男"), [])
+            women = pools.get((home, "女"), [])
+            kids = pools.get((home, "child"), [])
+            if formed >= wanted or not (men and women and kids):
+                continue
+            hi, wi, ki = men.pop(), women.pop(), kids.pop()
+            h, w, k = made[hi], made[wi], made[ki]
+            h.spouse_id = w.id
+            w.spouse_id = h.id
+            h.children_ids += (k.id,)
+            w.children_ids += (k.id,)
+            k.parent_ids = (h.id, w.id)
+            family_of[wi] = family_of[ki] = family_of[hi]
+            formed += 1
+            progress = True
+        if not progress:
+            break
+
+
+def _business_defs(made: List[Citizen], family_of: List[str], size: int, rng: random.Random) -> List[dict]:
+    """Pick business owners among citizens whose role can run a business."""
+    owners = [i for i, c in enumerate(made) if c.role in OWNER_BUSINESS]
+    rng.shuffle(owners)
+    wanted = min(len(owners), max(1, round(size * BUSINESS_SHARE)))
+    defs = []
+    taken: Dict[str, int] = {}
+    for i in owners[:wanted]:
+        c = made[i]
+        btype, suffix = OWNER_BUSINESS[c.role]
+        name = family_of[i] + suffix
+        # Business names double as employer keys, so keep them unique
+        n = taken.get(name, 0) + 1
+        taken[name] = n
+        if n > 1:
+            name = f"{name}{n}号店"
+        defs.append({"name": name, "type": btype, "owner": c.name, "owner_id": c.id})
+    return defs
@@ -0,0 +1,163 @@
+"""Protocol — Versioned keyframe + delta wire format for /ws.
+
+Version 1 is the original: every frame is the full `get_state()` payload.
+Version 2 sends one keyframe and then only what changed:
+
+    {"v": 2, "type": "keyframe", "seq": 41, "state": {...full state...}}
+    {"v": 2, "type": "delta", "seq": 42, "base": 41, "tick": ...,
+     "citizens": {"upd": [{"id": ..., <changed fields>}], "del": [ids]},
+     "patch": {...}}
+
+`citizens.upd` holds new citizens in full and, for existing ones, only the
+fields that changed (nested dicts are patched the same way). `patch` is a
+merge patch over the rest of the state: nested dicts are merged, other
+values replace, `"$del"` lists removed keys, and keyed lists (news, crimes,
+transactions, businesses) arrive as `{"$keys": [ordered keys], "$items": [new
+items, and merge patches of changed ones carrying their key]}`; `$keys` is left
+out when the keys and their order did not change. A client that sees `base` differ from the last `seq` it
+applied sends `{"type": "resync"}` and waits for the next keyframe.
+
+Either version can be narrowed with a subscription message:
+
+    {"type": "subscribe", "topics": ["news", "token"],
+     "viewport": [x0, y0, x1, y1], "citizens": [public ids]}
+
+`topics` picks sections of the state (see simulation.TOPICS; null means all)
+and `viewport` / `citizens` pick which citizens are sent (both null: all).
+A filtered protocol 2 viewer gets citizens that enter its selection in
+full and those that leave it in `citizens.del`. Changing the subscription
+triggers a fresh keyframe.
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+PROTOCOL_VERSION = 2
+
+_MISSING = object()
+
+
+_KEY_FIELDS = ("id", "hash", "name")
+
+
+def _key_field(item) -> Any:
+    """Field that keys an element of a keyed list (news/crimes have "id",
+    transactions "hash", businesses a unique "name")."""
+    if isinstance(item, dict):
+        for field in _KEY_FIELDS:
+            if field in item:
+                return field
+    return _MISSING
+
+
+def _item_key(item) -> Any:
+    field = _key_field(item)
+    return item[field] if field is not _MISSING else _MISSING
+
+
+def diff(old, new) -> Any:
+    """Merge patch that turns `old` into `new`, or _MISSING when they are equal."""
+    if old is new:
+        return _MISSING
+    if isinstance(old, dict) and isinstance(new, dict):
+        patch = {}
+        for k, v in new.items():
+            sub = diff(old.get(k, _MISSING), v)
+            if sub is not _MISSING:
+                patch[k] = sub
+        removed = [k for k in old if k not in new]
+        if removed:
+            patch["$del"] = removed
+        return patch if patch else _MISSING
+    if isinstance(old, list) and isinstance(new, list):
+        if old == new:
+            return _MISSING
+        keys = [_item_key(item) for item in new]
+        if new and _MISSING not in keys:
+            old_keys = [_item_key(item) for item in old]
+            before = dict(zip(old_keys, old))
+            items = []
+            for k, item in zip(keys, new):
+                prev = before.get(k, _MISSING)
+                if prev is _MISSING:
+                    items.append(item)
+                    continue
+                sub = diff(prev, item)
+                if sub is not _MISSING:
+                    sub[_key_field(item)] = k
+                    items.append(sub)
+            patch = {"$items": items}
+            if keys != old_keys:
+                patch["$keys"] = keys
+            return patch
+        return new
+    if old == new:
+        return _MISSING
+    return new
+
+
+class DeltaEncoder:
+    """Remembers the last published state and produces version 2 deltas against it."""
+
+    def __init__(self):
+        self.seq = 0
+        self.citizens: Dict[Any, dict] = {}
+        self.rest: Optional[dict] = None
+
+    def update(self, state: dict) -> dict:
+        """Advance to `state` and return the delta message from the previous one."""
+        self.seq += 1
+        citizens = {c["id"]: c for c in state.get("citizens", ())}
+        rest = {k: v for k, v in state.items() if k != "citizens"}
+
+        upd = []
+        for cid, c in citizens.items():
+            old = self.citizens.get(cid)
+            if old is None:
+                upd.append(c)
+                continue
+            patch = diff(old, c)
+            if patch is not _MISSING:
+                patch["id"] = cid
+                upd.append(patch)
+        removed = [cid for cid in self.citizens if cid not in citizens]
+
+        patch = diff(self.rest, rest) if self.rest is not None else rest
+        self.citizens, self.rest = citizens, rest
+        return {
+            "v": PROTOCOL_VERSION,
+            "type": "delta",
+            "seq": self.seq,
+            "base": self.seq - 1,
+            "tick": state.get("tick"),
+            "citizens": {"upd": upd, "del": removed},
+            "patch": patch if patch is not _MISSING else {},
+        }
+
+
+# State keys that belong to each topic; everything else is always sent
+TOPIC_KEYS = {"citizens": ("citizens", "conversations")}
+
+
+def topic_keys(topics) -> set:
+    keys = set()
+    for t in topics:
+        keys.update(TOPIC_KEYS.get(t, (t,)))
+    return keys
+
+
+def slice_state(state: dict, hidden: set, citizens: Optional[list] = None) -> dict:
+    """`state` without the `hidden` keys, with its citizen list replaced by `citizens`."""
+    out = {k: v for k, v in state.items() if k not in hidden}
+    if citizens is not None and "citizens" in out:
+        out["citizens"] = citizens
+    return out
+
+
+def keyframe(seq: int, state_json: str) -> str:
+    """Wrap an already-encoded full state as a version 2 keyframe (no re-encoding)."""
+    return f'{{"v":{PROTOCOL_VERSION},"type":"keyframe","seq":{seq},"state":{state_json}}}'
+
+
+def encode(message: dict) -> str:
+    return json.dumps(message, ensure_ascii=False)
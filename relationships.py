@@ -1,36 +1,215 @@
-"""Relationship System — Social bonds, romance, grudges, gossip."""
+"""Relationship System — Social bonds, romance, grudges, gossip (see gossip.py)."""
 
+import math
 import random
+from bisect import bisect_left, insort
+from itertools import chain
 from typing import Dict, List, Tuple, Optional
-from collections import defaultdict
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from gossip import GossipEngine
+
+try:
+    import numpy as np
+except ImportError:  # optional; meeting bonuses are then computed in a loop
+    np = None
+
+ROMANCE_SCORE = 60  # untyped pairs at or above this may start dating
+MEET_CHANCE = 0.1  # per pair of citizens at the same place, every 4 ticks
+_LOG_MISS = math.log(1.0 - MEET_CHANCE)
+_VECTOR_MIN = 64
+
+
+@dataclass
+class TieLimits:
+    """Bounded-memory mode: scores fade, weak acquaintances are forgotten and
+    nobody keeps more than `max_ties` ties. Family, lover and grudge ties are
+    exempt from all three."""
+    max_ties: int = 100    # per citizen; the weakest ties go first
+    every: int = 144       # ticks between passes (one game-day)
+    decay: int = 1         # points every score moves toward 0 per pass
+    prune_below: int = 2   # ties with |score| below this are dropped
+
+
+class Ranking:
+    """One citizen's ties as (-score, other_id), best first.
+
+    Kept as sorted buckets of at most 2 × LOAD entries, ordered end to end,
+    so that moving a tie costs a bisect over the bucket ends plus a shift
+    within one short bucket instead of a shift of the whole row. Reading the
+    best or worst ties only touches the buckets at that end.
+    """
+    LOAD = 256
+    __slots__ = ("buckets", "maxes")
+
+    def __init__(self, ordered: List[Tuple[int, int]] = ()):
+        n = self.LOAD
+        self.buckets = [ordered[i:i + n] for i in range(0, len(ordered), n)]
+        self.maxes = [b[-1] for b in self.buckets]
+
+    def move(self, old: Optional[Tuple[int, int]], new: Tuple[int, int]):
+        """Replace `old` (None: nothing) with `new`."""
+        buckets = self.buckets
+        if len(buckets) == 1:  # most rows: no bucket to find
+            b = buckets[0]
+            if old is not None:
+                del b[bisect_left(b, old)]
+            insort(b, new)
+            self.maxes[0] = b[-1]
+            if len(b) > 2 * self.LOAD:
+                self._split(0)
+            return
+        if old is not None:
+            self.remove(old)
+        self.add(new)
+
+    def add(self, item: Tuple[int, int]):
+        buckets, maxes = self.buckets, self.maxes
+        if not buckets:
+            buckets.append([item])
+            maxes.append(item)
+            return
+        i = 0 if len(buckets) == 1 else min(bisect_left(maxes, item), len(buckets) - 1)
+        b = buckets[i]
+        insort(b, item)
+        maxes[i] = b[-1]
+        if len(b) > 2 * self.LOAD:
+            self._split(i)
+
+    def _split(self, i: int):
+        b = self.buckets[i]
+        self.buckets.insert(i + 1, b[self.LOAD:])
+        del b[self.LOAD:]
+        self.maxes[i:i + 1] = [b[-1], self.buckets[i + 1][-1]]
+
+    def remove(self, item: Tuple[int, int]):
+        i = bisect_left(self.maxes, item)
+        b = self.buckets[i]
+        del b[bisect_left(b, item)]
+        if b:
+            self.maxes[i] = b[-1]
+        else:
+            del self.buckets[i], self.maxes[i]
+
+    def __len__(self) -> int:
+        return sum(map(len, self.buckets))
+
+    def __iter__(self):
+        return chain.from_iterable(self.buckets)
+
+    def __reversed__(self):
+        return chain.from_iterable(map(reversed, reversed(self.buckets)))
 
 
 class RelationshipSystem:
-    def __init__(self):
-        # (id_a, id_b) → score; always store with min(a,b) first
-        self.scores: Dict[Tuple[str, str], int] = {}
-        # (id_a, id_b) → type override
-        self.types: Dict[Tuple[str, str], str] = {}
+    def __init__(self, rng: Optional[random.Random] = None, limits: Optional[TieLimits] = None,
+                 citizens: Optional[dict] = None):
+        self.rng = rng or random.Random()
+        self.limits = limits  # None: ties are kept forever
+        self.citizens = citizens if citizens is not None else {}  # the live citizens, by id
+        # pair key → score; see _key
+        self.scores: Dict[int, int] = {}
+        # citizen_id → their ties, best first; kept in step with `scores`
+        self.ranked: Dict[int, Ranking] = defaultdict(Ranking)
+        # pair key → type override
+        self.types: Dict[int, str] = {}
+        # sorted untyped pair keys with score ≥ ROMANCE_SCORE between two living, unmarried
+        # citizens of different gender, and citizen_id → lover ids; kept in step with `scores`,
+        # `types` and marriages/deaths (see refresh_candidates) so romance and marriage only
+        # look at these
+        self.romance_candidates: List[int] = []
+        self.lovers: Dict[int, set] = defaultdict(set)
         # citizen_id → set of crime_ids they know about (gossip)
-        self.known_crimes: Dict[str, set] = defaultdict(set)
+        self.known_crimes: Dict[int, set] = defaultdict(set)
+        self.gossip = GossipEngine(self.rng)
         # citizen_id → {target_id: reason} grudges
-        self.grudges: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self.grudges: Dict[int, Dict[int, str]] = defaultdict(dict)
+
+    @staticmethod
+    def _key(a: int, b: int) -> int:
+        """Both citizen ids packed into one int, smaller id in the high bits."""
+        return (a << 32) | b if a < b else (b << 32) | a
+
+    @staticmethod
+    def _pair(key: int) -> Tuple[int, int]:
+        return key >> 32, key & 0xFFFFFFFF
+
+    def _put(self, k: int, a: int, b: int, val: int):
+        """Store a score and move the pair within both citizens' rankings."""
+        old = self.scores.get(k)
+        if old == val:
+            return
+        self.scores[k] = val
+        if val < ROMANCE_SCORE:
+            if old is not None and old >= ROMANCE_SCORE:
+                self._drop_candidate(k)
+        elif (old is None or old < ROMANCE_SCORE) and self._eligible(k, a, b):
+            insort(self.romance_candidates, k)
+        ranked = self.ranked
+        if old is None:
+            ranked[a].add((-val, b))
+            ranked[b].add((-val, a))
+        else:
+            ranked[a].move((-old, b), (-val, b))
+            ranked[b].move((-old, a), (-val, a))
 
-    def _key(self, a: str, b: str) -> Tuple[str, str]:
-        return (min(a, b), max(a, b))
+    def _eligible(self, k: int, a: int, b: int) -> bool:
+        """Whether an untyped pair could ever start dating, age aside."""
+        ca, cb = self.citizens.get(a), self.citizens.get(b)
+        return (k not in self.types and ca is not None and cb is not None and ca.gender != cb.gender
+                and ca.spouse_id is None and cb.spouse_id is None)
 
-    def get_score(self, a: str, b: str) -> int:
+    def _drop_candidate(self, k: int):
+        row = self.romance_candidates
+        i = bisect_left(row, k)
+        if i < len(row) and row[i] == k:
+            del row[i]
+
+    def refresh_candidates(self, citizen_id: int):
+        """Re-check a citizen's romance candidates after they married, divorced,
+        were widowed or died."""
+        for neg_score, other in self.ranked.get(citizen_id, ()):
+            if -neg_score < ROMANCE_SCORE:
+                break
+            k = self._key(citizen_id, other)
+            self._drop_candidate(k)
+            if self._eligible(k, citizen_id, other):
+                insort(self.romance_candidates, k)
+
+    def reindex(self):
+        """Rebuild the per-citizen rankings and the romance indexes from `scores` and `types`
+        (after loading them wholesale)."""
+        rows = defaultdict(list)
+        for k, score in self.scores.items():
+            a, b = self._pair(k)
+            rows[a].append((-score, b))
+            rows[b].append((-score, a))
+        self.ranked = defaultdict(Ranking)
+        for cid, row in rows.items():
+            row.sort()
+            self.ranked[cid] = Ranking(row)
+        self.romance_candidates = sorted(k for k, score in self.scores.items()
+                                         if score >= ROMANCE_SCORE and self._eligible(k, *self._pair(k)))
+        self.lovers = defaultdict(set)
+        for k, rtype in self.types.items():
+            if rtype == "恋人":
+                a, b = self._pair(k)
+                self.lovers[a].add(b)
+                self.lovers[b].add(a)
+
+    def get_score(self, a: int, b: int) -> int:
         return self.scores.get(self._key(a, b), 0)
 
-    def set_score(self, a: str, b: str, val: int):
-        self.scores[self._key(a, b)] = max(-100, min(100, val))
+    def set_score(self, a: int, b: int, val: int):
+        self._put(self._key(a, b), a, b, max(-100, min(100, val)))
 
-    def change_score(self, a: str, b: str, delta: int):
+    def change_score(self, a: int, b: int, delta: int):
         k = self._key(a, b)
         cur = self.scores.get(k, 0)
-        self.scores[k] = max(-100, min(100, cur + delta))
+        self._put(k, a, b, max(-100, min(100, cur + delta)))
 
-    def get_type(self, a: str, b: str) -> str:
+    def get_type(self, a: int, b: int) -> str:
         k = self._key(a, b)
         if k in self.types:
             return self.types[k]
@@ -45,46 +224,79 @@ class RelationshipSystem:
             return "隣人"
         return "知人"
 
-    def set_type(self, a: str, b: str, rtype: str):
-        self.types[self._key(a, b)] = rtype
+    def set_type(self, a: int, b: int, rtype: str):
+        k = self._key(a, b)
+        if self.types.get(k) == "恋人":
+            self.lovers[a].discard(b)
+            self.lovers[b].discard(a)
+        self.types[k] = rtype
+        self._drop_candidate(k)
+        if rtype == "恋人":
+            self.lovers[a].add(b)
+            self.lovers[b].add(a)
+
+    def lovers_of(self, citizen_id: int) -> set:
+        return self.lovers.get(citizen_id, set())
+
+    def _meetings(self, m: int) -> Tuple[List[int], List[int]]:
+        """The pairs i < j of an m-citizen crowd that meet, in (i, j) order.
+
+        Each pair meets with probability MEET_CHANCE. Rather than rolling for
+        all m(m-1)/2 pairs, the gap to the next meeting pair is drawn from
+        the matching geometric distribution, so the work is proportional to
+        the meetings (plus m) and the outcome has the same distribution.
+        """
+        rand, log = self.rng.random, math.log
+        total = m * (m - 1) // 2
+        firsts, seconds = [], []
+        i, row_start, row_len = 0, 0, m - 1  # pairs (i, i+1..m-1) are indices row_start.. of the row
+        t = int(log(1.0 - rand()) / _LOG_MISS)
+        while t < total:
+            while t >= row_start + row_len:
+                row_start += row_len
+                row_len -= 1
+                i += 1
+            firsts.append(i)
+            seconds.append(i + 1 + t - row_start)
+            t += 1 + int(log(1.0 - rand()) / _LOG_MISS)
+        return firsts, seconds
+
+    @staticmethod
+    def _meeting_bonuses(group: list, firsts: List[int], seconds: List[int]) -> List[int]:
+        """Score gain per meeting: 2 for coworkers (else 1), scaled by extraversion compatibility."""
+        ext = [c.personality.get("extraversion", 0.5) for c in group]
+        employers: Dict[str, int] = {}
+        emp = [employers.setdefault(c.employer, len(employers)) if c.employer else -1 for c in group]
+        if np is not None and len(firsts) >= _VECTOR_MIN:
+            a, b = np.array(firsts), np.array(seconds)
+            e, w = np.array(ext), np.array(emp)
+            base = np.where((w[a] >= 0) & (w[a] == w[b]), 2.0, 1.0)
+            bonus = np.floor(base * (1.0 - np.abs(e[a] - e[b])) + 0.5).astype(np.int64)
+            return np.maximum(bonus, 1).tolist()
+        return [max(1, int((2 if emp[i] >= 0 and emp[i] == emp[j] else 1) * (1.0 - abs(ext[i] - ext[j])) + 0.5))
+                for i, j in zip(firsts, seconds)]
 
     def tick(self, world_time, citizen_manager, crime_system, news_callback):
         if world_time.tick % 4 != 0:
             return
 
-        citizens = list(citizen_manager.citizens.values())
-        # Group by location
-        by_loc: Dict[str, list] = defaultdict(list)
-        for c in citizens:
-            if c.location == c.target_location:
-                by_loc[c.location].append(c)
-
         # Same-location interaction: small relationship boost
-        for loc_id, group in by_loc.items():
-            if len(group) < 2:
+        for loc_id, occupants in citizen_manager.index.arrived.items():
+            if len(occupants) < 2:
                 continue
-            for i in range(len(group)):
-                for j in range(i + 1, len(group)):
-                    a, b = group[i], group[j]
-                    if random.random() < 0.1:
-                        # Coworker bonus
-                        bonus = 1
-                        if a.employer and a.employer == b.employer:
-                            bonus = 2
-                        # Personality compatibility
-                        compat = 1.0 - abs(a.personality.get("extraversion", 0.5) - b.personality.get("extraversion", 0.5))
-                        bonus = int(bonus * compat + 0.5)
-                        self.change_score(a.id, b.id, max(1, bonus))
+            group = list(occupants.values())
+            firsts, seconds = self._meetings(len(group))
+            for i, j, bonus in zip(firsts, seconds, self._meeting_bonuses(group, firsts, seconds)):
+                self.change_score(group[i].id, group[j].id, bonus)
 
         # Romance: high relationship → lover → potential marriage handled by lifecycle
-        for (a_id, b_id), score in list(self.scores.items()):
-            if score >= 60 and self._key(a_id, b_id) not in self.types:
-                ca = citizen_manager.citizens.get(a_id)
-                cb = citizen_manager.citizens.get(b_id)
-                if ca and cb and ca.gender != cb.gender and ca.spouse_id is None and cb.spouse_id is None:
-                    if ca.age >= 18 and cb.age >= 18 and random.random() < 0.05:
-                        self.set_type(a_id, b_id, "恋人")
-                        news_callback(f"💕 {ca.name}と{cb.name}が交際を始めました", "social")
+        citizens = citizen_manager.citizens
+        for key in list(self.romance_candidates):  # set_type drops the pair from the list
+            a_id, b_id = self._pair(key)
+            ca, cb = citizens[a_id], citizens[b_id]
+            if ca.age >= 18 and cb.age >= 18 and self.rng.random() < 0.05:
+                self.set_type(a_id, b_id, "恋人")
+                news_callback(f"💕 {ca.name}と{cb.name}が交際を始めました", "social")
 
         # Crime impact on relationships
         if crime_system:
@@ -93,50 +305,116 @@ class RelationshipSystem:
                     self.change_score(crime.perpetrator_id, crime.victim_id, -20)
                     self.grudges[crime.victim_id][crime.perpetrator_id] = crime.crime_type
 
-            # Gossip: witnesses spread crime knowledge to friends
-            for crime in crime_system.get_gossip_targets():
-                for wid in crime.witnesses:
-                    self.known_crimes[wid].add(crime.id)
-                    # Spread to friends
-                    for (a, b), score in list(self.scores.items()):
-                        if score >= 30:
-                            friend_id = b if a == wid else (a if b == wid else None)
-                            if friend_id and random.random() < 0.15:
-                                self.known_crimes[friend_id].add(crime.id)
-                                # Hearing about crime lowers opinion of criminal
-                                self.change_score(friend_id, crime.perpetrator_id, -5)
-
-    def get_relationships_for(self, citizen_id: str, citizen_manager) -> List[dict]:
+            # Gossip: witnesses spread crime knowledge to friends, and on from there
+            self.gossip.step(world_time.tick, crime_system.get_gossip_targets(), self)
+
+        if self.limits and world_time.tick % self.limits.every == 0:
+            self.bound(citizen_manager, crime_system)
+
+    def _protected(self, k: int, a: int, b: int, citizens) -> bool:
+        """Family, lovers and grudges are never faded or forgotten."""
+        if k in self.types:
+            return True
+        ca = citizens[a]
+        if ca.spouse_id == b or b in ca.parent_ids or b in ca.children_ids:
+            return True
+        return b in self.grudges.get(a, ()) or a in self.grudges.get(b, ())
+
+    def bound(self, citizen_manager, crime_system=None) -> int:
+        """One bounded-memory pass (see TieLimits); returns how many ties were dropped.
+
+        Ties with someone who has died go too, as does what the dead knew and
+        held against others, so the stored graph only ever covers the living.
+        """
+        lim = self.limits
+        citizens = citizen_manager.citizens
+        before = len(self.scores)
+        kept: Dict[int, int] = {}
+        loose: Dict[int, int] = {}  # unprotected part of `kept`
+        for k, score in self.scores.items():
+            a, b = k >> 32, k & 0xFFFFFFFF
+            if a not in citizens or b not in citizens:
+                continue
+            if self._protected(k, a, b, citizens):
+                kept[k] = score
+                continue
+            score = max(0, score - lim.decay) if score > 0 else min(0, score + lim.decay)
+            if abs(score) >= lim.prune_below:
+                kept[k] = loose[k] = score
+
+        degree = Counter()
+        for k in kept:
+            degree[k >> 32] += 1
+            degree[k & 0xFFFFFFFF] += 1
+        crowded = {cid for cid, d in degree.items() if d > lim.max_ties}
+        if crowded:
+            ties = defaultdict(list)  # crowded citizen → [(|score|, key)] of loose ties
+            for k, score in loose.items():
+                for cid in (k >> 32, k & 0xFFFFFFFF):
+                    if cid in crowded:
+                        ties[cid].append((abs(score), k))
+            for cid in sorted(crowded):
+                row = sorted(ties[cid])
+                i = 0
+                while degree[cid] > lim.max_ties and i < len(row):
+                    k = row[i][1]
+                    i += 1
+                    if k in kept:
+                        del kept[k]
+                        degree[k >> 32] -= 1
+                        degree[k & 0xFFFFFFFF] -= 1
+
+        self.scores = kept
+        self.types = {k: t for k, t in self.types.items() if k >> 32 in citizens and k & 0xFFFFFFFF in citizens}
+        self.grudges = defaultdict(dict, {
+            victim: {perp: reason for perp, reason in held.items() if perp in citizens}
+            for victim, held in self.grudges.items() if victim in citizens
+        })
+        live_crimes = set(self.gossip.active)
+        if crime_system:
+            live_crimes.update(c.id for c in crime_system.crimes)
+        known_crimes = defaultdict(set)
+        for cid, known in self.known_crimes.items():
+            if cid in citizens and not known.isdisjoint(live_crimes):
+                known_crimes[cid] = known & live_crimes
+        self.known_crimes = known_crimes
+        self.reindex()
+        return before - len(self.scores)
+
+    def get_relationships_for(self, citizen_id: int, citizen_manager) -> List[dict]:
+        """Top 20 living relations by score, read off the citizen's ranking."""
         result = []
-        for (a, b), score in self.scores.items():
-            other_id = None
-            if a == citizen_id:
-                other_id = b
-            elif b == citizen_id:
-                other_id = a
-            if other_id:
-                other = citizen_manager.citizens.get(other_id)
-                if other:
-                    result.append({
-                        "citizenId": other_id,
-                        "name": other.name,
-                        "score": score,
-                        "type": self.get_type(citizen_id, other_id),
-                    })
-        result.sort(key=lambda x: -x["score"])
-        return result[:20]
-
-    def get_summary_for(self, citizen_id: str, citizen_manager) -> dict:
+        for neg_score, other_id in self.ranked.get(citizen_id, ()):
+            other = citizen_manager.citizens.get(other_id)
+            if other:
+                result.append({
+                    "citizenId": other.uid,
+                    "name": other.name,
+                    "score": -neg_score,
+                    "type": self.get_type(citizen_id, other_id),
+                })
+                if len(result) >= 20:
+                    break
+        return result
+
+    def get_summary_for(self, citizen_id: int, citizen_manager) -> dict:
         rels = self.get_relationships_for(citizen_id, citizen_manager)
         friends = [r for r in rels if r["score"] >= 40]
-        enemies = [r for r in rels if r["score"] <= -30]
         lover = [r for r in rels if r["type"] == "恋人"]
+        # Enemies are the tail of the ranking, worst first
+        citizens = citizen_manager.citizens
+        enemies = []
+        for neg_score, other_id in reversed(self.ranked.get(citizen_id, ())):
+            if -neg_score > -30:
+                break
+            if other_id in citizens:
+                enemies.append(citizens[other_id])
         return {
             "friends": len(friends),
             "enemies": len(enemies),
             "lover": lover[0]["name"] if lover else None,
             "topFriend": friends[0]["name"] if friends else None,
-            "worstEnemy": enemies[0]["name"] if enemies else None,
+            "worstEnemy": enemies[0].name if enemies else None,
         }
 
     def init_family_bonds(self, citizen_manager):
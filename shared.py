@@ -0,0 +1,516 @@
+"""Shared — Engine-to-web-worker snapshots in a memory-mapped file.
+
+One engine process (`python engine.py --snapshot PATH`) owns the world. After
+every tick it writes a bundle of pre-encoded blobs (REST views, the citizen
+list, the full WebSocket state, the protocol 2 delta, metrics) into PATH. Web
+workers started with `AICITY_SNAPSHOT=PATH` map the same file and serve
+`/api/*` and `/ws` straight from those bytes, so any number of uvicorn workers
+see one city. Commands (registrations, actions, per-citizen reads) go back to
+the engine over a Unix socket next to the file.
+
+Workers also report their demand over that socket: the selections of their
+WebSocket viewers and whether `/api/citizens` was read. The engine builds the
+WebSocket state only while some worker has a viewer, with just the topics and
+citizens they selected, and the citizen list only when it was asked for.
+
+File layout (little-endian):
+
+    header  "AICSNAP\\0", layout version u32, active slot u32,
+            2 × slot {offset u64, capacity u64, length u64, seq u64}
+    slots   two payload regions (a double buffer)
+
+The writer always fills the slot readers are *not* using, then flips
+`active`. Each slot is guarded like a seqlock: its seq is zeroed before the
+payload is rewritten and set to a new value afterwards, so a reader that
+copied a slot while it changed sees a different seq and simply reads again.
+A payload that outgrows its slot is moved to a larger region at the end of
+the file; readers remap when an offset lies beyond their mapping.
+"""
+
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+from multiprocessing.connection import Client, Listener
+from threading import Condition, Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+import protocol
+from broadcast import Frame, Selection, select
+from commands import COMMANDS, CommandError
+from engine import Snapshot
+from metrics import TickProfiler
+
+MAGIC = b"AICSNAP\0"
+LAYOUT_VERSION = 1
+HEADER_SIZE = 4096
+_HEAD = struct.Struct("<8sII")
+_SLOT = struct.Struct("<QQQQ")  # offset, capacity, length, seq
+_SEQ = struct.Struct("<Q")
+_SLOT_AT = (_HEAD.size, _HEAD.size + _SLOT.size)
+_SEQ_AT = tuple(at + 24 for at in _SLOT_AT)
+_ACTIVE_AT = 12
+DEMAND = "$demand"  # command name workers report their viewers under
+
+# Bundle: u32 count, then per blob {u16 name length, name, u64 offset, u64 length}, then the blobs
+_COUNT = struct.Struct("<I")
+_NAME = struct.Struct("<H")
+_SPAN = struct.Struct("<QQ")
+
+
+def pack_bundle(blobs: Dict[str, bytes]) -> bytes:
+    table = [_COUNT.pack(len(blobs))]
+    names = [name.encode() for name in blobs]
+    offset = _COUNT.size + sum(_NAME.size + len(n) + _SPAN.size for n in names)
+    for n, blob in zip(names, blobs.values()):
+        table.append(_NAME.pack(len(n)) + n + _SPAN.pack(offset, len(blob)))
+        offset += len(blob)
+    return b"".join(table) + b"".join(blobs.values())
+
+
+def unpack_bundle(payload: bytes) -> Dict[str, memoryview]:
+    view = memoryview(payload)
+    (count,) = _COUNT.unpack_from(payload, 0)
+    pos = _COUNT.size
+    blobs = {}
+    for _ in range(count):
+        (n,) = _NAME.unpack_from(payload, pos)
+        name = bytes(view[pos + _NAME.size:pos + _NAME.size + n]).decode()
+        pos += _NAME.size + n
+        offset, length = _SPAN.unpack_from(payload, pos)
+        pos += _SPAN.size
+        blobs[name] = view[offset:offset + length]
+    return blobs
+
+
+class SnapshotWriter:
+    def __init__(self, path: str, capacity: int = 1 << 20):
+        # Built under a temporary name and renamed into place: a restarted
+        # engine gets a fresh file, and readers of the old one notice the swap
+        tmp = path + ".tmp"
+        self.fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(self.fd, HEADER_SIZE + 2 * capacity)
+        self.mm = mmap.mmap(self.fd, HEADER_SIZE + 2 * capacity)
+        self.slots = [[HEADER_SIZE, capacity, 0, 0], [HEADER_SIZE + capacity, capacity, 0, 0]]
+        self.active = 0
+        self.seq = 0
+        for i in range(2):
+            self._store_slot(i)
+        _HEAD.pack_into(self.mm, 0, MAGIC, LAYOUT_VERSION, self.active)
+        os.replace(tmp, path)
+
+    def _store_slot(self, i: int):
+        _SLOT.pack_into(self.mm, _SLOT_AT[i], *self.slots[i])
+
+    def write(self, payload: bytes) -> int:
+        """Publish `payload` as the new current snapshot; returns its seq."""
+        i = 1 - self.active
+        slot = self.slots[i]
+        slot[3] = 0  # readers of this slot now know it is being rewritten
+        self._store_slot(i)
+        if len(payload) > slot[1]:
+            slot[0] = len(self.mm)
+            slot[1] = max(2 * slot[1], len(payload))
+            self.mm.resize(slot[0] + slot[1])
+        self.mm[slot[0]:slot[0] + len(payload)] = payload
+        self.seq += 1
+        slot[2] = len(payload)
+        self._store_slot(i)  # still with seq 0
+        slot[3] = self.seq
+        _SEQ.pack_into(self.mm, _SEQ_AT[i], self.seq)  # a single aligned store, last
+        self.active = i
+        struct.pack_into("<I", self.mm, _ACTIVE_AT, i)
+        return self.seq
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+
+class SnapshotReader:
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.mm = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+        magic, version, _ = _HEAD.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            raise ValueError(f"{path} is not an AICity snapshot (layout {LAYOUT_VERSION})")
+
+    def replaced(self) -> bool:
+        """Whether a restarted engine has put a new file at our path."""
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self.fd).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _remap(self):
+        self.mm.close()
+        self.mm = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+
+    def read(self, since: int = 0) -> Optional[Tuple[int, bytes]]:
+        """The current (seq, payload), or None if nothing newer than `since` is published."""
+        while True:
+            (active,) = struct.unpack_from("<I", self.mm, _ACTIVE_AT)
+            # seq is read first and again last; whatever lies between belongs to it
+            (seq,) = _SEQ.unpack_from(self.mm, _SEQ_AT[active])
+            offset, _, length, _ = _SLOT.unpack_from(self.mm, _SLOT_AT[active])
+            if seq == 0:
+                if not any(_SEQ.unpack_from(self.mm, at)[0] for at in _SEQ_AT):
+                    return None  # nothing published yet
+                continue  # the writer lapped us; `active` has moved on
+            if seq <= since:
+                return None
+            if offset + length > len(self.mm):
+                self._remap()
+                continue
+            payload = self.mm[offset:offset + length]
+            if _SEQ.unpack_from(self.mm, _SEQ_AT[active])[0] == seq:
+                return seq, payload
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+
+class SnapshotPublisher:
+    """Engine side: publishes each tick's views to shared memory.
+
+    Only cheap work happens on the engine thread: the views are captured
+    there, and the WebSocket state is built when some worker has a viewer
+    (see `set_demand`), with the topics and citizens they selected. Diffing,
+    JSON encoding and the write happen on a background thread, the way
+    `Checkpointer` writes its file. While a frame is still being encoded no
+    new one is built; the views of a tick that comes before the background
+    thread got to the previous one replace them.
+    """
+
+    def __init__(self, sim, path: str, every: int = 2, demand_ttl: float = 5.0):
+        self.sim = sim
+        self.every = every  # ticks between WebSocket frames
+        self.demand_ttl = demand_ttl  # seconds before a silent worker's viewers are dropped
+        self.writer = SnapshotWriter(path)
+        self.encoder = protocol.DeltaEncoder()
+        self._demand: Dict[str, Tuple[float, List[Selection]]] = {}
+        self._demand_lock = Lock()
+        self._last_tick: Optional[int] = None
+        # Handed to the background thread: the newest (snapshot, state or None)
+        self._job: Optional[tuple] = None
+        self._framing = False  # a state is waiting or being encoded
+        self._closed = False
+        self._ready = Condition()
+        # Last encodings, repeated in every bundle until replaced
+        self._state = b""
+        self._delta = b""
+        self._citizens = b"null"
+        self._citizens_tick: Optional[int] = None
+        self._thread = Thread(target=self._run, name="aicity-publisher", daemon=True)
+        self._thread.start()
+
+    def set_demand(self, worker: str, viewers: List[dict]):
+        """Record the selections of one worker's WebSocket viewers (from any thread)."""
+        with self._demand_lock:
+            if viewers:
+                self._demand[worker] = (time.monotonic(), [Selection(**v) for v in viewers])
+            else:
+                self._demand.pop(worker, None)
+
+    def _viewers(self) -> List[Selection]:
+        expired = time.monotonic() - self.demand_ttl
+        with self._demand_lock:
+            for worker in [w for w, (at, _) in self._demand.items() if at < expired]:
+                del self._demand[worker]  # that worker stopped reporting
+            return [sel for _, sels in self._demand.values() for sel in sels]
+
+    def publish(self, snapshot: Snapshot):
+        """Called on the engine thread after each tick."""
+        tick = self.sim.time.tick
+        state = None
+        with self._ready:
+            framing = self._framing
+        if not framing and (self._last_tick is None or tick - self._last_tick >= self.every):
+            viewers = self._viewers()
+            if viewers:
+                self._last_tick = tick
+                topics, citizens = select(viewers, self.sim.citizens.citizens.values())
+                state = self.sim.get_state(topics, citizens)
+        with self._ready:
+            if state is None and self._job is not None:
+                state = self._job[1]  # keep a frame the background thread has not taken yet
+            self._job = (snapshot, state)
+            self._framing = self._framing or state is not None
+            self._ready.notify()
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while self._job is None and not self._closed:
+                    self._ready.wait()
+                if self._job is None:
+                    return
+                job, self._job = self._job, None
+            try:
+                self._write(*job)
+            finally:
+                if job[1] is not None:
+                    with self._ready:
+                        self._framing = False
+
+    def _write(self, snapshot: Snapshot, state: Optional[dict]):
+        prof = self.sim.profiler
+        if state is not None:
+            start = time.perf_counter()
+            delta = self.encoder.update(state)
+            start = prof.lap("ws_diff", start)
+            self._state = json.dumps(state, ensure_ascii=False).encode()
+            start = prof.lap("ws_encode", start)
+            self._delta = protocol.encode(delta).encode()
+            prof.lap("ws_encode_delta", start)
+        if snapshot.citizens_tick != self._citizens_tick:
+            start = time.perf_counter()
+            self._citizens = json.dumps(snapshot.citizens, ensure_ascii=False).encode()
+            self._citizens_tick = snapshot.citizens_tick
+            prof.lap("citizens_encode", start)
+
+        def js(obj) -> bytes:
+            return json.dumps(obj, ensure_ascii=False).encode()
+
+        self.writer.write(pack_bundle({
+            "meta": js({"tick": snapshot.tick, "day": snapshot.day, "frame": self.encoder.seq,
+                        "citizensTick": self._citizens_tick}),
+            "status": js(snapshot.status),
+            "government": js(snapshot.government),
+            "economy": js(snapshot.economy),
+            "crimes": js(snapshot.crimes),
+            "ledger": js(snapshot.ledger),
+            "citizens": self._citizens,
+            "metrics": prof.render_prometheus().encode(),
+            "state": self._state,
+            "delta": self._delta,
+        }))
+
+    def close(self):
+        """Write what is still pending, then close the file."""
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+        self._thread.join()
+        self.writer.close()
+
+
+def _auth_key(path: str, create: bool = False) -> bytes:
+    key_path = path + ".key"
+    if create:
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(32))
+    with open(key_path, "rb") as f:
+        return f.read()
+
+
+class CommandServer:
+    """Engine side: runs commands from web workers on the engine thread.
+
+    Messages are JSON (never pickled): ["name", [args]] in, ["ok", result] or
+    ["error", status, detail] out. A worker's demand report (DEMAND, with
+    [worker, viewer selections, citizens read]) is answered right away,
+    without waiting for the engine thread.
+    """
+
+    def __init__(self, engine, path: str, publisher: Optional[SnapshotPublisher] = None):
+        self.engine = engine
+        self.publisher = publisher
+        self.address = path + ".sock"
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener = Listener(self.address, family="AF_UNIX", authkey=_auth_key(path, create=True))
+
+    def start(self):
+        Thread(target=self._accept, name="aicity-commands", daemon=True).start()
+
+    def stop(self):
+        self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return  # closed
+            except Exception:
+                continue  # failed authentication
+            Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            try:
+                name, args = json.loads(conn.recv_bytes())
+            except (EOFError, OSError, ValueError):
+                return
+            fn = COMMANDS.get(name)
+            if name == DEMAND:
+                self._demand(*args)
+                reply = ["ok", None]
+            elif fn is None:
+                reply = ["error", 400, f"Unknown command {name}"]
+            else:
+                try:
+                    reply = ["ok", self.engine.call(lambda: fn(self.engine.sim, *args)).result()]
+                except CommandError as e:
+                    reply = ["error", e.status, e.detail]
+                except Exception:
+                    reply = ["error", 500, "Internal error"]
+            conn.send_bytes(json.dumps(reply, ensure_ascii=False).encode())
+
+    def _demand(self, worker: str, viewers: List[dict], citizens: bool):
+        if self.publisher is not None:
+            self.publisher.set_demand(worker, viewers)
+        if citizens:
+            self.engine.citizens_wanted = True
+
+
+class SharedFrame(Frame):
+    """A frame read from shared memory: served as-is, decoded only if a filtered viewer needs it."""
+
+    def __init__(self, seq: int, full: str, delta: str, profiler):
+        self.seq = seq
+        self._profiler = profiler
+        self._encoded = {("full", False): full, ("delta", False): delta}
+        self._updates = None
+        self._grid = None
+        self._state: Optional[dict] = None
+        self._delta: Optional[dict] = None
+        self._citizens: Optional[dict] = None
+
+    @property
+    def state(self) -> dict:
+        if self._state is None:
+            self._state = json.loads(self._encoded[("full", False)])
+        return self._state
+
+    @property
+    def delta_msg(self) -> dict:
+        if self._delta is None:
+            self._delta = json.loads(self._encoded[("delta", False)])
+        return self._delta
+
+    @property
+    def citizens(self) -> dict:
+        if self._citizens is None:
+            self._citizens = {c["id"]: c for c in self.state.get("citizens", ())}
+        return self._citizens
+
+
+class RemoteEngine:
+    """Web worker side: the `Engine` interface main.py uses, backed by shared memory."""
+
+    def __init__(self, path: str, hub, poll: float = 0.1, heartbeat: float = 1.0):
+        self.path = path
+        self.hub = hub
+        self.poll = poll
+        self.heartbeat = heartbeat  # seconds between demand reports while viewers stay the same
+        self.reader: Optional[SnapshotReader] = None
+        self.snapshot: Optional[Snapshot] = None
+        self.profiler = TickProfiler()  # this worker's own encoding times
+        self.citizens_wanted = False  # /api/citizens was read since the last report
+        self._worker = str(os.getpid())
+        self._reported: Optional[List[dict]] = None
+        self._reported_at = 0.0
+        self._seq = 0
+        self._frame = 0
+        self._citizens_tick: Optional[int] = None
+        self._citizens_json = b"null"
+        self._citizens: Optional[list] = None
+        self._metrics = ""
+        self._task: Optional[asyncio.Task] = None
+
+    def refresh(self) -> bool:
+        """Pick up the engine's latest snapshot; returns whether there was a new one."""
+        if self.reader is not None and self.reader.replaced():
+            self.reader.close()
+            self.reader = None
+            self._seq = 0
+        if self.reader is None:
+            if not os.path.exists(self.path):
+                return False
+            self.reader = SnapshotReader(self.path)
+        got = self.reader.read(self._seq)
+        if got is None:
+            return False
+        self._seq, payload = got
+        blobs = unpack_bundle(payload)
+
+        def js(name):
+            return json.loads(bytes(blobs[name]))
+
+        meta = js("meta")
+        self.snapshot = Snapshot(tick=meta["tick"], day=meta["day"], status=js("status"),
+                                 government=js("government"), economy=js("economy"),
+                                 crimes=js("crimes"), ledger=js("ledger"))
+        self._metrics = bytes(blobs["metrics"]).decode()
+        if meta["citizensTick"] != self._citizens_tick:
+            self._citizens_tick = meta["citizensTick"]
+            self._citizens_json = bytes(blobs["citizens"])
+            self._citizens = None  # decoded when first read
+        if meta["frame"] != self._frame and len(blobs["state"]):
+            self._frame = meta["frame"]
+            frame = SharedFrame(meta["frame"], bytes(blobs["state"]).decode(),
+                                bytes(blobs["delta"]).decode(), self.profiler)
+            self.hub.latest = frame
+            self.hub._deliver(frame)
+        return True
+
+    async def report(self):
+        """Tell the engine what this worker's viewers selected and whether citizens were read."""
+        viewers = list({json.dumps(v, sort_keys=True): v
+                        for v in (sub.to_dict() for sub in self.hub.subscribers)}.values())
+        wanted = self.citizens_wanted
+        now = time.monotonic()
+        if viewers == self._reported and not wanted and (not viewers or now - self._reported_at < self.heartbeat):
+            return
+        try:
+            await self.command(DEMAND, self._worker, viewers, wanted)
+        except Exception:
+            return  # the engine is down or restarting; report again next time
+        self._reported, self._reported_at = viewers, now
+        if wanted:
+            self.citizens_wanted = False
+
+    async def _follow(self):
+        while True:
+            self.refresh()
+            await self.report()
+            await asyncio.sleep(self.poll)
+
+    def start(self):
+        self.refresh()
+        self._task = asyncio.get_running_loop().create_task(self._follow())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.reader is not None:
+            self.reader.close()
+
+    def metrics(self) -> str:
+        return self._metrics
+
+    def citizens(self) -> Optional[list]:
+        """The engine's last published citizen list (None until first built); asks for a fresher one."""
+        self.citizens_wanted = True
+        if self._citizens is None:
+            self._citizens = json.loads(self._citizens_json)
+        return self._citizens
+
+    def _call(self, name: str, args) -> object:
+        with Client(self.path + ".sock", family="AF_UNIX", authkey=_auth_key(self.path)) as conn:
+            conn.send_bytes(json.dumps([name, list(args)], ensure_ascii=False).encode())
+            reply = json.loads(conn.recv_bytes())
+        if reply[0] == "error":
+            raise CommandError(reply[1], reply[2])
+        return reply[1]
+
+    async def command(self, name: str, *args) -> object:
+        """Run a named command on the engine process (see commands.py)."""
+        return await asyncio.get_running_loop().run_in_executor(None, self._call, name, args)
@@ -1,7 +1,7 @@
 """Simulation — Main game loop tying everything together."""
 
-import asyncio
-from typing import List, Dict
+import time
+from typing import List, Dict, Iterable, Optional, Callable
 from collections import deque
 
 from world import WorldTime, LOCATIONS
@@ -10,71 +10,102 @@ from government import Government
 from economy import Economy
 from crime import CrimeSystem
 from lifecycle import LifecycleSystem
-from relationships import RelationshipSystem
+from relationships import RelationshipSystem, TieLimits
 from aicoin import TokenSystem
+from metrics import TickProfiler
+from rng import RandomStreams
+from population import generate_population
+
+# Sections of get_state() a viewer can subscribe to (time, stats and locations are always sent)
+TOPICS = ("citizens", "news", "crimes", "economy", "government", "token")
 
 
 class Simulation:
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None, population: Optional[int] = None,
+                 array_store: bool = False, max_ties: Optional[int] = None):
+        # One independent random stream per subsystem; a seed makes runs reproducible
+        self.streams = RandomStreams(seed)
+        self.rng = self.streams.stream("simulation")
         self.time = WorldTime()
-        self.citizens = CitizenManager()
-        self.government = Government()
-        self.economy = Economy()
-        self.crime = CrimeSystem()
-        self.lifecycle = LifecycleSystem()
-        self.relationships = RelationshipSystem()
-        self.token = TokenSystem()
+        self.citizens = CitizenManager(self.streams.stream("citizen"), self.streams.stream("ids"),
+                                       populate=population is None, array_store=array_store)
+        self.government = Government(self.streams.stream("government"))
+        self.economy = Economy(self.streams.stream("economy"))
+        self.crime = CrimeSystem(self.streams.stream("crime"), self.streams.stream("crime_ids"))
+        self.lifecycle = LifecycleSystem(self.streams.stream("lifecycle"))
+        # max_ties bounds the relationship graph's memory (see TieLimits)
+        self.relationships = RelationshipSystem(self.streams.stream("relationships"),
+                                                TieLimits(max_ties) if max_ties else None,
+                                                self.citizens.citizens)
+        self.token = TokenSystem(self.streams.stream("token"))
         self.news: deque = deque(maxlen=50)
         self.event_log: deque = deque(maxlen=50)
-        self.running = False
+        self._news_id = 0
+        self.profiler = TickProfiler()
 
-        # Initialize systems
+        # Initialize systems (population=N replaces the 30 hand-written citizens)
+        business_defs = None
+        if population is not None:
+            business_defs = generate_population(self.citizens, population, self.streams.stream("population"))
         self.government.init_parliament(self.citizens)
-        self.economy.init_businesses(self.citizens)
+        self.economy.init_businesses(self.citizens, business_defs)
         self.relationships.init_family_bonds(self.citizens)
         self.token.init_wallets(self.citizens)
 
     def tick(self):
         """One simulation tick = 10 game minutes."""
+        prof = self.profiler
+        tick_start = t = time.perf_counter()
         self.time.advance(10)
-        self.time.maybe_change_weather()
+        self.time.maybe_change_weather(self.streams.stream("world"))
 
         # Skip movement/actions for imprisoned citizens
         for c in self.citizens.citizens.values():
             if self.crime.is_imprisoned(c.id):
                 c.action = "服役中"
                 c.location = "police"
+                self.citizens.index.update(c)
                 continue
+        t = prof.lap("prison", t)
 
         # Move citizens
         self.citizens.update_movement(self.time.hour)
+        t = prof.lap("movement", t)
         self.citizens.update_needs()
+        t = prof.lap("needs", t)
 
         # Conversations (every few ticks)
         if self.time.tick % 3 == 0:
             self.citizens.generate_conversations()
+            t = prof.lap("conversations", t)
 
         # Government
         gov_events = self.government.tick(self.time, self.citizens)
         for e in gov_events:
             self._add_news(e, "politics")
+        t = prof.lap("government", t)
 
         # Economy (criminal record affects employment)
         econ_events = self.economy.tick(self.time, self.citizens)
         for e in econ_events:
             self._add_news(e, "economy")
+        t = prof.lap("economy", t)
 
         # Crime system
         self.crime.tick(self.time, self.citizens, self._add_news)
+        t = prof.lap("crime", t)
 
         # Lifecycle (aging, death, birth, marriage)
         self.lifecycle.tick(self.time, self.citizens, self.relationships, self._add_news)
+        t = prof.lap("lifecycle", t)
 
         # Relationships
         self.relationships.tick(self.time, self.citizens, self.crime, self._add_news)
+        t = prof.lap("relationships", t)
 
         # Token system
         self.token.tick(self.time, self.citizens, self.government, self._add_news)
+        t = prof.lap("token", t)
 
         # Random life events
         if self.time.tick % 20 == 0:
@@ -83,19 +114,26 @@ class Simulation:
         # Criminal record employment penalty (periodic)
         if self.time.tick % 50 == 0:
             self._criminal_employment_check()
+        t = prof.lap("events", t)
+
+        # This tick's transactions become one block (and one write to the on-disk ledger)
+        self.token.close_block(self.time.tick)
+        t = prof.lap("ledger", t)
+        prof.record("tick", t - tick_start)
 
     def _criminal_employment_check(self):
         """Citizens with criminal records have trouble keeping/finding jobs."""
         for c in self.citizens.citizens.values():
             if self.crime.has_criminal_record(c.id) and c.employer:
-                import random
-                if random.random() < 0.1:
+                if self.rng.random() < 0.1:
                     c.employer = ""
                     c.salary = 0
                     self._add_news(f"📉 {c.name}が前科により解雇されました", "social")
 
     def _add_news(self, text: str, news_type: str = "general"):
+        self._news_id += 1
         entry = {
+            "id": self._news_id,
             "time": f"{self.time.hour:02d}:{self.time.minute:02d}",
             "text": text,
             "type": news_type,
@@ -104,7 +142,6 @@ class Simulation:
         self.event_log.appendleft(entry)
 
     def _random_life_event(self):
-        import random
         events = [
             ("🎉 {name}さんが昇進しました！", "social"),
             ("🏥 {name}さんが体調を崩しました", "social"),
@@ -115,26 +152,25 @@ class Simulation:
             ("🌸 神社でお祭りが開催中", "culture"),
             ("🎨 {name}さんの展覧会が好評", "culture"),
         ]
-        template, etype = random.choice(events)
+        template, etype = self.rng.choice(events)
         citizens = list(self.citizens.citizens.values())
         if not citizens:
             return
-        c = random.choice(citizens)
+        c = self.rng.choice(citizens)
         text = template.replace("{name}", c.name)
         self._add_news(text, etype)
 
-    def get_state(self) -> dict:
-        """Full state snapshot for WebSocket."""
+    def get_state(self, topics: Optional[Iterable[str]] = None,
+                  citizens: Optional[Iterable] = None) -> dict:
+        """State snapshot for WebSocket.
+
+        `topics` limits the snapshot to those TOPICS (default: all) and
+        `citizens` to a subset of citizens (default: everyone); time, stats
+        and locations are always included.
+        """
+        start = time.perf_counter()
+        topics = TOPICS if topics is None else set(topics)
         all_citizens = list(self.citizens.citizens.values())
-        citizen_list = []
-        for c in all_citizens:
-            d = c.to_dict(self.citizens.citizens)
-            # Enrich with new system data
-            d["aic_balance"] = self.token.get_balance(c.id)
-            d["criminal_record"] = self.crime.has_criminal_record(c.id)
-            d["is_imprisoned"] = self.crime.is_imprisoned(c.id)
-            d["relationships_summary"] = self.relationships.get_summary_for(c.id, self.citizens)
-            citizen_list.append(d)
 
         locations = [{"id": l["id"], "name": l["name"], "x": l["x"], "y": l["y"],
                       "type": l["type"], "icon": l["icon"]} for l in LOCATIONS]
@@ -144,17 +180,10 @@ class Simulation:
         avg_health = sum(c.health for c in all_citizens) / max(len(all_citizens), 1)
         avg_wealth = sum(c.money for c in all_citizens) / max(len(all_citizens), 1)
 
-        return {
+        state = {
             "tick": self.time.tick,
             "time": self.time.to_dict(),
             "locations": locations,
-            "citizens": citizen_list,
-            "conversations": self.citizens.conversations,
-            "government": self.government.to_dict(self.citizens),
-            "economy": self.economy.to_dict(),
-            "crimes": self.crime.get_recent_crimes(20),
-            "token": self.token.to_dict(self.citizens),
-            "news": list(self.news)[:20],
             "stats": {
                 "population": len(all_citizens),
                 "externalCitizens": ext_count,
@@ -167,13 +196,83 @@ class Simulation:
                 "totalCrimes": len(self.crime.crimes),
             },
         }
+        if "citizens" in topics:
+            citizen_list = []
+            for c in (all_citizens if citizens is None else citizens):
+                d = c.to_dict(self.citizens.citizens)
+                # Enrich with new system data
+                d["aic_balance"] = self.token.get_balance(c.id)
+                d["criminal_record"] = self.crime.has_criminal_record(c.id)
+                d["is_imprisoned"] = self.crime.is_imprisoned(c.id)
+                d["relationships_summary"] = self.relationships.get_summary_for(c.id, self.citizens)
+                citizen_list.append(d)
+            state["citizens"] = citizen_list
+            state["conversations"] = self.citizens.conversations
+        if "government" in topics:
+            state["government"] = self.government.to_dict(self.citizens)
+        if "economy" in topics:
+            state["economy"] = self.economy.to_dict()
+        if "crimes" in topics:
+            state["crimes"] = self.crime.get_recent_crimes(20, self.citizens)
+        if "token" in topics:
+            state["token"] = self.token.to_dict(self.citizens)
+        if "news" in topics:
+            state["news"] = list(self.news)[:20]
+        self.profiler.lap("get_state", start)
+        return state
+
+    def run_batch(self, n_ticks: Optional[int] = None, until_day: Optional[int] = None,
+                  until_tick: Optional[int] = None,
+                  on_day: Optional[Callable[[dict], None]] = None) -> dict:
+        """Run ticks back-to-back (no sleeping) until any stop condition is met.
+
+        Returns a timing report with sustained ticks/sec and the wall time
+        spent on every game-day that was entered during the batch.
+        """
+        if n_ticks is None and until_day is None and until_tick is None:
+            raise ValueError("run_batch needs n_ticks, until_day or until_tick")
 
-    async def run(self):
-        """Main simulation loop — 1 tick per second."""
-        self.running = True
-        while self.running:
+        start_tick = self.time.tick
+        days: List[dict] = []
+        day = self.time.day
+        day_ticks = 0
+        day_start = start = time.perf_counter()
+
+        def close_day(now: float):
+            entry = {"day": day, "ticks": day_ticks, "seconds": now - day_start,
+                     "population": len(self.citizens.citizens)}
+            days.append(entry)
+            if on_day:
+                on_day(entry)
+
+        while True:
+            done = self.time.tick - start_tick
+            if n_ticks is not None and done >= n_ticks:
+                break
+            if until_tick is not None and self.time.tick >= until_tick:
+                break
+            if until_day is not None and self.time.day >= until_day:
+                break
             self.tick()
-            await asyncio.sleep(1)
+            day_ticks += 1
+            if self.time.day != day:
+                now = time.perf_counter()
+                close_day(now)
+                day, day_ticks, day_start = self.time.day, 0, now
+
+        end = time.perf_counter()
+        if day_ticks:
+            close_day(end)
 
-    def stop(self):
-        self.running = False
+        elapsed = end - start
+        ticks = self.time.tick - start_tick
+        return {
+            "ticks": ticks,
+            "seconds": elapsed,
+            "ticks_per_sec": ticks / elapsed if elapsed > 0 else 0.0,
+            "start_tick": start_tick,
+            "end_tick": self.time.tick,
+            "end_day": self.time.day,
+            "population": len(self.citizens.citizens),
+            "days": days,
+        }
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from aicoin import TX_RECORD
+from audit import audit
+from ledger import HEADER_SIZE, Ledger
+from simulation import Simulation
+
+
+@pytest.fixture
+def directory(tmp_path):
+    sim = Simulation(seed=5, population=150)
+    sim.token.attach(Ledger(str(tmp_path)))
+    sim.run_batch(200)
+    sim.token.sync()
+    sim.token.archive.close()
+    return str(tmp_path)
+
+
+def test_intact_ledger_is_verified_in_full(directory):
+    report = audit(directory, full=True, workers=1)
+    assert report.ok
+    assert report.verified_blocks == report.height > 4
+    assert report.verified_transactions == report.transactions
+
+
+@pytest.mark.parametrize("bad", [0, 4, -1])
+def test_tampered_block_counts_only_the_blocks_before_it(directory, bad):
+    ledger = Ledger(directory, readonly=True)
+    bad %= ledger.height
+    block = ledger.block(bad)
+    path = ledger.txs.segments[0].path
+    ledger.close()
+    with open(path, "r+b") as f:  # change the amount of the block's last transaction
+        f.seek(HEADER_SIZE + (block.end - 1) * TX_RECORD.size + 32)
+        f.write(b"\x01")
+
+    report = audit(directory, full=True, workers=1)
+    assert not report.ok
+    assert report.bad_height == bad
+    assert report.verified_blocks == bad
+    assert report.verified_transactions == block.first_seq
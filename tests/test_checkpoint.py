@@ -0,0 +1,56 @@
+import pytest
+
+import checkpoint
+from simulation import Simulation
+
+
+def city(ticks: int) -> Simulation:
+    sim = Simulation(seed=3, population=150)
+    sim.run_batch(ticks)
+    return sim
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_restored_city_goes_on_like_the_uninterrupted_one(tmp_path, compress):
+    path = str(tmp_path / "city.ckpt")
+    uninterrupted = city(40)
+    checkpoint.write(path, checkpoint.capture(uninterrupted), compress)
+    restored = checkpoint.load(path)
+    assert checkpoint.capture(restored) == checkpoint.capture(uninterrupted)
+
+    uninterrupted.run_batch(60)
+    restored.run_batch(60)
+    assert restored.time.tick == uninterrupted.time.tick == 100
+    assert checkpoint.capture(restored) == checkpoint.capture(uninterrupted)
+    assert restored.get_state() == uninterrupted.get_state()
+
+
+@pytest.fixture
+def saved(tmp_path):
+    path = tmp_path / "city.ckpt"
+    checkpoint.write(str(path), checkpoint.capture(city(10)))
+    return path
+
+
+@pytest.mark.parametrize("keep", [0, 10, 20, 0.5, -1])
+def test_truncated_file_is_rejected(saved, keep):
+    data = saved.read_bytes()
+    saved.write_bytes(data[:int(len(data) * keep) if isinstance(keep, float) else keep])
+    with pytest.raises(ValueError):
+        checkpoint.read(str(saved))
+
+
+# Flags, section count, a section name, its length, a payload, the checksum
+@pytest.mark.parametrize("at", [10, 14, 20, 30, 0.5, -3])
+def test_corrupt_file_is_rejected(saved, at):
+    data = bytearray(saved.read_bytes())
+    data[int(len(data) * at) if isinstance(at, float) else at] ^= 0x01
+    saved.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        checkpoint.read(str(saved))
+
+
+def test_other_files_are_rejected(saved):
+    saved.write_bytes(b"not a checkpoint at all")
+    with pytest.raises(ValueError, match="not an AICity checkpoint"):
+        checkpoint.read(str(saved))
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+import checkpoint
+from aicoin import TX_RECORD
+from audit import audit, read_heads
+from engine import load_or_create
+from ledger import Ledger
+from simulation import Simulation
+
+
+def run(directory: str, ticks: int) -> Simulation:
+    """A city keeping its ledger in `directory`, in segments of 64 records."""
+    sim = Simulation(seed=5, population=150)
+    sim.token.attach(Ledger(directory, segment_records=64))
+    sim.run_batch(ticks)
+    sim.token.sync()
+    return sim
+
+
+def test_segment_cut_mid_record(tmp_path):
+    directory = str(tmp_path)
+    sim = run(directory, 200)
+    height, total = sim.token.archive.height, len(sim.token.archive)
+    last = sim.token.archive.block(height - 1)
+    assert height > 1 and len(sim.token.archive.txs.segments) > 1
+    sim.token.archive.close()
+
+    # A crash mid-write: the last transaction record is only half on disk
+    seg = sim.token.archive.txs.segments[-1].path
+    os.truncate(seg, os.path.getsize(seg) - TX_RECORD.size // 2)
+
+    ledger = Ledger(directory, segment_records=64)
+    # The torn record goes, and with it the rest of its block, which is no longer complete
+    assert ledger.height == height - 1
+    assert len(ledger) == total - last.count == ledger.block(ledger.height - 1).end
+    ledger.close()
+    report = audit(directory, full=True, workers=1)
+    assert report.ok, report.error
+    assert (report.height, report.transactions) == (height - 1, total - last.count)
+
+
+def test_block_cut_mid_record(tmp_path):
+    directory = str(tmp_path)
+    sim = run(directory, 200)
+    height = sim.token.archive.height
+    previous = sim.token.archive.block(height - 2)
+    sim.token.archive.close()
+
+    seg = sim.token.archive.blocks.segments[-1].path
+    os.truncate(seg, os.path.getsize(seg) - 1)
+
+    ledger = Ledger(directory, segment_records=64)
+    # The torn block goes, and so do its transactions, which no block covers any more
+    assert ledger.height == height - 1
+    assert len(ledger) == previous.end
+    ledger.close()
+    assert audit(directory, full=True, workers=1).ok
+
+
+def test_ledger_longer_than_checkpoint(tmp_path):
+    directory, path = str(tmp_path / "ledger"), str(tmp_path / "city.ckpt")
+    sim = run(directory, 100)
+    checkpoint.write(path, checkpoint.capture(sim))
+    height, closed = sim.token.height, sim.token.tx_count - len(sim.token.open_block)
+
+    # The engine goes on past the checkpoint, audits, and dies before the next one
+    sim.run_batch(100)
+    sim.token.sync()
+    assert sim.token.archive.height > height
+    assert audit(directory, full=True, workers=1, every=2).ok
+    assert read_heads(directory)[-1].height > height
+    sim.token.archive.close()
+
+    # Restoring drops the blocks, transactions and trusted heads written after the checkpoint
+    restored = load_or_create(path, directory)
+    archive = restored.token.archive
+    assert archive.height == restored.token.height == height
+    assert len(archive) == closed
+    assert all(h.height <= height for h in read_heads(directory))
+    assert audit(directory, workers=1).ok
+
+    # ... and the restored city records the same history again
+    restored.run_batch(100)
+    restored.token.sync()
+    assert archive.height == sim.token.height
+    assert len(archive) == len(sim.token.archive)
+    assert archive.block(archive.height - 1).digest() == sim.token.archive.block(archive.height - 1).digest()
+    report = audit(directory, full=True, workers=1)
+    assert report.ok, report.error
+    assert (report.height, report.transactions) == (archive.height, len(archive))
+
+
+def test_ledger_shorter_than_checkpoint_is_refused(tmp_path):
+    directory, path = str(tmp_path / "ledger"), str(tmp_path / "city.ckpt")
+    sim = run(directory, 100)
+    checkpoint.write(path, checkpoint.capture(sim))
+    sim.token.archive.truncate(0, 0)
+    sim.token.archive.close()
+    with pytest.raises(ValueError, match="blocks, the checkpoint"):
+        load_or_create(path, directory)
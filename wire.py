@@ -0,0 +1,75 @@
+"""Wire — Optional msgpack encoding with a columnar citizen table.
+
+JSON stays the default. Clients opt in per connection (`/ws?format=msgpack`)
+or per request (`Accept: application/msgpack`); without the msgpack package
+everything falls back to JSON.
+
+In msgpack payloads a citizen list is sent as one table instead of a list
+of maps, so key names are not repeated for every citizen:
+
+    {"$table": {"n": 2,
+                "columns": {"id": [...], "mood": [...], "action": [...], ...},
+                "f32": {"x": <bytes>, "y": <bytes>, "targetX": <bytes>, "targetY": <bytes>}}}
+
+`f32` columns are little-endian float32 arrays (a Float32Array on the
+client); every other field is a plain array with one value per citizen.
+"""
+
+import sys
+from array import array
+from typing import List
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+from protocol import PROTOCOL_VERSION
+
+MSGPACK = "application/msgpack"
+_MSGPACK_TYPES = (MSGPACK, "application/x-msgpack")
+
+# Coordinates are rounded to 0.1 already, so float32 loses nothing visible
+F32_FIELDS = ("x", "y", "targetX", "targetY")
+
+
+def available() -> bool:
+    return msgpack is not None
+
+
+def accepts_msgpack(accept: str) -> bool:
+    """Whether an Accept header asks for msgpack (and we can produce it)."""
+    return msgpack is not None and any(t in accept for t in _MSGPACK_TYPES)
+
+
+def table(rows: List[dict]) -> dict:
+    """Columnar form of a list of same-shaped dicts."""
+    keys = list(rows[0]) if rows else []
+    columns = {k: [r.get(k) for r in rows] for k in keys if k not in F32_FIELDS}
+    f32 = {}
+    for k in F32_FIELDS:
+        if k in keys:
+            col = array("f", [r[k] for r in rows])
+            if sys.byteorder == "big":
+                col.byteswap()
+            f32[k] = col.tobytes()
+    return {"$table": {"n": len(rows), "columns": columns, "f32": f32}}
+
+
+def pack(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def pack_state(state: dict) -> bytes:
+    """A get_state() snapshot with its citizen list as a table."""
+    if "citizens" in state:
+        state = dict(state, citizens=table(state["citizens"]))
+    return pack(state)
+
+
+def pack_keyframe(seq: int, state_bytes: bytes) -> bytes:
+    """Protocol 2 keyframe around an already-packed state (no re-encoding)."""
+    head = msgpack.Packer(use_bin_type=True)
+    return (head.pack_map_header(4) + head.pack("v") + head.pack(PROTOCOL_VERSION)
+            + head.pack("type") + head.pack("keyframe") + head.pack("seq") + head.pack(seq)
+            + head.pack("state") + state_bytes)
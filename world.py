@@ -79,7 +79,7 @@ class WorldTime:
     _weather: str = "晴れ"
     _weather_change_tick: int = 0
 
-    def maybe_change_weather(self):
-        if self.tick - self._weather_change_tick > random.randint(30, 100):
-            self._weather = random.choice(WEATHER_BY_SEASON[self.season])
+    def maybe_change_weather(self, rng: random.Random = random):
+        if self.tick - self._weather_change_tick > rng.randint(30, 100):
+            self._weather = rng.choice(WEATHER_BY_SEASON[self.season])
             self._weather_change_tick = self.tick